@@ -1,72 +1,48 @@
 from typing import Optional
-from collections import defaultdict
-import time
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 
-from ..core.database import get_db
-from ..core.security import verify_password, get_password_hash, create_access_token
-from ..core.deps import get_current_active_user, require_ops, get_optional_current_user
+from ..core.database import get_async_db
+from ..core.security import verify_password_async, get_password_hash_async, create_access_token
+from ..core.executors import ExecutorSaturated, ldap_executor
+from ..core.deps import get_current_active_user, require_admin, require_ops, get_optional_current_user
+from ..core.principals import Principal
 from ..core.config import settings
-from ..core.ldap import ldap_authenticate
+from ..core.ldap import LdapUnavailable, ldap_authenticate
+from ..core.rate_limit import client_ip, rate_limiter, too_many_requests
+from ..core.runtime_config import config_service
 from ..models.user import User, UserRole
 from ..schemas.user import UserCreate, UserLogin, UserResponse, Token
 
 router = APIRouter(prefix="/auth", tags=["认证"])
 
-# 简单的内存速率限制器
-_login_attempts: dict[str, list[float]] = defaultdict(list)
-
-
-def _get_rate_limit_config(db: Session) -> tuple[int, int]:
-    """从数据库读取速率限制配置，返回 (最大尝试次数, 时间窗口秒数)"""
-    from ..models.config import Config
-    max_cfg = db.query(Config).filter(Config.key == "login_rate_limit_max").first()
-    window_cfg = db.query(Config).filter(Config.key == "login_rate_limit_window").first()
-    max_attempts = int(max_cfg.value) if max_cfg else 5
-    window = int(window_cfg.value) if window_cfg else 300
-    return max_attempts, window
-
-
-def _check_rate_limit(client_ip: str, db: Session):
-    now = time.time()
-    max_attempts, window = _get_rate_limit_config(db)
-    attempts = _login_attempts[client_ip]
-    _login_attempts[client_ip] = [t for t in attempts if now - t < window]
-    if len(_login_attempts[client_ip]) >= max_attempts:
-        raise HTTPException(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail=f"登录尝试过多，请 {window // 60} 分钟后再试"
-        )
-    _login_attempts[client_ip].append(now)
-
-
-def _is_registration_allowed(db: Session) -> bool:
-    """检查是否允许开放注册：优先读数据库配置，否则用环境变量"""
-    from ..models.config import Config
-    db_config = db.query(Config).filter(Config.key == "allow_registration").first()
-    if db_config:
-        return db_config.value.lower() == "true"
-    return settings.ALLOW_REGISTRATION
+async def _check_rate_limit(client_ip: str, db: AsyncSession):
+    """按客户端 IP 限制登录尝试次数（所有 worker 共用计数，见 core/rate_limit.py）"""
+    config = await config_service.get_async(db)
+    max_attempts, window = config.login_rate_limit_max, config.login_rate_limit_window
+    result = await rate_limiter.hit(f"login:ip:{client_ip}", max_attempts, window)
+    if not result.allowed:
+        raise too_many_requests(result, f"登录尝试过多，请 {max(1, window // 60)} 分钟后再试")
 
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def register(
     user_data: UserCreate,
-    current_user: Optional[User] = Depends(get_optional_current_user),
-    db: Session = Depends(get_db)
+    current_user: Optional[Principal] = Depends(get_optional_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """用户注册（allow_registration=True 时开放注册，否则需要 OPS/ADMIN 权限）"""
-    if not _is_registration_allowed(db):
+    if not (await config_service.get_async(db)).allow_registration:
         if not current_user or current_user.role.value not in ("admin", "ops"):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="注册功能已关闭，请联系管理员创建账号"
             )
     # 检查用户名是否存在
-    existing_user = db.query(User).filter(User.username == user_data.username).first()
+    existing_user = await db.scalar(select(User).where(User.username == user_data.username))
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -75,7 +51,7 @@ async def register(
 
     # 检查邮箱是否存在
     if user_data.email:
-        existing_email = db.query(User).filter(User.email == user_data.email).first()
+        existing_email = await db.scalar(select(User).where(User.email == user_data.email))
         if existing_email:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -83,7 +59,8 @@ async def register(
             )
 
     # 创建新用户
-    hashed_password = get_password_hash(user_data.password)
+    await db.commit()  # 归还数据库连接后再计算哈希
+    hashed_password = await get_password_hash_async(user_data.password)
     new_user = User(
         username=user_data.username,
         hashed_password=hashed_password,
@@ -91,8 +68,8 @@ async def register(
         role=UserRole.USER
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
 
     return new_user
 
@@ -101,20 +78,31 @@ async def register(
 async def login(
     request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """用户登录"""
-    _check_rate_limit(request.client.host if request.client else "unknown", db)
-    user = db.query(User).filter(User.username == form_data.username).first()
+    await _check_rate_limit(client_ip(request), db)
+    user = await db.scalar(select(User).where(User.username == form_data.username))
+    is_local = user is not None and getattr(user, 'auth_source', 'local') == 'local'
+    hashed_password = user.hashed_password if is_local else None
+    # 结束只读事务、归还数据库连接，再等待 bcrypt / LDAP；否则并发登录会占满连接池
+    await db.commit()
 
     authenticated = False
-    if user and getattr(user, 'auth_source', 'local') == 'local':
+    if is_local:
         # 本地账号走本地密码验证
-        if verify_password(form_data.password, user.hashed_password):
+        if await verify_password_async(form_data.password, hashed_password):
             authenticated = True
     else:
         # LDAP 用户或本地无此用户，尝试 LDAP 认证
-        ldap_user = ldap_authenticate(form_data.username, form_data.password, db)
+        try:
+            ldap_user = await ldap_authenticate(form_data.username, form_data.password, db)
+        except LdapUnavailable:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="目录服务暂不可用，请稍后重试",
+                headers={"Retry-After": str(int(settings.LDAP_BREAKER_COOLDOWN))},
+            )
         if ldap_user:
             user = ldap_user
             authenticated = True
@@ -132,53 +120,67 @@ async def login(
             detail="账户已被禁用"
         )
 
-    # 更新最后登录时间
-    user.last_login = datetime.utcnow()
-    db.commit()
-
     # 创建 Token（包含 token_version 用于失效校验）
     access_token = create_access_token(
         data={"sub": user.username, "user_id": user.id, "role": user.role.value, "tv": user.token_version}
     )
+    # 提交前取出响应字段：提交后不再访问 ORM 对象，连接随提交归还，不会在发送响应期间占用
+    user_info = UserResponse.model_validate(user)
+
+    # 更新最后登录时间
+    user.last_login = datetime.utcnow()
+    await db.commit()
 
     return {
         "access_token": access_token,
         "token_type": "bearer",
-        "user": user
+        "user": user_info
     }
 
 
 @router.get("/me", response_model=UserResponse)
-async def get_current_user_info(current_user: User = Depends(get_current_active_user)):
+async def get_current_user_info(current_user: Principal = Depends(get_current_active_user)):
     """获取当前用户信息"""
     return current_user
 
 
 @router.get("/ldap/test")
 async def test_ldap_connection(
-    current_user: User = Depends(require_ops),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_ops),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """测试 LDAP 连接"""
-    from ..core.ldap import _get_ldap_config
-    from ldap3 import Server, Connection, ALL
-
-    config = _get_ldap_config(db)
-    server_url = config.get("ldap_server_url", "").strip()
-    bind_dn = config.get("ldap_bind_dn", "").strip()
-    bind_password = config.get("ldap_bind_password", "").strip()
+    from ..core.ldap import ldap_test_connection
 
-    if not server_url:
+    config = (await config_service.get_async(db)).ldap
+    if not config.server_url:
         raise HTTPException(status_code=400, detail="未配置 LDAP 服务器地址")
 
     try:
-        server = Server(server_url, get_info=ALL, connect_timeout=10)
-        if bind_dn and bind_password:
-            conn = Connection(server, user=bind_dn, password=bind_password, auto_bind=True, receive_timeout=10)
-        else:
-            conn = Connection(server, auto_bind=True, receive_timeout=10)
-        info = server.info
-        conn.unbind()
-        return {"success": True, "message": f"已连接到 {info.other.get('serverName', [server_url])[0] if info and info.other else server_url}"}
+        server_name = await ldap_executor.run(ldap_test_connection, config)
+        return {"success": True, "message": f"已连接到 {server_name}"}
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"连接失败: {str(e)}")
+
+
+@router.post("/ldap/sync", status_code=status.HTTP_202_ACCEPTED)
+async def start_ldap_sync(
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """立即同步 LDAP 目录用户（后台运行，结果见 GET /ldap/sync）"""
+    from ..services.ldap_sync import ldap_sync_job
+
+    if not (await config_service.get_async(db)).ldap.enabled:
+        raise HTTPException(status_code=400, detail="未启用 LDAP 认证")
+    started = ldap_sync_job.trigger()
+    return {"started": started, "message": "同步已开始" if started else "已有同步正在运行"}
+
+
+@router.get("/ldap/sync")
+async def get_ldap_sync_status(current_user: Principal = Depends(require_ops)):
+    """查看 LDAP 用户同步状态与最近一次结果"""
+    from ..services.ldap_sync import ldap_sync_job
+    return ldap_sync_job.stats()
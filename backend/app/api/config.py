@@ -1,12 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 
-from ..core.database import get_db
+from ..core.database import get_async_db
 from ..core.deps import require_ops
-from ..models.user import User
+from ..core.principals import Principal
 from ..models.config import Config
 from ..schemas.config import ConfigCreate, ConfigUpdate, ConfigResponse
+from ..core.invalidation import invalidation_bus
+from ..services.catalog import mark_catalog_changed
 
 router = APIRouter(prefix="/configs", tags=["配置管理"])
 
@@ -14,12 +17,12 @@ router = APIRouter(prefix="/configs", tags=["配置管理"])
 @router.post("", response_model=ConfigResponse, status_code=status.HTTP_201_CREATED)
 async def create_config(
     config_data: ConfigCreate,
-    current_user: User = Depends(require_ops),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_ops),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """创建配置"""
     # 检查配置键是否存在
-    existing = db.query(Config).filter(Config.key == config_data.key).first()
+    existing = await db.scalar(select(Config).where(Config.key == config_data.key))
     if existing:
         raise HTTPException(status_code=400, detail="配置键已存在")
 
@@ -29,30 +32,32 @@ async def create_config(
         description=config_data.description
     )
     db.add(config)
-    db.commit()
-    db.refresh(config)
+    invalidation_bus.publish(db, "config", [config.key])
+    mark_catalog_changed(db)
+    await db.commit()
+    await db.refresh(config)
 
     return config
 
 
 @router.get("", response_model=List[ConfigResponse])
 async def list_configs(
-    current_user: User = Depends(require_ops),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_ops),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取配置列表"""
-    configs = db.query(Config).all()
+    configs = (await db.scalars(select(Config))).all()
     return configs
 
 
 @router.get("/{config_key}", response_model=ConfigResponse)
 async def get_config(
     config_key: str,
-    current_user: User = Depends(require_ops),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_ops),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取配置"""
-    config = db.query(Config).filter(Config.key == config_key).first()
+    config = await db.scalar(select(Config).where(Config.key == config_key))
     if not config:
         raise HTTPException(status_code=404, detail="配置不存在")
 
@@ -63,11 +68,11 @@ async def get_config(
 async def update_config(
     config_key: str,
     config_data: ConfigUpdate,
-    current_user: User = Depends(require_ops),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_ops),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """更新配置"""
-    config = db.query(Config).filter(Config.key == config_key).first()
+    config = await db.scalar(select(Config).where(Config.key == config_key))
     if not config:
         raise HTTPException(status_code=404, detail="配置不存在")
 
@@ -75,8 +80,10 @@ async def update_config(
     if config_data.description is not None:
         config.description = config_data.description
 
-    db.commit()
-    db.refresh(config)
+    invalidation_bus.publish(db, "config", [config.key])
+    mark_catalog_changed(db)
+    await db.commit()
+    await db.refresh(config)
 
     return config
 
@@ -84,15 +91,17 @@ async def update_config(
 @router.delete("/{config_key}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_config(
     config_key: str,
-    current_user: User = Depends(require_ops),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_ops),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """删除配置"""
-    config = db.query(Config).filter(Config.key == config_key).first()
+    config = await db.scalar(select(Config).where(Config.key == config_key))
     if not config:
         raise HTTPException(status_code=404, detail="配置不存在")
 
-    db.delete(config)
-    db.commit()
+    await db.delete(config)
+    invalidation_bus.publish(db, "config", [config.key])
+    mark_catalog_changed(db)
+    await db.commit()
 
     return None
\ No newline at end of file
@@ -1,100 +1,92 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
 from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
-from typing import List, Optional, Generic, TypeVar
+from sqlalchemy import desc, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
 import os
-from pydantic import BaseModel
 
-from ..core.database import get_db
+from ..core.database import AsyncSessionLocal, get_async_db
 from ..core.deps import get_current_active_user
+from ..core.principals import Principal
+from ..core.pagination import PageParams, page_params, paginate
+from ..core.config import settings
+from ..core.rate_limit import rate_limit
 from ..models.user import User
 from ..models.download import DownloadLog
-from ..models.software import SoftwareVersion
+from ..models.software import Software, SoftwareVersion
+from ..services.catalog import record_download
 from ..schemas.download import DownloadLogResponse, DownloadStatsResponse
+from ..schemas.request import PaginatedResponse
 
 router = APIRouter(prefix="/downloads", tags=["下载管理"])
 
-T = TypeVar('T')
-
-
-class PaginatedResponse(BaseModel, Generic[T]):
-    """通用分页响应模型"""
-    total: int
-    items: List[T]
-
-
 # 具体路由必须在通配符路由之前定义
 @router.get("/logs", response_model=PaginatedResponse[DownloadLogResponse])
 async def get_download_logs(
-    skip: int = 0,
-    limit: int = 50,
+    page: PageParams = Depends(page_params(default_limit=50, max_limit=1000)),
     version_id: Optional[int] = Query(None),
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取下载日志"""
     # 普通用户只能看到自己的下载记录
-    query = db.query(DownloadLog)
+    query = select(DownloadLog)
     if current_user.role.value == "user":
-        query = query.filter(DownloadLog.user_id == current_user.id)
+        query = query.where(DownloadLog.user_id == current_user.id)
 
     # 按版本筛选
     if version_id:
-        query = query.filter(DownloadLog.software_version_id == version_id)
+        query = query.where(DownloadLog.software_version_id == version_id)
 
-    # 获取总数
-    total = query.count()
+    page_data = await paginate(db, query, page, key="download_logs", order_by=[DownloadLog.download_time, DownloadLog.id])
 
-    logs = query.order_by(DownloadLog.download_time.desc())\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
+    # 本页涉及的用户名、软件名与版本号各一次查询，不再逐行查询
+    usernames = dict((await db.execute(
+        select(User.id, User.username).where(User.id.in_({log.user_id for log in page_data.items}))
+    )).all())
+    versions = {row.id: row for row in (await db.execute(
+        select(SoftwareVersion.id, SoftwareVersion.version, Software.name)
+        .join(Software, Software.id == SoftwareVersion.software_id)
+        .where(SoftwareVersion.id.in_({log.software_version_id for log in page_data.items}))
+    )).all()}
 
     result = []
-    for log in logs:
-        user = db.query(User).filter(User.id == log.user_id).first()
-        version = db.query(SoftwareVersion).filter(SoftwareVersion.id == log.software_version_id).first()
-        from ..models.software import Software
-        software = db.query(Software).filter(Software.id == version.software_id).first() if version else None
-
+    for log in page_data.items:
+        version = versions.get(log.software_version_id)
         result.append(DownloadLogResponse(
             id=log.id,
             user_id=log.user_id,
-            username=user.username if user else "",
-            software_name=software.name if software else "",
+            username=usernames.get(log.user_id, ""),
+            software_name=version.name if version else "",
             version=version.version if version else "",
             download_time=log.download_time,
             ip_address=log.ip_address
         ))
 
-    return PaginatedResponse(total=total, items=result)
+    return PaginatedResponse(total=page_data.total, items=result, next_cursor=page_data.next_cursor)
 
 
 @router.get("/stats", response_model=DownloadStatsResponse)
 async def get_download_stats(
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取下载统计"""
-    from ..models.software import Software
-    from sqlalchemy import func, desc
-
     # 总下载次数
-    total_downloads = db.query(DownloadLog).count()
+    total_downloads = await db.scalar(select(func.count(DownloadLog.id)))
 
     # 唯一用户数
-    unique_users = db.query(DownloadLog.user_id).distinct().count()
+    unique_users = await db.scalar(select(func.count(DownloadLog.user_id.distinct())))
 
     # 热门软件 TOP 10
-    top_software = db.query(
-        Software.name,
-        func.count(DownloadLog.id).label("count")
-    ).join(SoftwareVersion, Software.id == SoftwareVersion.software_id)\
-     .join(DownloadLog, DownloadLog.software_version_id == SoftwareVersion.id)\
-     .group_by(Software.name)\
-     .order_by(desc("count"))\
-     .limit(10)\
-     .all()
+    top_software = (await db.execute(
+        select(Software.name, func.count(DownloadLog.id).label("count"))
+        .join(SoftwareVersion, Software.id == SoftwareVersion.software_id)
+        .join(DownloadLog, DownloadLog.software_version_id == SoftwareVersion.id)
+        .group_by(Software.name)
+        .order_by(desc("count"))
+        .limit(10)
+    )).all()
 
     return DownloadStatsResponse(
         total_downloads=total_downloads,
@@ -103,36 +95,43 @@ async def get_download_stats(
     )
 
 
-@router.get("/{version_id}")
+@router.get("/{version_id}", dependencies=[
+    Depends(rate_limit("download", settings.DOWNLOAD_RATE_LIMIT, settings.DOWNLOAD_RATE_WINDOW, per_user=True))
+])
 async def download_software(
     version_id: int,
     request: Request,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user)
 ):
-    """下载软件文件"""
-    version = db.query(SoftwareVersion).filter(SoftwareVersion.id == version_id).first()
-    if not version:
-        raise HTTPException(status_code=404, detail="版本不存在")
-
-    file_path = version.file_path
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="文件不存在")
-
-    # 记录下载日志
-    download_log = DownloadLog(
-        user_id=current_user.id,
-        software_version_id=version_id,
-        ip_address=request.client.host
-    )
-    db.add(download_log)
-
-    # 更新下载计数
-    version.download_count += 1
-    db.commit()
+    """下载软件文件
+
+    请求级会话要到响应发送完才关闭，大文件传输期间会一直占着连接；
+    这里只在短会话中完成查询与计数，传输文件时不持有数据库连接。
+    """
+    async with AsyncSessionLocal() as db:
+        version = await db.scalar(select(SoftwareVersion).where(SoftwareVersion.id == version_id))
+        if not version:
+            raise HTTPException(status_code=404, detail="版本不存在")
+
+        file_path = version.file_path
+        file_name = version.file_name
+        if not os.path.exists(file_path):
+            raise HTTPException(status_code=404, detail="文件不存在")
+
+        # 记录下载日志
+        download_log = DownloadLog(
+            user_id=current_user.id,
+            software_version_id=version_id,
+            ip_address=request.client.host
+        )
+        db.add(download_log)
+
+        # 更新下载计数（版本与软件汇总同一事务）
+        await db.run_sync(record_download, version)
+        await db.commit()
 
     return FileResponse(
         path=file_path,
-        filename=version.file_name,
+        filename=file_name,
         media_type="application/octet-stream"
     )
\ No newline at end of file
@@ -1,20 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, BackgroundTasks
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 import os
 import aiofiles
 import hashlib
 from pathlib import Path
 
-from ..core.database import get_db
+from ..core.database import AsyncSessionLocal, get_async_db
 from ..core.deps import get_current_active_user, require_ops
+from ..core.principals import Principal
+from ..core.pagination import PageParams, page_params, paginate
+from ..core.rate_limit import rate_limit
 from ..core.config import settings
-from ..core.validators import validate_download_url, sanitize_filename, validate_path_within_dir, safe_httpx_client
+from ..core.validators import validate_download_url_async, sanitize_filename, validate_path_within_dir
+from ..core.http_clients import http_clients
+from ..core.runtime_config import config_service
 from ..models.user import User
 from ..models.request import SoftwareRequest, RequestStatus
 from ..models.software import Software, SoftwareVersion
 from ..schemas.request import SoftwareRequestCreate, SoftwareRequestResponse, SoftwareRequestReview, PaginatedResponse
-from ..services.ai_service import AIService
+from ..services.catalog import refresh_software_summary, mark_software_changed, get_or_create_category
+from ..services.review_worker import review_worker
 
 router = APIRouter(prefix="/requests", tags=["软件申请"])
 
@@ -23,12 +30,11 @@ async def download_software_from_url(url: str, software_id: int, version: str, u
     """后台任务：从 URL 下载软件"""
     try:
         # Validate URL to prevent SSRF
-        validate_download_url(url)
+        await validate_download_url_async(url)
 
-        async with safe_httpx_client(timeout=300.0) as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            content = response.content
+        response = await http_clients.get("outbound").get(url, timeout=300.0)
+        response.raise_for_status()
+        content = response.content
 
         # 从 URL 提取文件名并净化
         raw_name = Path(url).name or f"software_{software_id}"
@@ -53,9 +59,7 @@ async def download_software_from_url(url: str, software_id: int, version: str, u
             await f.write(content)
 
         # 获取数据库会话
-        from ..core.database import SessionLocal
-        db = SessionLocal()
-        try:
+        async with AsyncSessionLocal() as db:
             # 创建版本记录
             software_version = SoftwareVersion(
                 software_id=software_id,
@@ -67,21 +71,21 @@ async def download_software_from_url(url: str, software_id: int, version: str, u
                 uploader_id=uploader_id
             )
             db.add(software_version)
-            db.commit()
-        finally:
-            db.close()
+            await db.run_sync(refresh_software_summary, software_id)
+            await db.commit()
 
     except Exception as e:
         # 记录错误日志
         print(f"下载软件失败: {e}")
 
 
-@router.post("", response_model=SoftwareRequestResponse, status_code=status.HTTP_201_CREATED)
+@router.post("", response_model=SoftwareRequestResponse, status_code=status.HTTP_201_CREATED, dependencies=[
+    Depends(rate_limit("software_request", settings.REQUEST_RATE_LIMIT, settings.REQUEST_RATE_WINDOW, per_user=True))
+])
 async def create_request(
     request_data: SoftwareRequestCreate,
-    background_tasks: BackgroundTasks,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """创建软件申请"""
     software_request = SoftwareRequest(
@@ -95,13 +99,12 @@ async def create_request(
         applicant_id=current_user.id
     )
     db.add(software_request)
-    db.commit()
-    db.refresh(software_request)
+    await db.commit()
+    await db.refresh(software_request)
 
-    # 启动AI自动审核（如果启用）
-    ai_service = AIService(db)
-    if ai_service.auto_review_enabled:
-        background_tasks.add_task(auto_review_request, software_request.id, db)
+    # 启动AI自动审核（如果启用），由审核队列攒批处理
+    if (await config_service.get_async(db)).ai.auto_review_enabled:
+        review_worker.submit(software_request.id)
 
     return SoftwareRequestResponse(
         id=software_request.id,
@@ -119,226 +122,31 @@ async def create_request(
     )
 
 
-async def auto_review_request(request_id: int, db_session: Session):
-    """自动审核请求的后台任务"""
-    from sqlalchemy import create_engine
-    from sqlalchemy.orm import sessionmaker
-    from ..core.config import settings as app_settings
-    
-    # 创建新的数据库会话用于后台任务
-    engine = create_engine(app_settings.DATABASE_URL)
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    db = SessionLocal()
-    
-    try:
-        # 获取申请记录
-        software_request = db.query(SoftwareRequest).filter(SoftwareRequest.id == request_id).first()
-        if not software_request:
-            return
-
-        # 使用AI服务审核申请
-        ai_service = AIService(db)
-        request_data = {
-            "software_name": software_request.software_name,
-            "version": software_request.version,
-            "download_url": software_request.download_url,
-            "category": software_request.category,
-            "description": software_request.description
-        }
-        
-        review_result = await ai_service.review_software_request(request_data)
-        
-        if review_result.get("approved", False):
-            # AI审核通过，自动批准申请
-            from datetime import datetime
-            from ..models.request import RequestStatus
-            
-            software_request.status = RequestStatus.APPROVED
-            software_request.review_comment = f"AI自动审核通过: {review_result.get('reason', '自动批准')}"
-            software_request.reviewer_id = 1  # 系统账户ID
-            software_request.reviewed_at = datetime.utcnow()
-            
-            # 检查软件是否已存在
-            existing_software = db.query(Software).filter(Software.name == software_request.software_name).first()
-
-            if existing_software:
-                # 软件已存在，使用现有软件
-                software_request.software_id = existing_software.id
-                db.commit()
-
-                # 后台下载文件
-                from ..core.config import settings
-                import httpx
-                import os
-                import aiofiles
-                import hashlib
-                from pathlib import Path
-                
-                async def download_task():
-                    try:
-                        from ..core.validators import validate_download_url, sanitize_filename, validate_path_within_dir, safe_httpx_client
-                        validate_download_url(software_request.download_url)
-
-                        async with safe_httpx_client(timeout=300.0) as client:
-                            response = await client.get(software_request.download_url)
-                            response.raise_for_status()
-                            content = response.content
-
-                        # 从 URL 提取文件名并净化
-                        raw_name = Path(software_request.download_url).name or f"software_{existing_software.id}"
-                        filename = sanitize_filename(raw_name)
-                        if '.' not in filename:
-                            filename += ".exe"
-
-                        # 计算文件哈希
-                        sha256_hash = hashlib.sha256()
-                        sha256_hash.update(content)
-                        file_hash = sha256_hash.hexdigest()
-
-                        # 保存文件
-                        software_dir = os.path.join(settings.STORAGE_PATH, str(existing_software.id))
-                        os.makedirs(software_dir, exist_ok=True)
-                        file_path = os.path.join(software_dir, filename)
-                        validate_path_within_dir(file_path, settings.STORAGE_PATH)
-
-                        async with aiofiles.open(file_path, "wb") as f:
-                            await f.write(content)
-
-                        # 创建版本记录
-                        software_version = SoftwareVersion(
-                            software_id=existing_software.id,
-                            version=software_request.version,
-                            file_path=file_path,
-                            file_name=filename,
-                            file_size=len(content),
-                            file_hash=file_hash,
-                            uploader_id=1  # 系统账户ID
-                        )
-                        db.add(software_version)
-                        db.commit()
-                    except Exception as e:
-                        print(f"AI自动下载软件失败: {e}")
-                
-                import asyncio
-                await download_task()
-            else:
-                # 创建新软件
-                software = Software(
-                    name=software_request.software_name,
-                    description=software_request.description,
-                    category=software_request.category,
-                    logo=software_request.logo,
-                    official_url=software_request.official_url,
-                    created_by=1  # 系统账户ID
-                )
-                db.add(software)
-                db.flush()
-
-                software_request.software_id = software.id
-                db.commit()
-
-                # 后台下载文件
-                from ..core.config import settings
-                import httpx
-                import os
-                import aiofiles
-                import hashlib
-                from pathlib import Path
-                
-                async def download_task():
-                    try:
-                        from ..core.validators import validate_download_url, sanitize_filename, validate_path_within_dir, safe_httpx_client
-                        validate_download_url(software_request.download_url)
-
-                        async with safe_httpx_client(timeout=300.0) as client:
-                            response = await client.get(software_request.download_url)
-                            response.raise_for_status()
-                            content = response.content
-
-                        # 从 URL 提取文件名并净化
-                        raw_name = Path(software_request.download_url).name or f"software_{software.id}"
-                        filename = sanitize_filename(raw_name)
-                        if '.' not in filename:
-                            filename += ".exe"
-
-                        # 计算文件哈希
-                        sha256_hash = hashlib.sha256()
-                        sha256_hash.update(content)
-                        file_hash = sha256_hash.hexdigest()
-
-                        # 保存文件
-                        software_dir = os.path.join(settings.STORAGE_PATH, str(software.id))
-                        os.makedirs(software_dir, exist_ok=True)
-                        file_path = os.path.join(software_dir, filename)
-                        validate_path_within_dir(file_path, settings.STORAGE_PATH)
-
-                        async with aiofiles.open(file_path, "wb") as f:
-                            await f.write(content)
-
-                        # 创建版本记录
-                        software_version = SoftwareVersion(
-                            software_id=software.id,
-                            version=software_request.version,
-                            file_path=file_path,
-                            file_name=filename,
-                            file_size=len(content),
-                            file_hash=file_hash,
-                            uploader_id=1  # 系统账户ID
-                        )
-                        db.add(software_version)
-                        db.commit()
-                    except Exception as e:
-                        print(f"AI自动下载软件失败: {e}")
-                
-                import asyncio
-                await download_task()
-        else:
-            # AI审核未通过，但仍然保持PENDING状态，以便人工审核
-            # 只是添加AI的审核意见到评论中
-            from datetime import datetime
-            from ..models.request import RequestStatus
-            
-            # 保留原始状态为PENDING，只更新评论和审核人
-            software_request.review_comment = f"AI自动审核建议拒绝: {review_result.get('reason', '自动拒绝原因未知')}\n{software_request.review_comment or ''}".strip()
-            software_request.reviewer_id = 1  # 系统账户ID
-            # 不改变状态，保持为PENDING，这样人工仍可以审核
-            db.commit()
-            
-    finally:
-        db.close()
-
-
 @router.get("", response_model=PaginatedResponse[SoftwareRequestResponse])
 async def list_requests(
-    skip: int = Query(0, ge=0),
-    limit: int = Query(20, ge=1, le=100),
+    page: PageParams = Depends(page_params(default_limit=20, max_limit=100)),
     status: RequestStatus = None,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取申请列表"""
-    query = db.query(SoftwareRequest)
+    query = select(SoftwareRequest)
 
     # 普通用户只能看到自己的申请
     if current_user.role.value == "user":
-        query = query.filter(SoftwareRequest.applicant_id == current_user.id)
+        query = query.where(SoftwareRequest.applicant_id == current_user.id)
 
     if status:
-        query = query.filter(SoftwareRequest.status == status)
+        query = query.where(SoftwareRequest.status == status)
 
-    # 获取总数（在应用过滤条件后）
-    total = query.count()
+    page_data = await paginate(db, query, page, key="requests", order_by=[SoftwareRequest.created_at, SoftwareRequest.id])
 
-    # 获取分页数据
-    requests = query.order_by(SoftwareRequest.created_at.desc())\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
+    # 本页涉及的申请人与审核人一次查询
+    user_ids = {req.applicant_id for req in page_data.items} | {req.reviewer_id for req in page_data.items if req.reviewer_id}
+    usernames = dict((await db.execute(select(User.id, User.username).where(User.id.in_(user_ids)))).all())
 
     result = []
-    for req in requests:
-        applicant = db.query(User).filter(User.id == req.applicant_id).first()
-        reviewer = db.query(User).filter(User.id == req.reviewer_id).first() if req.reviewer_id else None
+    for req in page_data.items:
 
         result.append(SoftwareRequestResponse(
             id=req.id,
@@ -351,15 +159,15 @@ async def list_requests(
             official_url=req.official_url,
             status=req.status,
             applicant_id=req.applicant_id,
-            applicant_name=applicant.username if applicant else "",
+            applicant_name=usernames.get(req.applicant_id, ""),
             reviewer_id=req.reviewer_id,
-            reviewer_name=reviewer.username if reviewer else None,
+            reviewer_name=usernames.get(req.reviewer_id) if req.reviewer_id else None,
             review_comment=req.review_comment,
             reviewed_at=req.reviewed_at,
             created_at=req.created_at
         ))
 
-    return PaginatedResponse(total=total, items=result)
+    return PaginatedResponse(total=page_data.total, items=result, next_cursor=page_data.next_cursor)
 
 
 @router.post("/{request_id}/review", response_model=SoftwareRequestResponse)
@@ -367,11 +175,11 @@ async def review_request(
     request_id: int,
     review_data: SoftwareRequestReview,
     background_tasks: BackgroundTasks,
-    current_user: User = Depends(require_ops),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_ops),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """审核软件申请"""
-    software_request = db.query(SoftwareRequest).filter(SoftwareRequest.id == request_id).first()
+    software_request = await db.scalar(select(SoftwareRequest).where(SoftwareRequest.id == request_id))
     if not software_request:
         raise HTTPException(status_code=404, detail="申请不存在")
 
@@ -387,12 +195,12 @@ async def review_request(
     # 如果批准，创建软件记录
     if review_data.status == RequestStatus.APPROVED:
         # 检查软件是否已存在
-        existing_software = db.query(Software).filter(Software.name == software_request.software_name).first()
+        existing_software = await db.scalar(select(Software).where(Software.name == software_request.software_name))
 
         if existing_software:
             # 软件已存在，使用现有软件
             software_request.software_id = existing_software.id
-            db.commit()
+            await db.commit()
 
             # 后台下载文件
             background_tasks.add_task(
@@ -407,16 +215,17 @@ async def review_request(
             software = Software(
                 name=software_request.software_name,
                 description=software_request.description,
-                category=software_request.category,
+                category_id=await db.run_sync(get_or_create_category, software_request.category),
                 logo=software_request.logo,
                 official_url=software_request.official_url,
                 created_by=current_user.id
             )
             db.add(software)
-            db.flush()
+            await db.flush()
+            mark_software_changed(db, software.id)
 
             software_request.software_id = software.id
-            db.commit()
+            await db.commit()
 
             # 后台下载文件
             background_tasks.add_task(
@@ -427,10 +236,10 @@ async def review_request(
                 current_user.id
             )
     else:
-        db.commit()
+        await db.commit()
 
     # 返回更新后的申请
-    applicant = db.query(User).filter(User.id == software_request.applicant_id).first()
+    applicant = await db.scalar(select(User).where(User.id == software_request.applicant_id))
     return SoftwareRequestResponse(
         id=software_request.id,
         software_name=software_request.software_name,
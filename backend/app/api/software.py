@@ -1,19 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File, Form
-from sqlalchemy.orm import Session, joinedload
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 import os
 import hashlib
 import aiofiles
 from pathlib import Path
 
-from ..core.database import get_db
-from ..core.deps import get_current_active_user, require_ops
-from ..core.config import settings, get_max_upload_size
+from ..core.database import AsyncSessionLocal, get_async_db
+from ..core.deps import get_current_active_user, require_ops, check_catalog_etag
+from ..core.principals import Principal
+from ..core.config import settings
+from ..core.runtime_config import config_service
+from ..core.pagination import CountMode, PageParams, page_params, paginate, encode_cursor, decode_cursor
 from ..core.validators import sanitize_filename, validate_path_within_dir, ALLOWED_UPLOAD_EXTENSIONS
-from ..models.user import User
+from ..models.category import SoftwareCategory
 from ..models.software import Software, SoftwareVersion
 from ..models.vulnerability import Vulnerability
 from ..models.request import SoftwareRequest
+from ..services.catalog import refresh_software_summary, mark_software_changed, get_or_create_category
+from ..services.exposure import software_badges, version_badges
+from ..services.search import search_software
 from ..schemas.software import (
     SoftwareCreate, SoftwareUpdate, SoftwareResponse,
     SoftwareVersionCreate, SoftwareVersionResponse, SoftwareListResponse, SoftwareListWithTotal, VersionInfo
@@ -21,6 +28,9 @@ from ..schemas.software import (
 
 router = APIRouter(prefix="/software", tags=["软件管理"])
 
+# 列表按最近更新排序；从未修改过的软件按创建时间（与 ix_software_recency 索引的表达式一致）
+SOFTWARE_RECENCY = func.coalesce(Software.updated_at, Software.created_at)
+
 
 def get_file_hash(file_path: str) -> str:
     """计算文件 SHA256 哈希"""
@@ -31,86 +41,111 @@ def get_file_hash(file_path: str) -> str:
     return sha256_hash.hexdigest()
 
 
+def _to_list_item(sw: Software, highlights: Optional[dict] = None, badge: Optional[tuple] = None) -> SoftwareListResponse:
+    vulnerable_versions, max_severity = badge or (0, None)
+    return SoftwareListResponse(
+        id=sw.id,
+        name=sw.name,
+        description=sw.description,
+        category=sw.category,
+        icon_url=sw.icon_url,
+        logo=sw.logo,
+        official_url=sw.official_url,
+        latest_version=sw.latest_version,
+        version_count=sw.version_count or 0,
+        total_downloads=sw.total_downloads or 0,
+        last_release_at=sw.last_release_at,
+        highlights=highlights,
+        vulnerable_versions=vulnerable_versions,
+        max_severity=max_severity
+    )
+
+
 @router.get("", response_model=SoftwareListWithTotal)
 async def list_software(
-    skip: int = Query(0, ge=0),
-    limit: int = Query(20, ge=1, le=1000),
+    page: PageParams = Depends(page_params(default_limit=20, max_limit=1000)),
     category: Optional[str] = None,
     search: Optional[str] = None,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    _etag: str = Depends(check_catalog_etag),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取软件列表"""
-    query = db.query(Software)
+    """获取软件列表（带 search 时按相关度排序并返回高亮）"""
+    if search and search.strip():
+        # 相关度排序无法按索引定位，游标中保存的是偏移量
+        offset = decode_cursor(page.cursor, "software.search").get("o", 0) if page.cursor else page.skip
+        total, hits = await db.run_sync(search_software, search, category=category, offset=offset, limit=page.limit)
+        rows = {sw.id: sw for sw in await db.scalars(select(Software).where(Software.id.in_([h.software_id for h in hits])))}
+        badges = await db.run_sync(software_badges, rows)
+        result = [
+            _to_list_item(rows[h.software_id], highlights=h.highlights, badge=badges.get(h.software_id))
+            for h in hits if h.software_id in rows
+        ]
+        next_offset = offset + len(hits)
+        return SoftwareListWithTotal(
+            total=None if page.count_mode == CountMode.NONE else total,
+            items=result,
+            next_cursor=encode_cursor("software.search", offset=next_offset) if next_offset < total else None
+        )
+
+    query = select(Software)
 
     if category:
-        query = query.filter(Software.category == category)
-    if search:
-        query = query.filter(Software.name.contains(search))
-
-    # 获取总数（在应用过滤条件后）
-    total = query.count()
-
-    # 获取分页数据，按更新时间降序排序
-    software_list = query.order_by(Software.updated_at.desc()).offset(skip).limit(limit).all()
-
-    result = []
-    for sw in software_list:
-        latest_version = db.query(SoftwareVersion)\
-            .filter(SoftwareVersion.software_id == sw.id)\
-            .order_by(SoftwareVersion.upload_time.desc())\
-            .first()
-
-        versions = db.query(SoftwareVersion).filter(SoftwareVersion.software_id == sw.id).all()
-        total_downloads = sum(v.download_count for v in versions)
-
-        result.append(SoftwareListResponse(
-            id=sw.id,
-            name=sw.name,
-            description=sw.description,
-            category=sw.category,
-            icon_url=sw.icon_url,
-            logo=sw.logo,
-            official_url=sw.official_url,
-            latest_version=latest_version.version if latest_version else None,
-            version_count=len(versions),
-            total_downloads=total_downloads
-        ))
-
-    return SoftwareListWithTotal(total=total, items=result)
+        category_id = select(SoftwareCategory.id).where(SoftwareCategory.name == category).scalar_subquery()
+        query = query.where(Software.category_id == category_id)
+
+    # 按更新时间降序分页；版本汇总直接读取软件表上的冗余字段
+    page_data = await paginate(db, query, page, key="software", order_by=[SOFTWARE_RECENCY, Software.id])
+
+    # 漏洞标记读取预先计算的暴露面
+    badges = await db.run_sync(software_badges, [sw.id for sw in page_data.items])
+    result = [_to_list_item(sw, badge=badges.get(sw.id)) for sw in page_data.items]
+
+    return SoftwareListWithTotal(total=page_data.total, items=result, next_cursor=page_data.next_cursor)
 
 
 # Specific routes must be defined before parameterized routes
 @router.get("/categories", response_model=List[str])
-async def get_categories(current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)):
-    """获取软件分类列表"""
-    categories = db.query(Software.category)\
-        .filter(Software.category.isnot(None))\
-        .distinct()\
-        .all()
-    return [c[0] for c in categories if c[0]]
+async def get_categories(
+    current_user: Principal = Depends(get_current_active_user),
+    _etag: str = Depends(check_catalog_etag),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取软件分类列表（有软件的分类）"""
+    categories = await db.scalars(
+        select(SoftwareCategory.name)
+        .where(SoftwareCategory.software_count > 0)
+        .order_by(SoftwareCategory.sort_order.asc(), SoftwareCategory.id.asc())
+    )
+    return categories.all()
 
 
 @router.get("/{software_id}", response_model=SoftwareResponse)
-async def get_software(software_id: int, current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)):
+async def get_software(software_id: int, current_user: Principal = Depends(get_current_active_user), db: AsyncSession = Depends(get_async_db)):
     """获取软件详情"""
-    software = db.query(Software).filter(Software.id == software_id).first()
+    software = await db.scalar(select(Software).where(Software.id == software_id))
     if not software:
         raise HTTPException(status_code=404, detail="软件不存在")
 
     # 获取版本信息，并关联原始下载地址
-    versions = db.query(SoftwareVersion).filter(SoftwareVersion.software_id == software_id).all()
+    versions = (await db.scalars(
+        select(SoftwareVersion)
+        .where(SoftwareVersion.software_id == software_id)
+        .order_by(SoftwareVersion.version_key.desc(), SoftwareVersion.id.desc())
+    )).all()
     
     # 获取该软件相关的申请记录，用于获取原始下载地址
     request_versions = {}
-    requests = db.query(SoftwareRequest).filter(
+    requests = await db.scalars(select(SoftwareRequest).where(
         SoftwareRequest.software_id == software_id
-    ).all()
+    ))
     
     for req in requests:
         # 使用版本号作为键来映射原始下载地址
         request_versions[req.version] = req.download_url
 
+    badges = await db.run_sync(version_badges, [v.id for v in versions])
+
     return SoftwareResponse(
         id=software.id,
         name=software.name,
@@ -130,7 +165,9 @@ async def get_software(software_id: int, current_user: User = Depends(get_curren
             upload_time=v.upload_time,
             download_count=v.download_count,
             release_notes=v.release_notes,
-            original_download_url=request_versions.get(v.version)  # 添加原始下载地址
+            original_download_url=request_versions.get(v.version),  # 添加原始下载地址
+            vulnerability_count=badges.get(v.id, (0, None))[0],
+            max_severity=badges.get(v.id, (0, None))[1]
         ) for v in versions]
     )
 
@@ -138,12 +175,12 @@ async def get_software(software_id: int, current_user: User = Depends(get_curren
 @router.post("", response_model=SoftwareResponse, status_code=status.HTTP_201_CREATED)
 async def create_software(
     software_data: SoftwareCreate,
-    current_user: User = Depends(require_ops),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_ops),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """创建软件"""
     # 检查软件名是否存在
-    existing = db.query(Software).filter(Software.name == software_data.name).first()
+    existing = await db.scalar(select(Software).where(Software.name == software_data.name))
     if existing:
         raise HTTPException(status_code=400, detail="软件名称已存在")
 
@@ -155,15 +192,17 @@ async def create_software(
     software = Software(
         name=software_data.name,
         description=software_data.description,
-        category=software_data.category,
+        category_id=await db.run_sync(get_or_create_category, software_data.category),
         icon_url=icon_url,
         logo=logo,
         official_url=official_url,
         created_by=current_user.id
     )
     db.add(software)
-    db.commit()
-    db.refresh(software)
+    await db.flush()
+    mark_software_changed(db, software.id)
+    await db.commit()
+    await db.refresh(software)
 
     return SoftwareResponse(
         id=software.id,
@@ -183,17 +222,17 @@ async def create_software(
 async def update_software(
     software_id: int,
     software_data: SoftwareUpdate,
-    current_user: User = Depends(require_ops),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_ops),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """更新软件"""
-    software = db.query(Software).filter(Software.id == software_id).first()
+    software = await db.scalar(select(Software).where(Software.id == software_id))
     if not software:
         raise HTTPException(status_code=404, detail="软件不存在")
 
     # 检查软件名是否被其他软件占用
     if software_data.name and software_data.name != software.name:
-        existing = db.query(Software).filter(Software.name == software_data.name).first()
+        existing = await db.scalar(select(Software).where(Software.name == software_data.name))
         if existing:
             raise HTTPException(status_code=400, detail="软件名称已存在")
 
@@ -202,7 +241,7 @@ async def update_software(
     if software_data.description is not None:
         software.description = software_data.description
     if software_data.category is not None:
-        software.category = software_data.category
+        software.category_id = await db.run_sync(get_or_create_category, software_data.category)
     
     # 处理URL字段，将空字符串转换为None
     if software_data.icon_url is not None:
@@ -212,24 +251,28 @@ async def update_software(
     if software_data.official_url is not None:
         software.official_url = str(software_data.official_url) if software_data.official_url else None
 
-    db.commit()
-    db.refresh(software)
+    mark_software_changed(db, software_id)
+    await db.commit()
+    await db.refresh(software)
 
-    versions = db.query(SoftwareVersion)\
-        .filter(SoftwareVersion.software_id == software_id)\
-        .order_by(SoftwareVersion.upload_time.desc())\
-        .all()
+    versions = (await db.scalars(
+        select(SoftwareVersion)
+        .where(SoftwareVersion.software_id == software_id)
+        .order_by(SoftwareVersion.version_key.desc(), SoftwareVersion.id.desc())
+    )).all()
 
     # 获取该软件相关的申请记录，用于获取原始下载地址
     request_versions = {}
-    requests = db.query(SoftwareRequest).filter(
+    requests = await db.scalars(select(SoftwareRequest).where(
         SoftwareRequest.software_id == software_id
-    ).all()
+    ))
     
     for req in requests:
         # 使用版本号作为键来映射原始下载地址
         request_versions[req.version] = req.download_url
 
+    badges = await db.run_sync(version_badges, [v.id for v in versions])
+
     return SoftwareResponse(
         id=software.id,
         name=software.name,
@@ -249,7 +292,9 @@ async def update_software(
             upload_time=v.upload_time,
             download_count=v.download_count,
             release_notes=v.release_notes,
-            original_download_url=request_versions.get(v.version)  # 添加原始下载地址
+            original_download_url=request_versions.get(v.version),  # 添加原始下载地址
+            vulnerability_count=badges.get(v.id, (0, None))[0],
+            max_severity=badges.get(v.id, (0, None))[1]
         ) for v in versions]
     )
 
@@ -257,28 +302,32 @@ async def update_software(
 @router.delete("/{software_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_software(
     software_id: int,
-    current_user: User = Depends(require_ops),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_ops),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """删除软件"""
-    software = db.query(Software).filter(Software.id == software_id).first()
+    software = await db.scalar(select(Software).where(Software.id == software_id))
     if not software:
         raise HTTPException(status_code=404, detail="软件不存在")
 
     # 删除所有版本文件
     from ..models.download import DownloadLog
-    versions = db.query(SoftwareVersion).filter(SoftwareVersion.software_id == software_id).all()
+    versions = (await db.scalars(select(SoftwareVersion).where(SoftwareVersion.software_id == software_id))).all()
     # 先删除关联的下载日志
     if versions:
         version_ids = [v.id for v in versions]
-        db.query(DownloadLog).filter(DownloadLog.software_version_id.in_(version_ids)).delete(synchronize_session='fetch')
+        await db.execute(
+            delete(DownloadLog).where(DownloadLog.software_version_id.in_(version_ids)),
+            execution_options={"synchronize_session": "fetch"}
+        )
     for version in versions:
         if os.path.exists(version.file_path):
             os.remove(version.file_path)
-        db.delete(version)
+        await db.delete(version)
 
-    db.delete(software)
-    db.commit()
+    await db.delete(software)
+    mark_software_changed(db, software_id)
+    await db.commit()
 
     return None
 
@@ -289,12 +338,16 @@ async def upload_version(
     version: str = Form(...),
     file: UploadFile = File(...),
     release_notes: Optional[str] = Form(None),
-    current_user: User = Depends(require_ops),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_ops)
 ):
-    """上传软件版本"""
-    software = db.query(Software).filter(Software.id == software_id).first()
-    if not software:
+    """上传软件版本
+
+    写入文件前后各用一个短会话，保存文件期间不持有数据库连接。
+    """
+    async with AsyncSessionLocal() as db:
+        software_name = await db.scalar(select(Software.name).where(Software.id == software_id))
+        max_size = (await config_service.get_async(db)).max_upload_size
+    if software_name is None:
         raise HTTPException(status_code=404, detail="软件不存在")
 
     # 检查文件扩展名
@@ -320,7 +373,7 @@ async def upload_version(
             if not chunk:
                 break
             file_size += len(chunk)
-            if file_size > get_max_upload_size(db):
+            if file_size > max_size:
                 await f.close()
                 os.remove(file_path)
                 raise HTTPException(status_code=400, detail="文件大小超过限制")
@@ -329,19 +382,21 @@ async def upload_version(
     file_hash = sha256_hash.hexdigest()
 
     # 创建版本记录
-    software_version = SoftwareVersion(
-        software_id=software_id,
-        version=version,
-        file_path=file_path,
-        file_name=safe_filename,
-        file_size=file_size,
-        file_hash=file_hash,
-        uploader_id=current_user.id,
-        release_notes=release_notes
-    )
-    db.add(software_version)
-    db.commit()
-    db.refresh(software_version)
+    async with AsyncSessionLocal() as db:
+        software_version = SoftwareVersion(
+            software_id=software_id,
+            version=version,
+            file_path=file_path,
+            file_name=safe_filename,
+            file_size=file_size,
+            file_hash=file_hash,
+            uploader_id=current_user.id,
+            release_notes=release_notes
+        )
+        db.add(software_version)
+        await db.run_sync(refresh_software_summary, software_id)
+        await db.commit()
+        await db.refresh(software_version)
 
     return SoftwareVersionResponse(
         id=software_version.id,
@@ -353,7 +408,7 @@ async def upload_version(
         upload_time=software_version.upload_time,
         download_count=software_version.download_count,
         release_notes=software_version.release_notes,
-        software_name=software.name
+        software_name=software_name
     )
 
 
@@ -361,11 +416,11 @@ async def upload_version(
 async def upload_logo(
     software_id: int,
     file: UploadFile = File(...),
-    current_user: User = Depends(require_ops),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_ops),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """上传软件Logo"""
-    software = db.query(Software).filter(Software.id == software_id).first()
+    software = await db.scalar(select(Software).where(Software.id == software_id))
     if not software:
         raise HTTPException(status_code=404, detail="软件不存在")
 
@@ -407,7 +462,8 @@ async def upload_logo(
 
     # 更新软件的logo字段
     software.logo = f"/api/software/{software_id}/logo/file/{unique_filename}"
-    db.commit()
+    mark_software_changed(db, software_id)
+    await db.commit()
 
     return {
         "logo": software.logo,
@@ -419,14 +475,14 @@ async def upload_logo(
 async def get_logo_file(
     software_id: int,
     filename: str,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """获取logo文件"""
     from fastapi.responses import FileResponse
 
-    software = db.query(Software).filter(Software.id == software_id).first()
-    if not software:
+    async with AsyncSessionLocal() as db:
+        exists = await db.scalar(select(Software.id).where(Software.id == software_id))
+    if exists is None:
         raise HTTPException(status_code=404, detail="软件不存在")
 
     safe_name = sanitize_filename(filename)
@@ -439,7 +495,7 @@ async def get_logo_file(
 
 
 @router.get("/logos/{filename}")
-async def get_logo_file_direct(filename: str, current_user: User = Depends(get_current_active_user)):
+async def get_logo_file_direct(filename: str, current_user: Principal = Depends(get_current_active_user)):
     """直接获取logo文件（不需要 software_id）"""
     from fastapi.responses import FileResponse
 
@@ -456,27 +512,27 @@ async def get_logo_file_direct(filename: str, current_user: User = Depends(get_c
 async def delete_software_version(
     software_id: int,
     version_id: int,
-    current_user: User = Depends(require_ops),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_ops),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """删除软件版本"""
     # 验证软件是否存在
-    software = db.query(Software).filter(Software.id == software_id).first()
+    software = await db.scalar(select(Software).where(Software.id == software_id))
     if not software:
         raise HTTPException(status_code=404, detail="软件不存在")
 
     # 查找版本
-    version = db.query(SoftwareVersion).filter(
+    version = await db.scalar(select(SoftwareVersion).where(
         SoftwareVersion.id == version_id,
         SoftwareVersion.software_id == software_id
-    ).first()
+    ))
 
     if not version:
         raise HTTPException(status_code=404, detail="版本不存在")
 
     # 先删除关联的下载日志
     from ..models.download import DownloadLog
-    db.query(DownloadLog).filter(DownloadLog.software_version_id == version_id).delete()
+    await db.execute(delete(DownloadLog).where(DownloadLog.software_version_id == version_id))
 
     # 删除文件
     if os.path.exists(version.file_path):
@@ -487,7 +543,8 @@ async def delete_software_version(
             pass
 
     # 删除数据库记录
-    db.delete(version)
-    db.commit()
+    await db.delete(version)
+    await db.run_sync(refresh_software_summary, software_id)
+    await db.commit()
 
     return None
\ No newline at end of file
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..core.database import get_db
+from ..core.database import get_async_db
 from ..core.deps import get_current_active_user, require_ops
+from ..core.principals import Principal
 from ..models.user import User
 from ..models.software import Software, SoftwareVersion
 from ..models.request import SoftwareRequest, RequestStatus
@@ -14,31 +15,66 @@ router = APIRouter(prefix="/stats", tags=["统计数据"])
 
 @router.get("/dashboard")
 async def get_dashboard_stats(
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取首页统计数据"""
     # 软件总数
-    software_count = db.query(func.count(Software.id)).scalar()
+    software_count = await db.scalar(select(func.count(Software.id)))
 
     # 总下载次数 - 统计下载日志表的记录总数，每次下载算一次
-    total_downloads = db.query(func.count(DownloadLog.id)).scalar() or 0
+    total_downloads = await db.scalar(select(func.count(DownloadLog.id))) or 0
 
     # 待审核申请数（只有运维人员可见）
     pending_requests = 0
     if current_user.role.value in ["admin", "ops"]:
-        pending_requests = db.query(func.count(SoftwareRequest.id))\
-            .filter(SoftwareRequest.status == RequestStatus.PENDING)\
-            .scalar() or 0
+        pending_requests = await db.scalar(
+            select(func.count(SoftwareRequest.id)).where(SoftwareRequest.status == RequestStatus.PENDING)
+        ) or 0
 
     # 用户总数（只有运维人员可见）
     user_count = 0
     if current_user.role.value in ["admin", "ops"]:
-        user_count = db.query(func.count(User.id)).scalar()
+        user_count = await db.scalar(select(func.count(User.id)))
 
     return {
         "software_count": software_count,
         "total_downloads": total_downloads,
         "pending_requests": pending_requests,
         "user_count": user_count
-    }
\ No newline at end of file
+    }
+
+@router.get("/runtime")
+async def get_runtime_stats(current_user: Principal = Depends(require_ops)):
+    """获取运行时指标（DNS 解析缓存、出站连接池、AI 审核、缓存失效总线、用户缓存、登录执行器、LDAP 连接池、漏洞区间索引、只读副本、数据库连接池与查询等，仅运维可见）"""
+    from ..core.db_metrics import db_metrics
+    from ..core.dns import resolver
+    from ..core.executors import ldap_executor, password_executor
+    from ..core.http_clients import http_clients
+    from ..core.invalidation import invalidation_bus
+    from ..core.ldap import directory_stats
+    from ..core.principals import principal_cache
+    from ..core.rate_limit import rate_limiter
+    from ..core.replicas import replica_set
+    from ..core.runtime_config import config_service
+    from ..services.affected_downloads import affected_download_jobs
+    from ..services.ai_service import review_metrics
+    from ..services.ldap_sync import ldap_sync_job
+    from ..services.vulnerability_index import vulnerability_matcher
+
+    return {
+        "dns": resolver.stats(),
+        "http_clients": http_clients.stats(),
+        "ai_review": review_metrics.stats(),
+        "invalidation": invalidation_bus.stats(),
+        "principal_cache": principal_cache.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "runtime_config": config_service.stats(),
+        "executors": {"password_hash": password_executor.stats(), "ldap": ldap_executor.stats()},
+        "ldap": directory_stats(),
+        "ldap_sync": ldap_sync_job.stats(),
+        "vulnerability_index": vulnerability_matcher.stats(),
+        "affected_download_exports": affected_download_jobs.stats(),
+        "replicas": replica_set.stats(),
+        "database": db_metrics.stats()
+    }
@@ -6,16 +6,19 @@ import shutil
 from datetime import datetime, timedelta
 
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 import aiofiles
 
-from ..core.database import get_db
+from ..core.database import AsyncSessionLocal, get_async_db
 from ..core.deps import require_ops
-from ..core.config import settings, get_max_upload_size
+from ..core.principals import Principal
+from ..core.config import settings
+from ..core.runtime_config import config_service
 from ..core.validators import sanitize_filename, validate_path_within_dir
-from ..models.user import User
 from ..models.software import Software, SoftwareVersion
 from ..models.upload import UploadSession
+from ..services.catalog import refresh_software_summary
 from ..schemas.upload import (
     UploadInitRequest, UploadInitResponse,
     UploadChunkResponse, UploadCompleteResponse
@@ -27,15 +30,15 @@ router = APIRouter(prefix="/upload", tags=["分块上传"])
 @router.post("/init", response_model=UploadInitResponse)
 async def init_upload(
     data: UploadInitRequest,
-    current_user: User = Depends(require_ops),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_ops),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """初始化分块上传会话"""
-    software = db.query(Software).filter(Software.id == data.software_id).first()
+    software = await db.scalar(select(Software).where(Software.id == data.software_id))
     if not software:
         raise HTTPException(status_code=404, detail="软件不存在")
 
-    max_size = get_max_upload_size(db)
+    max_size = (await config_service.get_async(db)).max_upload_size
     if data.file_size > max_size:
         gb = max_size / (1024 ** 3)
         raise HTTPException(status_code=400, detail=f"文件大小超过限制（最大 {gb:.1f}GB）")
@@ -63,7 +66,7 @@ async def init_upload(
         status="pending"
     )
     db.add(session)
-    db.commit()
+    await db.commit()
 
     return UploadInitResponse(
         session_id=session_id,
@@ -77,11 +80,11 @@ async def upload_chunk(
     session_id: str,
     chunk_index: int,
     chunk: UploadFile = File(...),
-    current_user: User = Depends(require_ops),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_ops)
 ):
-    """上传单个分片"""
-    session = db.query(UploadSession).filter(UploadSession.id == session_id).first()
+    """上传单个分片（写分片文件期间不持有数据库连接）"""
+    async with AsyncSessionLocal() as db:
+        session = await db.scalar(select(UploadSession).where(UploadSession.id == session_id))
     if not session:
         raise HTTPException(status_code=404, detail="上传会话不存在")
     if session.status not in ("pending", "uploading"):
@@ -101,14 +104,24 @@ async def upload_chunk(
     async with aiofiles.open(chunk_path, "wb") as f:
         await f.write(content)
 
-    session.uploaded_chunks += 1
-    session.status = "uploading"
-    db.commit()
+    # 写文件期间会话可能被取消、其他分片也在计数：条件更新并原子递增
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            update(UploadSession)
+            .where(UploadSession.id == session_id, UploadSession.status.in_(("pending", "uploading")))
+            .values(uploaded_chunks=UploadSession.uploaded_chunks + 1, status="uploading")
+        )
+        if result.rowcount == 0:
+            raise HTTPException(status_code=400, detail="上传会话状态异常")
+        uploaded_chunks = await db.scalar(
+            select(UploadSession.uploaded_chunks).where(UploadSession.id == session_id)
+        )
+        await db.commit()
 
     return UploadChunkResponse(
         session_id=session_id,
         chunk_index=chunk_index,
-        uploaded_chunks=session.uploaded_chunks,
+        uploaded_chunks=uploaded_chunks,
         total_chunks=session.total_chunks
     )
 
@@ -116,11 +129,11 @@ async def upload_chunk(
 @router.post("/{session_id}/complete", response_model=UploadCompleteResponse)
 async def complete_upload(
     session_id: str,
-    current_user: User = Depends(require_ops),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_ops)
 ):
-    """完成上传，合并分片并创建版本记录"""
-    session = db.query(UploadSession).filter(UploadSession.id == session_id).first()
+    """完成上传，合并分片并创建版本记录（合并分片期间不持有数据库连接）"""
+    async with AsyncSessionLocal() as db:
+        session = await db.scalar(select(UploadSession).where(UploadSession.id == session_id))
     if not session:
         raise HTTPException(status_code=404, detail="上传会话不存在")
     if session.status != "uploading":
@@ -159,25 +172,36 @@ async def complete_upload(
     computed_hash = sha256_hash.hexdigest()
     if computed_hash != session.file_hash:
         os.remove(final_path)
-        session.status = "failed"
-        db.commit()
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(UploadSession).where(UploadSession.id == session_id).values(status="failed"))
+            await db.commit()
         raise HTTPException(status_code=400, detail="文件校验失败，哈希不匹配")
 
-    # 创建版本记录
-    version = SoftwareVersion(
-        software_id=session.software_id,
-        version=session.version,
-        file_path=final_path,
-        file_name=safe_filename,
-        file_size=total_size,
-        file_hash=computed_hash,
-        uploader_id=current_user.id,
-        release_notes=session.release_notes
-    )
-    db.add(version)
-    session.status = "completed"
-    db.commit()
-    db.refresh(version)
+    async with AsyncSessionLocal() as db:
+        # 合并期间会话可能已被取消或由另一个请求完成
+        result = await db.execute(
+            update(UploadSession)
+            .where(UploadSession.id == session_id, UploadSession.status == "uploading")
+            .values(status="completed")
+        )
+        if result.rowcount == 0:
+            raise HTTPException(status_code=400, detail="上传会话状态异常")
+
+        # 创建版本记录
+        version = SoftwareVersion(
+            software_id=session.software_id,
+            version=session.version,
+            file_path=final_path,
+            file_name=safe_filename,
+            file_size=total_size,
+            file_hash=computed_hash,
+            uploader_id=current_user.id,
+            release_notes=session.release_notes
+        )
+        db.add(version)
+        await db.run_sync(refresh_software_summary, session.software_id)
+        await db.commit()
+        await db.refresh(version)
 
     # 清理临时文件
     shutil.rmtree(session.temp_dir, ignore_errors=True)
@@ -194,11 +218,11 @@ async def complete_upload(
 @router.post("/{session_id}/cancel")
 async def cancel_upload(
     session_id: str,
-    current_user: User = Depends(require_ops),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_ops),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """取消上传并清理临时文件"""
-    session = db.query(UploadSession).filter(UploadSession.id == session_id).first()
+    session = await db.scalar(select(UploadSession).where(UploadSession.id == session_id))
     if not session:
         raise HTTPException(status_code=404, detail="上传会话不存在")
     if session.status == "completed":
@@ -206,6 +230,6 @@ async def cancel_upload(
 
     shutil.rmtree(session.temp_dir, ignore_errors=True)
     session.status = "cancelled"
-    db.commit()
+    await db.commit()
 
     return {"message": "上传已取消"}
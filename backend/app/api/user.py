@@ -1,13 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 
-from ..core.database import get_db
+from ..core.database import get_async_db
 from ..core.deps import require_admin
-from ..core.security import get_password_hash
+from ..core.principals import Principal
+from ..core.security import get_password_hash_async
+from ..core.invalidation import invalidation_bus
+from ..core.pagination import PageParams, page_params, paginate
 from ..models.user import User, UserRole
 from ..schemas.user import UserResponse, UserCreate
+from ..schemas.request import PaginatedResponse
 
 router = APIRouter(prefix="/users", tags=["用户管理"])
 
@@ -17,37 +21,37 @@ class UserUpdate(BaseModel):
     is_active: bool
 
 
-@router.get("", response_model=List[UserResponse])
+@router.get("", response_model=PaginatedResponse[UserResponse])
 async def list_users(
-    skip: int = 0,
-    limit: int = 50,
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db)
+    page: PageParams = Depends(page_params(default_limit=50, max_limit=1000)),
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取用户列表（仅管理员）"""
-    users = db.query(User).offset(skip).limit(limit).all()
-    return users
+    page_data = await paginate(db, select(User), page, key="users", order_by=[User.id], descending=False)
+    return PaginatedResponse(total=page_data.total, items=page_data.items, next_cursor=page_data.next_cursor)
 
 
 @router.post("", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def create_user(
     user_data: UserCreate,
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """创建用户（仅管理员）"""
     # 检查用户名是否存在
-    existing = db.query(User).filter(User.username == user_data.username).first()
+    existing = await db.scalar(select(User).where(User.username == user_data.username))
     if existing:
         raise HTTPException(status_code=400, detail="用户名已存在")
 
     # 检查邮箱是否存在
     if user_data.email:
-        existing_email = db.query(User).filter(User.email == user_data.email).first()
+        existing_email = await db.scalar(select(User).where(User.email == user_data.email))
         if existing_email:
             raise HTTPException(status_code=400, detail="邮箱已被注册")
 
-    hashed_password = get_password_hash(user_data.password)
+    await db.commit()  # 归还数据库连接后再计算哈希
+    hashed_password = await get_password_hash_async(user_data.password)
     new_user = User(
         username=user_data.username,
         hashed_password=hashed_password,
@@ -55,8 +59,8 @@ async def create_user(
         role=UserRole.USER  # 默认为普通用户
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
 
     return new_user
 
@@ -65,11 +69,11 @@ async def create_user(
 async def update_user(
     user_id: int,
     user_data: UserUpdate,
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """更新用户（仅管理员）"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
 
@@ -81,8 +85,9 @@ async def update_user(
     user.is_active = user_data.is_active
     # 递增 token_version 使旧 token 失效
     user.token_version = (user.token_version or 0) + 1
-    db.commit()
-    db.refresh(user)
+    invalidation_bus.publish(db, "user", [user.id])
+    await db.commit()
+    await db.refresh(user)
 
     return user
 
@@ -90,11 +95,11 @@ async def update_user(
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_user(
     user_id: int,
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """删除用户（仅管理员）"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
 
@@ -102,5 +107,6 @@ async def delete_user(
     if user.id == current_user.id:
         raise HTTPException(status_code=400, detail="不能删除自己")
 
-    db.delete(user)
-    db.commit()
+    await db.delete(user)
+    invalidation_bus.publish(db, "user", [user.id])
+    await db.commit()
@@ -1,30 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List, Optional, Generic, TypeVar
-from pydantic import BaseModel
+import asyncio
+import os
 
-from ..core.database import get_db
-from ..core.deps import require_ops, get_current_active_user
-from ..models.user import User
-from ..models.vulnerability import Vulnerability
-from ..schemas.vulnerability import VulnerabilityCreate, VulnerabilityUpdate, VulnerabilityResponse, VulnerabilityWithSoftwareResponse
-
-router = APIRouter(prefix="/vulnerabilities", tags=["漏洞管理"])
-
-T = TypeVar('T')
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload
+from typing import List, Optional
 
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal, SessionLocal, get_async_db
+from ..core.deps import require_admin, require_ops, get_current_active_user
+from ..core.principals import Principal
+from ..core.pagination import PageParams, page_params, paginate
+from ..models.software import SoftwareVersion
+from ..models.vulnerability import Vulnerability, VersionExposure
+from ..schemas.request import PaginatedResponse
+from ..schemas.vulnerability import (
+    VulnerabilityCreate, VulnerabilityUpdate, VulnerabilityResponse, VulnerabilityWithSoftwareResponse,
+    InventoryCheckRequest, InventoryCheckResponse, InventoryItemResult, VulnerabilityBrief, ExposedVersionResponse
+)
+from ..services.affected_downloads import (
+    MEDIA_TYPES, affected_download_jobs, cache_path, cache_token, discard_exports, stream_export
+)
+from ..services.exposure import SEVERITY_RANK
+from ..services.vulnerability_index import compile_vulnerability_ranges, mark_vulnerabilities_changed, vulnerability_matcher
 
-class PaginatedResponse(BaseModel, Generic[T]):
-    """通用分页响应模型"""
-    total: int
-    items: List[T]
-
+router = APIRouter(prefix="/vulnerabilities", tags=["漏洞管理"])
 
 @router.post("", response_model=VulnerabilityResponse, status_code=status.HTTP_201_CREATED)
 async def create_vulnerability(
     vuln_data: VulnerabilityCreate,
-    current_user: User = Depends(require_ops),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_ops),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """创建漏洞记录"""
     # 验证严重程度
@@ -46,8 +54,13 @@ async def create_vulnerability(
         reference_url=vuln_data.reference_url
     )
     db.add(vulnerability)
-    db.commit()
-    db.refresh(vulnerability)
+    await db.run_sync(compile_vulnerability_ranges, vulnerability)
+    await db.commit()
+    await db.refresh(vulnerability)
+
+    if vulnerability.severity == "critical":
+        # 提前生成受影响下载记录的导出
+        affected_download_jobs.schedule(vulnerability.id)
 
     return vulnerability
 
@@ -56,49 +69,128 @@ async def create_vulnerability(
 async def list_vulnerabilities(
     software_id: Optional[int] = None,
     severity: Optional[str] = None,
-    skip: int = 0,
-    limit: int = 50,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    page: PageParams = Depends(page_params(default_limit=50, max_limit=1000)),
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取漏洞列表"""
-    from sqlalchemy.orm import joinedload
-    from ..models.software import Software
-
-    query = db.query(Vulnerability).options(joinedload(Vulnerability.software))
+    query = select(Vulnerability).options(joinedload(Vulnerability.software))
 
     if software_id:
-        query = query.filter(Vulnerability.software_id == software_id)
+        query = query.where(Vulnerability.software_id == software_id)
     if severity:
-        query = query.filter(Vulnerability.severity == severity)
-
-    # 获取总数
-    total = query.count()
+        query = query.where(Vulnerability.severity == severity)
 
-    vulnerabilities = query.order_by(Vulnerability.created_at.desc())\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
+    page_data = await paginate(db, query, page, key="vulnerabilities", order_by=[Vulnerability.created_at, Vulnerability.id])
 
     # 构造包含软件名称的响应
     result = []
-    for vuln in vulnerabilities:
+    for vuln in page_data.items:
         vuln_dict = vuln.__dict__.copy()
         vuln_dict['software_name'] = vuln.software.name if vuln.software else "未知软件"
         result.append(vuln_dict)
 
-    return PaginatedResponse(total=total, items=result)
+    return PaginatedResponse(total=page_data.total, items=result, next_cursor=page_data.next_cursor)
+
+
+@router.get("/exposure", response_model=PaginatedResponse[ExposedVersionResponse])
+async def get_exposure_report(
+    software_id: Optional[int] = None,
+    min_severity: Optional[str] = None,
+    page: PageParams = Depends(page_params(default_limit=50, max_limit=1000)),
+    current_user: Principal = Depends(require_ops),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """暴露面报表：目录中所有受已知漏洞影响的版本（读取预先计算的 version_exposure）"""
+    exposed = select(VersionExposure.software_version_id)\
+        .join(Vulnerability, Vulnerability.id == VersionExposure.vulnerability_id)
+    if software_id:
+        exposed = exposed.where(VersionExposure.software_id == software_id)
+    if min_severity:
+        if min_severity not in SEVERITY_RANK:
+            raise HTTPException(
+                status_code=400,
+                detail=f"无效的严重程度，必须是: {', '.join(SEVERITY_RANK)}"
+            )
+        severities = [s for s, rank in SEVERITY_RANK.items() if rank >= SEVERITY_RANK[min_severity]]
+        exposed = exposed.where(Vulnerability.severity.in_(severities))
+
+    query = select(SoftwareVersion).options(joinedload(SoftwareVersion.software))\
+        .where(SoftwareVersion.id.in_(exposed))
+    if software_id:
+        query = query.where(SoftwareVersion.software_id == software_id)
+
+    page_data = await paginate(
+        db, query, page, key="exposure",
+        order_by=[SoftwareVersion.software_id, SoftwareVersion.id], descending=False
+    )
+
+    # 一次取回本页所有版本的漏洞
+    version_ids = [v.id for v in page_data.items]
+    vulnerabilities = {}
+    if version_ids:
+        rows = (await db.execute(
+            select(VersionExposure.software_version_id, Vulnerability)
+            .join(Vulnerability, Vulnerability.id == VersionExposure.vulnerability_id)
+            .where(VersionExposure.software_version_id.in_(version_ids))
+            .order_by(Vulnerability.id)
+        )).all()
+        for version_id, vuln in rows:
+            vulnerabilities.setdefault(version_id, []).append(vuln)
+
+    result = []
+    for version in page_data.items:
+        vulns = vulnerabilities.get(version.id, [])
+        result.append(ExposedVersionResponse(
+            software_id=version.software_id,
+            software_name=version.software.name if version.software else "未知软件",
+            version_id=version.id,
+            version=version.version,
+            download_count=version.download_count or 0,
+            max_severity=max((v.severity for v in vulns), key=lambda s: SEVERITY_RANK.get(s, 0), default=None),
+            vulnerabilities=[VulnerabilityBrief.model_validate(v, from_attributes=True) for v in vulns]
+        ))
+
+    return PaginatedResponse(total=page_data.total, items=result, next_cursor=page_data.next_cursor)
+
+
+@router.get("/{vulnerability_id}/affected-downloads")
+async def export_affected_downloads(
+    vulnerability_id: int,
+    format: str = Query("ndjson", description="ndjson 或 csv"),
+    current_user: Principal = Depends(require_ops)
+):
+    """导出下载过受该漏洞影响版本的记录（用户、时间、IP），流式返回"""
+    if format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"不支持的格式，必须是: {', '.join(MEDIA_TYPES)}")
+    # 短会话：流式导出自带会话，返回响应前归还连接
+    async with AsyncSessionLocal() as db:
+        vulnerability = await db.scalar(select(Vulnerability).where(Vulnerability.id == vulnerability_id))
+        if not vulnerability:
+            raise HTTPException(status_code=404, detail="漏洞不存在")
+        token = await db.run_sync(cache_token, vulnerability)
+    filename = f"affected-downloads-{vulnerability.cve_id or vulnerability_id}.{format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"', "X-Export-Token": token}
+    path = cache_path(vulnerability_id, token, format)
+    if os.path.exists(path):
+        return FileResponse(path, media_type=MEDIA_TYPES[format], headers={**headers, "X-Export-Cache": "hit"})
+
+    return StreamingResponse(
+        stream_export(vulnerability_id, token, format),
+        media_type=MEDIA_TYPES[format],
+        headers={**headers, "X-Export-Cache": "miss"}
+    )
 
 
 @router.put("/{vulnerability_id}", response_model=VulnerabilityResponse)
 async def update_vulnerability(
     vulnerability_id: int,
     vuln_data: VulnerabilityUpdate,
-    current_user: User = Depends(require_ops),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_ops),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """更新漏洞记录"""
-    vulnerability = db.query(Vulnerability).filter(Vulnerability.id == vulnerability_id).first()
+    vulnerability = await db.scalar(select(Vulnerability).where(Vulnerability.id == vulnerability_id))
     if not vulnerability:
         raise HTTPException(status_code=404, detail="漏洞不存在")
 
@@ -112,6 +204,7 @@ async def update_vulnerability(
             )
 
     # 更新字段
+    previous_software_id = vulnerability.software_id
     if vuln_data.software_id is not None:
         vulnerability.software_id = vuln_data.software_id
     if vuln_data.cve_id is not None:
@@ -129,8 +222,18 @@ async def update_vulnerability(
     if vuln_data.reference_url is not None:
         vulnerability.reference_url = vuln_data.reference_url
 
-    db.commit()
-    db.refresh(vulnerability)
+    if (vuln_data.software_id is not None or vuln_data.affected_versions is not None
+            or vuln_data.fixed_version is not None):
+        await db.run_sync(compile_vulnerability_ranges, vulnerability, previous_software_id)
+    else:
+        # 严重程度等变化也会影响软件列表的漏洞标记
+        mark_vulnerabilities_changed(db, [vulnerability.software_id])
+
+    await db.commit()
+    await db.refresh(vulnerability)
+
+    if vulnerability.severity == "critical":
+        affected_download_jobs.schedule(vulnerability.id)
 
     return vulnerability
 
@@ -138,16 +241,18 @@ async def update_vulnerability(
 @router.delete("/{vulnerability_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_vulnerability(
     vulnerability_id: int,
-    current_user: User = Depends(require_ops),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_ops),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """删除漏洞记录"""
-    vulnerability = db.query(Vulnerability).filter(Vulnerability.id == vulnerability_id).first()
+    vulnerability = await db.scalar(select(Vulnerability).where(Vulnerability.id == vulnerability_id))
     if not vulnerability:
         raise HTTPException(status_code=404, detail="漏洞不存在")
 
-    db.delete(vulnerability)
-    db.commit()
+    mark_vulnerabilities_changed(db, [vulnerability.software_id])
+    await db.delete(vulnerability)
+    await db.commit()
+    discard_exports(vulnerability_id)
 
     return None
 
@@ -156,26 +261,80 @@ async def delete_vulnerability(
 async def check_vulnerabilities(
     software_id: int,
     version: str,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """检查指定版本是否存在漏洞"""
-    # 简化版本比较，实际应用中应该使用更复杂的版本比较逻辑
-    vulnerabilities = db.query(Vulnerability)\
-        .filter(Vulnerability.software_id == software_id)\
-        .all()
-
-    # 过滤出影响该版本的漏洞
-    affected = []
-    for vuln in vulnerabilities:
-        if vuln.affected_versions:
-            # 简单的字符串匹配，实际应该使用语义化版本比较
-            if version in vuln.affected_versions or "-" in vuln.affected_versions:
-                affected.append(vuln)
-        # 如果没有指定修复版本，认为所有版本都受影响
-        elif not vuln.fixed_version:
-            affected.append(vuln)
-        elif vuln.fixed_version and version < vuln.fixed_version:
-            affected.append(vuln)
-
-    return affected
\ No newline at end of file
+    vulnerability_ids = await db.run_sync(vulnerability_matcher.match, software_id, version)
+    if not vulnerability_ids:
+        return []
+    vulnerabilities = await db.scalars(
+        select(Vulnerability)
+        .where(Vulnerability.id.in_(vulnerability_ids))
+        .order_by(Vulnerability.id)
+    )
+    return vulnerabilities.all()
+
+
+@router.post("/check", response_model=InventoryCheckResponse)
+async def check_inventory(
+    inventory: InventoryCheckRequest,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """批量检查一台终端上已安装软件的漏洞（按软件 ID 或名称 + 版本），结果与请求条目一一对应"""
+    if len(inventory.items) > settings.INVENTORY_CHECK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单次最多检查 {settings.INVENTORY_CHECK_MAX_ITEMS} 个条目"
+        )
+
+    results, affected, unknown = await db.run_sync(_check_inventory_items, inventory.items)
+    return InventoryCheckResponse(items=results, affected=affected, unknown=unknown)
+
+
+def _check_inventory_items(db: Session, items) -> tuple:
+    """逐条匹配清单条目（索引未命中时查库，整批在一次 run_sync 中执行）"""
+    results = []
+    affected = unknown = 0
+    for item in items:
+        software_id = item.software_id
+        if software_id is None:
+            software_id = vulnerability_matcher.resolve_name(db, item.name)
+        if software_id is None:
+            unknown += 1
+            results.append(InventoryItemResult(name=item.name, version=item.version))
+            continue
+        matched = vulnerability_matcher.check(db, software_id, item.version)
+        if matched:
+            affected += 1
+        results.append(InventoryItemResult(
+            software_id=software_id,
+            name=item.name,
+            version=item.version,
+            vulnerabilities=[VulnerabilityBrief(**v._asdict()) for v in matched]
+        ))
+    return results, affected, unknown
+
+
+def _run_nvd_import(fileobj) -> dict:
+    from ..services.nvd_import import import_nvd_feed, open_feed
+
+    db = SessionLocal()
+    try:
+        return import_nvd_feed(db, open_feed(fileobj)).as_dict()
+    finally:
+        db.close()
+
+
+@router.post("/import/nvd")
+async def import_nvd(
+    file: UploadFile = File(..., description="NVD CVE JSON 2.0 数据文件（.json 或 .json.gz）"),
+    current_user: Principal = Depends(require_admin)
+):
+    """导入 NVD 漏洞数据：按 CPE 产品名匹配目录中的软件，内容未变化的 CVE 跳过"""
+    try:
+        # 解析和写库较慢，放到线程中执行；每批单独提交，失败时已提交的批次保留
+        return await asyncio.to_thread(_run_nvd_import, file.file)
+    except (ValueError, OSError) as e:
+        raise HTTPException(status_code=400, detail=f"无法解析 NVD 数据文件: {e}")
@@ -1,11 +1,41 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from .config import settings
+from .db_metrics import pool_options
+from .replicas import RoutingSession
 
-engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
+# 同步引擎：启动迁移、后台线程任务与脚本使用
+engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True, **pool_options(settings.DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 同步驱动 -> 对应的异步驱动
+_ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_url(url: str) -> str:
+    """DATABASE_URL 按同步驱动填写（alembic 与脚本共用），这里换成同一数据库的异步驱动"""
+    parsed = make_url(url)
+    drivername = _ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)
+    return parsed.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+# 异步引擎：接口请求使用，等待数据库时不占用事件循环
+ASYNC_DATABASE_URL = async_database_url(settings.DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_pre_ping=True, **pool_options(ASYNC_DATABASE_URL))
+# 提交后不过期对象：提交后组装响应不会再触发查询
+# 配置只读副本时，GET 请求中的只读查询由 RoutingSession 发往副本（见 core/replicas.py）
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, expire_on_commit=False, autoflush=False, sync_session_class=RoutingSession
+)
+
 Base = declarative_base()
 
 
@@ -15,3 +45,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
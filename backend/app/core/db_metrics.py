@@ -0,0 +1,264 @@
+"""
+数据库连接池与查询统计
+
+- 连接池：接口请求、后台任务和副本使用的队列连接池换成计时的子类，记录每次取连接的耗时
+  （含排队等待、新建连接与 pre-ping）和取连接超时次数；当前借出的连接数直接读连接池。
+- 查询：引擎的 before/after_cursor_execute 事件统计执行条数与耗时。
+- 按请求：中间件为每个请求建立计数（查询条数、SQL 总耗时、取连接次数与等待时间），
+  请求结束后按路由（如 GET /api/software/{software_id}）汇总。DEBUG 模式下在响应头中返回本次请求的计数。
+- 查询预算：单个请求的查询条数超过 DB_QUERY_BUDGET 时记录告警并按路由计数，
+  最近的超预算请求保留在统计中，用于发现列表接口中逐行查询（N+1）之类的问题。
+
+统计只在本进程内，通过 /api/stats/runtime 查看。
+"""
+import logging
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.datastructures import MutableHeaders
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RequestQueries:
+    """一次请求的数据库使用情况"""
+    queries: int = 0
+    sql_ms: float = 0.0
+    checkouts: int = 0
+    checkout_wait_ms: float = 0.0
+
+
+_current: ContextVar[Optional[RequestQueries]] = ContextVar("db_request_queries", default=None)
+
+
+def _pct(samples, p: float) -> Optional[float]:
+    return round(samples[min(len(samples) - 1, int(len(samples) * p))], 2) if samples else None
+
+
+class RouteStats:
+    __slots__ = ("requests", "queries", "max_queries", "sql_ms", "over_budget")
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.sql_ms = 0.0
+        self.over_budget = 0
+
+
+class DbMetrics:
+    def __init__(self, query_budget: int):
+        self.query_budget = query_budget
+        self._queries = 0
+        self._sql_ms = 0.0
+        self._checkouts = 0
+        self._checkout_timeouts = 0
+        self._checkout_wait_ms: deque = deque(maxlen=2048)
+        self._routes: Dict[str, RouteStats] = {}
+        self._over_budget: deque = deque(maxlen=50)
+
+    def record_query(self, elapsed: float):
+        ms = elapsed * 1000
+        self._queries += 1
+        self._sql_ms += ms
+        current = _current.get()
+        if current is not None:
+            current.queries += 1
+            current.sql_ms += ms
+
+    def record_checkout(self, elapsed: float, timed_out: bool = False):
+        ms = elapsed * 1000
+        if timed_out:
+            self._checkout_timeouts += 1
+        else:
+            self._checkouts += 1
+        self._checkout_wait_ms.append(ms)
+        current = _current.get()
+        if current is not None:
+            current.checkouts += 1
+            current.checkout_wait_ms += ms
+
+    def record_request(self, route: str, path: str, usage: RequestQueries):
+        stats = self._routes.get(route)
+        if stats is None:
+            stats = self._routes[route] = RouteStats()
+        stats.requests += 1
+        stats.queries += usage.queries
+        stats.max_queries = max(stats.max_queries, usage.queries)
+        stats.sql_ms += usage.sql_ms
+        if self.over_budget(usage):
+            stats.over_budget += 1
+            self._over_budget.append({
+                "route": route,
+                "path": path,
+                "queries": usage.queries,
+                "sql_ms": round(usage.sql_ms, 2),
+                "at": datetime.utcnow().isoformat(timespec="seconds"),
+            })
+            logger.warning(f"请求查询数超出预算: {route}（{path}）执行了 {usage.queries} 条查询，预算 {self.query_budget}")
+
+    def over_budget(self, usage: RequestQueries) -> bool:
+        return 0 < self.query_budget < usage.queries
+
+    def stats(self) -> dict:
+        from .database import async_engine, engine
+        from .replicas import replica_set
+
+        waits = sorted(self._checkout_wait_ms)
+        pools = {"api": _pool_stats(async_engine), "background": _pool_stats(engine)}
+        for i, replica in enumerate(replica_set.replicas):
+            pools[f"replica_{i}"] = _pool_stats(replica.engine)
+        routes = sorted(self._routes.items(), key=lambda item: item[1].queries, reverse=True)
+        return {
+            "query_budget": self.query_budget,
+            "queries": self._queries,
+            "sql_ms": round(self._sql_ms, 2),
+            "pools": pools,
+            "checkouts": self._checkouts,
+            "checkout_timeouts": self._checkout_timeouts,
+            "checkout_wait_ms": {"p50": _pct(waits, 0.5), "p99": _pct(waits, 0.99), "max": round(waits[-1], 2) if waits else None},
+            "routes": {
+                route: {
+                    "requests": s.requests,
+                    "avg_queries": round(s.queries / s.requests, 2),
+                    "max_queries": s.max_queries,
+                    "avg_sql_ms": round(s.sql_ms / s.requests, 2),
+                    "over_budget": s.over_budget,
+                }
+                for route, s in routes
+            },
+            "recent_over_budget": list(self._over_budget),
+        }
+
+
+db_metrics = DbMetrics(settings.DB_QUERY_BUDGET)
+
+
+def _pool_stats(engine) -> dict:
+    pool = getattr(engine, "sync_engine", engine).pool
+    if not isinstance(pool, QueuePool):
+        return {"class": type(pool).__name__}
+    return {
+        "size": pool.size(),
+        "max_overflow": pool._max_overflow,
+        "checked_out": pool.checkedout(),
+        "overflow": max(0, pool.overflow()),
+    }
+
+
+# ---- 连接池计时 ----
+
+class _TimedCheckout:
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            db_metrics.record_checkout(time.perf_counter() - started, timed_out=True)
+            raise
+        db_metrics.record_checkout(time.perf_counter() - started)
+        return connection
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+_TIMED_POOLS = {QueuePool: TimedQueuePool, AsyncAdaptedQueuePool: TimedAsyncQueuePool}
+
+
+def pool_options(url: str) -> dict:
+    """create_engine 的 poolclass 参数：方言默认使用队列连接池时换成计时子类，其他连接池保持默认"""
+    parsed = make_url(url)
+    default = parsed.get_dialect().get_pool_class(parsed)
+    timed = _TIMED_POOLS.get(default)
+    return {"poolclass": timed} if timed else {}
+
+
+# ---- 查询计时 ----
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._db_metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_db_metrics_started", None)
+    if started is not None:
+        db_metrics.record_query(time.perf_counter() - started)
+
+
+# ---- 按请求统计 ----
+
+def _route_name(scope) -> str:
+    """路由模板，如 GET /api/software/{software_id}；未匹配到路由的请求归为一类，避免按路径无限增长"""
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    regex = getattr(route, "path_regex", None)
+    if not template or regex is None:
+        return f"{scope['method']} <unmatched>"
+    # 较新的 FastAPI 中 include_router 的前缀不在 route.path 里：找到与路由匹配的后缀，补上前面的部分
+    path = scope["path"]
+    for i, char in enumerate(path):
+        if char == "/" and regex.match(path[i:]):
+            return f"{scope['method']} {path[:i]}{template}"
+    return f"{scope['method']} {template}"
+
+
+class QueryAccountingMiddleware:
+    """统计每个请求的查询条数与耗时；DEBUG 模式下写入响应头"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        usage = RequestQueries()
+        recorded = False
+
+        def finish():
+            nonlocal recorded
+            if not recorded:
+                recorded = True
+                db_metrics.record_request(_route_name(scope), scope["path"], usage)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and settings.DEBUG:
+                headers = MutableHeaders(scope=message)
+                headers["X-DB-Queries"] = str(usage.queries)
+                headers["X-DB-Time-Ms"] = f"{usage.sql_ms:.2f}"
+                headers["X-DB-Checkouts"] = str(usage.checkouts)
+                headers["X-DB-Pool-Wait-Ms"] = f"{usage.checkout_wait_ms:.2f}"
+                if db_metrics.over_budget(usage):
+                    headers["X-DB-Query-Budget-Exceeded"] = str(db_metrics.query_budget)
+            await send(message)
+            # 响应发送完即汇总，之后的后台任务不计入本请求
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        token = _current.set(usage)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            finish()
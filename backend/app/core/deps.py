@@ -1,21 +1,20 @@
 from typing import Generator, Optional
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, Response, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError
-from sqlalchemy.orm import Session
-from ..core.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..core.database import get_async_db
 from ..core.security import decode_access_token
-from ..models.user import User, UserRole
+from ..core.principals import Principal, principal_cache
+from ..models.user import UserRole
+from ..services.catalog import get_catalog_revision, format_catalog_etag, etag_matches
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="/api/auth/login", auto_error=False)
 
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> User:
-    """获取当前登录用户"""
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> Principal:
+    """获取当前登录用户（命中 principal 缓存时不查询数据库）"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="无法验证凭据",
@@ -32,20 +31,20 @@ async def get_current_user(
     if username is None or user_id is None:
         raise credentials_exception
 
-    user = db.query(User).filter(User.id == user_id).first()
-    if user is None:
+    principal = await principal_cache.load(user_id, token_version)
+    if principal is None:
         raise credentials_exception
 
     # token_version 不匹配说明用户角色/状态已变更，旧 token 应失效
-    if user.token_version != token_version:
+    if principal.token_version != token_version:
         raise credentials_exception
 
-    return user
+    return principal
 
 
 async def get_current_active_user(
-    current_user: User = Depends(get_current_user)
-) -> User:
+    current_user: Principal = Depends(get_current_user)
+) -> Principal:
     """获取当前活跃用户"""
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="用户已被禁用")
@@ -53,9 +52,8 @@ async def get_current_active_user(
 
 
 async def get_optional_current_user(
-    token: Optional[str] = Depends(oauth2_scheme_optional),
-    db: Session = Depends(get_db)
-) -> Optional[User]:
+    token: Optional[str] = Depends(oauth2_scheme_optional)
+) -> Optional[Principal]:
     """获取当前用户（可选，未登录时返回 None）"""
     if not token:
         return None
@@ -67,15 +65,15 @@ async def get_optional_current_user(
         user_id: int = payload.get("user_id")
         if username is None or user_id is None:
             return None
-        user = db.query(User).filter(User.id == user_id).first()
-        return user if user and user.is_active else None
+        principal = await principal_cache.load(user_id, payload.get("tv", 0))
+        return principal if principal and principal.is_active else None
     except Exception:
         return None
 
 
 def require_role(*allowed_roles: UserRole):
     """角色权限装饰器"""
-    def role_checker(current_user: User = Depends(get_current_active_user)) -> User:
+    def role_checker(current_user: Principal = Depends(get_current_active_user)) -> Principal:
         if current_user.role not in allowed_roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -88,3 +86,24 @@ def require_role(*allowed_roles: UserRole):
 # 便捷的权限依赖
 require_admin = require_role(UserRole.ADMIN)
 require_ops = require_role(UserRole.ADMIN, UserRole.OPS)
+
+
+# 目录数据对所有登录用户相同，但只允许浏览器私有缓存；每次都需向服务端验证
+CATALOG_CACHE_CONTROL = "private, no-cache"
+
+
+async def check_catalog_etag(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db)
+) -> str:
+    """目录类只读接口的条件请求：If-None-Match 命中当前目录版本时直接返回 304，不再查询和组装数据"""
+    etag = format_catalog_etag(await db.run_sync(get_catalog_revision))
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        raise HTTPException(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers={"ETag": etag, "Cache-Control": CATALOG_CACHE_CONTROL}
+        )
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CATALOG_CACHE_CONTROL
+    return etag
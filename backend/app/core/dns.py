@@ -0,0 +1,167 @@
+"""
+异步 DNS 解析器（带 TTL 缓存）
+
+SSRF 防护需要在发起连接前解析主机名并校验 IP。socket.getaddrinfo 是阻塞调用，
+直接在事件循环里执行会卡住整个 worker，这里改为交给线程池解析，并按主机名缓存
+结果；同一主机的并发解析只会触发一次系统调用。
+"""
+import asyncio
+import logging
+import socket
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ResolveError(Exception):
+    """主机名无法解析"""
+
+
+class AsyncResolver:
+    """带正/负缓存的解析器，同时记录解析耗时"""
+
+    def __init__(self, ttl: int, negative_ttl: int, timeout: float, max_entries: int = 1024):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.max_entries = max_entries
+        # host -> (过期时间, IP 列表；None 表示解析失败)
+        self._cache: Dict[str, Tuple[float, Optional[List[str]]]] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=512)
+        self._lookups = 0
+        self._hits = 0
+        self._failures = 0
+
+    def _cached(self, host: str) -> Optional[Tuple[float, Optional[List[str]]]]:
+        with self._lock:
+            entry = self._cache.get(host)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                self._cache.pop(host, None)
+                return None
+            self._hits += 1
+            return entry
+
+    def _store(self, host: str, ips: Optional[List[str]], elapsed: float):
+        ttl = self.ttl if ips else self.negative_ttl
+        with self._lock:
+            self._lookups += 1
+            if not ips:
+                self._failures += 1
+            self._latencies.append(elapsed)
+            self._cache.pop(host, None)
+            self._cache[host] = (time.monotonic() + ttl, ips)
+            while len(self._cache) > self.max_entries:
+                self._cache.pop(next(iter(self._cache)))
+        if elapsed > 1.0:
+            logger.warning(f"DNS 解析耗时过长: {host} {elapsed * 1000:.0f}ms")
+
+    @staticmethod
+    def _unique_ips(infos) -> List[str]:
+        ips: List[str] = []
+        for _, _, _, _, addr in infos:
+            if addr[0] not in ips:
+                ips.append(addr[0])
+        return ips
+
+    @staticmethod
+    def _raise_if_failed(host: str, entry: Tuple[float, Optional[List[str]]]) -> List[str]:
+        if not entry[1]:
+            raise ResolveError(host)
+        return list(entry[1])
+
+    def resolve_sync(self, host: str) -> List[str]:
+        """同步解析（供 pydantic 校验器等同步代码使用），结果与异步解析共享缓存"""
+        host = host.lower()
+        entry = self._cached(host)
+        if entry is not None:
+            return self._raise_if_failed(host, entry)
+
+        start = time.perf_counter()
+        try:
+            ips = self._unique_ips(socket.getaddrinfo(host, None, socket.AF_UNSPEC, socket.SOCK_STREAM))
+        except (socket.gaierror, UnicodeError):
+            ips = None
+        self._store(host, ips, time.perf_counter() - start)
+        if not ips:
+            raise ResolveError(host)
+        return ips
+
+    async def _lookup(self, host: str) -> Optional[List[str]]:
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            infos = await asyncio.wait_for(
+                loop.getaddrinfo(host, None, family=socket.AF_UNSPEC, type=socket.SOCK_STREAM),
+                timeout=self.timeout
+            )
+            ips = self._unique_ips(infos)
+        except (socket.gaierror, UnicodeError, asyncio.TimeoutError):
+            ips = None
+        self._store(host, ips, time.perf_counter() - start)
+        return ips
+
+    async def resolve(self, host: str) -> List[str]:
+        """异步解析，不阻塞事件循环；并发请求同一主机时共享同一次解析"""
+        host = host.lower()
+        entry = self._cached(host)
+        if entry is not None:
+            return self._raise_if_failed(host, entry)
+
+        loop = asyncio.get_running_loop()
+        task = self._inflight.get(host)
+        if task is None or task.get_loop() is not loop:
+            task = loop.create_task(self._lookup(host))
+            self._inflight[host] = task
+
+            def _done(t: asyncio.Task, h: str = host):
+                if self._inflight.get(h) is t:
+                    del self._inflight[h]
+
+            task.add_done_callback(_done)
+
+        ips = await asyncio.shield(task)
+        if not ips:
+            raise ResolveError(host)
+        return list(ips)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        """解析次数、缓存命中和耗时分布（毫秒）"""
+        with self._lock:
+            samples = sorted(self._latencies)
+            lookups, hits, failures = self._lookups, self._hits, self._failures
+            cached = len(self._cache)
+
+        def pct(p: float) -> Optional[float]:
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 2)
+
+        total = lookups + hits
+        return {
+            "lookups": lookups,
+            "cache_hits": hits,
+            "hit_ratio": round(hits / total, 4) if total else 0.0,
+            "failures": failures,
+            "cached_hosts": cached,
+            "latency_ms": {"p50": pct(0.5), "p99": pct(0.99), "max": pct(1.0)},
+        }
+
+
+resolver = AsyncResolver(
+    ttl=settings.DNS_CACHE_TTL,
+    negative_ttl=settings.DNS_NEGATIVE_TTL,
+    timeout=settings.DNS_TIMEOUT,
+)
@@ -0,0 +1,101 @@
+"""
+有界执行器
+
+登录等接口中的阻塞操作不能直接在事件循环上执行，否则同一 worker 的所有请求都会卡住：
+
+- password_executor：bcrypt 哈希/校验（每次约数百毫秒 CPU；bcrypt 计算时释放 GIL，线程池即可并行）；
+- ldap_executor：LDAP 绑定与搜索（阻塞网络 I/O，目录服务慢时单次可达超时时间）。
+
+两者各自使用独立的线程池，互不占用，也不占用 asyncio.to_thread 的默认线程池。
+同时运行 workers 个任务，最多再排队 queue_size 个；已满时立即抛出 ExecutorSaturated，
+由全局异常处理返回 429，让客户端稍后重试，而不是让排队时间无限增长。
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from .config import settings
+
+
+class ExecutorSaturated(Exception):
+    """执行器运行和排队的任务都已满"""
+
+    def __init__(self, name: str, retry_after: int = 1):
+        super().__init__(f"{name} 执行器繁忙")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    def __init__(self, name: str, workers: int, queue_size: int):
+        self.name = name
+        self.workers = workers
+        self.queue_size = queue_size
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_ms: deque = deque(maxlen=512)
+        self._run_ms: deque = deque(maxlen=512)
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+        return self._pool
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """在执行器线程中运行 fn；运行与排队的任务已满时抛出 ExecutorSaturated"""
+        with self._lock:
+            if self._in_flight >= self.workers + self.queue_size:
+                self._rejected += 1
+                raise ExecutorSaturated(self.name)
+            self._in_flight += 1
+        submitted = time.perf_counter()
+
+        def call():
+            started = time.perf_counter()
+            self._wait_ms.append((started - submitted) * 1000)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._run_ms.append((time.perf_counter() - started) * 1000)
+
+        def release(_):
+            # 任务真正结束（或排队中被取消）时才释放名额；请求方提前断开不影响计数
+            with self._lock:
+                self._in_flight -= 1
+                self._completed += 1
+
+        future = self._executor().submit(call)
+        future.add_done_callback(release)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> dict:
+        def pct(samples, p: float) -> Optional[float]:
+            samples = sorted(samples)
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))], 1)
+
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": self._in_flight,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "wait_ms": {"p50": pct(self._wait_ms, 0.5), "p99": pct(self._wait_ms, 0.99)},
+            "run_ms": {"p50": pct(self._run_ms, 0.5), "p99": pct(self._run_ms, 0.99)},
+        }
+
+
+password_executor = BoundedExecutor("password-hash", settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE)
+ldap_executor = BoundedExecutor("ldap", settings.LDAP_WORKERS, settings.LDAP_QUEUE)
@@ -0,0 +1,219 @@
+"""
+应用级共享 HTTP 客户端
+
+外部下载、AI 审核等出站请求不再每次新建 httpx.AsyncClient（每次都要重新握手 TLS），
+而是在 lifespan 中创建一组长期存活的客户端，按主机维护独立连接池并复用 keep-alive
+连接，关闭时等待进行中的请求结束后再释放连接。
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def origin_key(url: httpx.URL) -> Tuple[str, str, Optional[int]]:
+    return (url.scheme, (url.host or "").lower(), url.port)
+
+
+def http2_enabled() -> bool:
+    """HTTP/2 需要可选依赖 h2（pip install httpx[http2]）"""
+    if not settings.HTTP_CLIENT_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("HTTP_CLIENT_HTTP2 已开启但未安装 h2，回退为 HTTP/1.1")
+        return False
+    return True
+
+
+class _HostPool:
+    """单个主机的连接池及其使用计数"""
+
+    __slots__ = ("transport", "in_flight", "requests")
+
+    def __init__(self, transport: httpx.AsyncHTTPTransport):
+        self.transport = transport
+        self.in_flight = 0
+        self.requests = 0
+
+    def release(self):
+        self.in_flight -= 1
+
+    def stats(self) -> dict:
+        connections = getattr(getattr(self.transport, "_pool", None), "connections", [])
+        idle = sum(1 for c in connections if c.is_idle())
+        http2 = sum(1 for c in connections if "HTTP/2" in c.info())
+        return {
+            "connections": len(connections),
+            "active": len(connections) - idle,
+            "idle": idle,
+            "http2": http2,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+        }
+
+
+class _TrackedStream(httpx.AsyncByteStream):
+    """响应体读完或关闭时归还主机池的在途计数"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, pool: _HostPool):
+        self._stream = stream
+        self._pool = pool
+        self._released = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._pool.release()
+
+
+class HostPooledTransport(httpx.AsyncBaseTransport):
+    """每个 (scheme, host, port) 使用独立的连接池，从而实现按主机的连接上限。
+
+    连接池以主机名而非 IP 为键，保证同一条 TLS 连接只会服务一个主机名。
+    """
+
+    def __init__(
+        self,
+        limits: Optional[httpx.Limits] = None,
+        http2: Optional[bool] = None,
+        max_hosts: Optional[int] = None,
+    ):
+        self.limits = limits or httpx.Limits(
+            max_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS_PER_HOST,
+            max_keepalive_connections=settings.HTTP_CLIENT_MAX_KEEPALIVE_PER_HOST,
+            keepalive_expiry=settings.HTTP_CLIENT_KEEPALIVE_EXPIRY,
+        )
+        self.http2 = http2_enabled() if http2 is None else http2
+        self.max_hosts = max_hosts or settings.HTTP_CLIENT_MAX_HOSTS
+        self._pools: "OrderedDict[Tuple, _HostPool]" = OrderedDict()
+
+    def _pool_for(self, key: Tuple) -> _HostPool:
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = _HostPool(httpx.AsyncHTTPTransport(limits=self.limits, http2=self.http2))
+            self._pools[key] = pool
+        else:
+            self._pools.move_to_end(key)
+        return pool
+
+    async def _evict_idle_pools(self):
+        """主机数超过上限时关闭最久未使用且没有在途请求的连接池"""
+        while len(self._pools) > self.max_hosts:
+            victim = next((k for k, p in self._pools.items() if p.in_flight == 0), None)
+            if victim is None:
+                return
+            pool = self._pools.pop(victim)
+            await pool.transport.aclose()
+
+    async def _send(self, key: Tuple, request: httpx.Request) -> httpx.Response:
+        pool = self._pool_for(key)
+        pool.in_flight += 1
+        pool.requests += 1
+        try:
+            response = await pool.transport.handle_async_request(request)
+        except BaseException:
+            pool.release()
+            raise
+        await self._evict_idle_pools()
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_TrackedStream(response.stream, pool),
+            extensions=response.extensions,
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._send(origin_key(request.url), request)
+
+    @property
+    def in_flight(self) -> int:
+        return sum(p.in_flight for p in self._pools.values())
+
+    async def aclose(self):
+        pools = list(self._pools.values())
+        self._pools.clear()
+        for pool in pools:
+            await pool.transport.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "http2": self.http2,
+            "max_connections_per_host": self.limits.max_connections,
+            "hosts": {
+                f"{scheme}://{host}" + (f":{port}" if port else ""): pool.stats()
+                for (scheme, host, port), pool in self._pools.items()
+            },
+        }
+
+
+class HTTPClientRegistry:
+    """按名称管理共享客户端：outbound（带 SSRF 防护，用于下载外部文件）和 ai（调用大模型接口）"""
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._transports: Dict[str, HostPooledTransport] = {}
+
+    def _create(self, name: str) -> httpx.AsyncClient:
+        if name == "outbound":
+            from .validators import _SSRFSafeTransport
+            transport = _SSRFSafeTransport()
+            client = httpx.AsyncClient(transport=transport, follow_redirects=True, timeout=300.0)
+        elif name == "ai":
+            transport = HostPooledTransport()
+            client = httpx.AsyncClient(transport=transport, timeout=30.0)
+        else:
+            raise KeyError(f"未知的 HTTP 客户端: {name}")
+        self._transports[name] = transport
+        self._clients[name] = client
+        return client
+
+    async def startup(self):
+        for name in ("outbound", "ai"):
+            if name not in self._clients:
+                self._create(name)
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """获取共享客户端；lifespan 之外（如脚本）首次调用时按需创建"""
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._create(name)
+        return client
+
+    async def aclose(self, grace: Optional[float] = None):
+        """等待在途请求结束（最多 grace 秒）后关闭所有客户端"""
+        grace = settings.HTTP_CLIENT_SHUTDOWN_GRACE if grace is None else grace
+        deadline = time.monotonic() + grace
+        while time.monotonic() < deadline and any(t.in_flight for t in self._transports.values()):
+            await asyncio.sleep(0.1)
+
+        pending = sum(t.in_flight for t in self._transports.values())
+        if pending:
+            logger.warning(f"关闭 HTTP 客户端时仍有 {pending} 个请求未完成")
+
+        clients = list(self._clients.values())
+        self._clients.clear()
+        self._transports.clear()
+        for client in clients:
+            await client.aclose()
+
+    def stats(self) -> dict:
+        return {name: transport.stats() for name, transport in self._transports.items()}
+
+
+http_clients = HTTPClientRegistry()
@@ -0,0 +1,265 @@
+"""
+跨进程缓存失效总线
+
+每个 worker 的进程内缓存（搜索索引、配置、用户等）在其他 worker 写库后会过期。
+写操作在事务中调用 invalidation_bus.publish(db, kind, keys) 登记失效事件：
+
+- 本进程：事务提交后立即调用已订阅的处理函数（回滚则丢弃）；
+- PostgreSQL：同一事务内执行 pg_notify，提交后才会投递。每个 worker 在 lifespan 中
+  启动监听任务（LISTEN），收到其他进程的事件后调用本地处理函数。
+  监听连接断开重连期间可能漏掉事件，因此重连成功后会让所有订阅方整体失效一次。
+  事件循环不支持 add_reader 时（如 Windows 默认的 Proactor 循环），改为在线程中 select 等待通知。
+
+事件类型：config（配置键）、user（用户 ID，角色/状态/token_version 变化）、software（软件 ID）、
+vulnerability（漏洞所属的软件 ID）。
+"""
+import asyncio
+import json
+import logging
+import select
+import socket
+import time
+import uuid
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+EVENT_KINDS = ("config", "user", "software", "vulnerability")
+
+# NOTIFY 负载上限约 8000 字节，超出时改为整体失效
+_MAX_PAYLOAD = 7000
+
+# keys 为 None 表示该类型的缓存全部失效
+Handler = Callable[[Optional[List]], None]
+
+
+class InvalidationBus:
+    def __init__(self, channel: str):
+        self.channel = channel
+        self.origin = uuid.uuid4().hex[:12]
+        self._handlers: Dict[str, List[Handler]] = {kind: [] for kind in EVENT_KINDS}
+        self._task: Optional[asyncio.Task] = None
+        self._use_reader = True
+        self._connected = False
+        self._published = 0
+        self._received = 0
+        self._reconnects = 0
+        self._lag_ms: deque = deque(maxlen=1024)
+
+    # ---- 订阅与发布 ----
+
+    def subscribe(self, kind: str, handler: Handler):
+        if kind not in self._handlers:
+            raise ValueError(f"未知的失效事件类型: {kind}")
+        self._handlers[kind].append(handler)
+
+    def publish(self, db: Session, kind: str, keys: Optional[Iterable] = None):
+        """在当前事务中登记失效事件，提交后生效"""
+        if kind not in self._handlers:
+            raise ValueError(f"未知的失效事件类型: {kind}")
+        pending = db.info.setdefault("invalidations", {})
+        if keys is None or pending.get(kind, ()) is None:
+            pending[kind] = None
+        else:
+            pending.setdefault(kind, set()).update(keys)
+
+    def dispatch(self, kind: str, keys: Optional[List]):
+        for handler in self._handlers.get(kind, ()):
+            try:
+                handler(keys)
+            except Exception as e:
+                logger.exception(f"缓存失效处理失败 ({kind}): {e}")
+
+    def dispatch_all(self):
+        for kind in self._handlers:
+            self.dispatch(kind, None)
+
+    def _payloads(self, pending: dict) -> List[str]:
+        payloads = []
+        now = time.time()
+        for kind, keys in pending.items():
+            body = {"o": self.origin, "k": kind, "keys": sorted(keys) if keys is not None else None, "t": now}
+            payload = json.dumps(body, separators=(",", ":"))
+            if len(payload) > _MAX_PAYLOAD:
+                body["keys"] = None
+                payload = json.dumps(body, separators=(",", ":"))
+            payloads.append(payload)
+        return payloads
+
+    # ---- 监听 ----
+
+    def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        if not settings.DATABASE_URL.startswith("postgresql"):
+            # 单进程部署（如 SQLite）只需本地失效
+            return
+        loop = asyncio.get_running_loop()
+        self._use_reader = _supports_readers(loop)
+        if not self._use_reader:
+            logger.info(f"事件循环 {type(loop).__name__} 不支持 add_reader，缓存失效总线改为在线程中等待通知")
+        self._task = loop.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _connect(self):
+        from .database import engine
+
+        pooled = engine.raw_connection()
+        # 监听连接长期占用，不归还连接池
+        pooled.detach()
+        conn = pooled.driver_connection
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+        return conn
+
+    async def _listen(self):
+        loop = asyncio.get_running_loop()
+        backoff = 1.0
+        first = True
+        while True:
+            conn = None
+            try:
+                conn = await asyncio.to_thread(self._connect)
+                self._connected = True
+                backoff = 1.0
+                if not first:
+                    # 断线期间的事件已丢失
+                    self._reconnects += 1
+                    self.dispatch_all()
+                first = False
+                logger.info(f"缓存失效总线已连接: {self.channel}")
+
+                readable = asyncio.Event()
+                if self._use_reader:
+                    loop.add_reader(conn.fileno(), readable.set)
+                try:
+                    while True:
+                        if not await self._wait_readable(conn, readable, settings.INVALIDATION_KEEPALIVE):
+                            # 空闲时探活，及时发现断线
+                            with conn.cursor() as cursor:
+                                cursor.execute("SELECT 1")
+                        conn.poll()
+                        while conn.notifies:
+                            self._on_notify(conn.notifies.pop(0).payload)
+                finally:
+                    if self._use_reader:
+                        loop.remove_reader(conn.fileno())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"缓存失效总线连接中断，{backoff:.0f} 秒后重连: {e}")
+            finally:
+                self._connected = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    async def _wait_readable(self, conn, readable: asyncio.Event, timeout: float) -> bool:
+        """等待监听连接可读；超时返回 False"""
+        if self._use_reader:
+            try:
+                await asyncio.wait_for(readable.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return False
+            readable.clear()
+            return True
+        # 线程中 select：每次最多等 1 秒，停止监听时线程能很快结束
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            ready, _, _ = await asyncio.to_thread(select.select, [conn.fileno()], [], [], min(remaining, 1.0))
+            if ready:
+                return True
+
+    def _on_notify(self, payload: str):
+        try:
+            body = json.loads(payload)
+        except ValueError:
+            logger.warning(f"无法解析缓存失效事件: {payload[:200]}")
+            return
+        if body.get("o") == self.origin:
+            # 本进程的事件已在提交时处理
+            return
+        self._received += 1
+        if body.get("t"):
+            self._lag_ms.append((time.time() - body["t"]) * 1000)
+        self.dispatch(body.get("k"), body.get("keys"))
+
+    def stats(self) -> dict:
+        lags = sorted(self._lag_ms)
+
+        def pct(p: float) -> Optional[float]:
+            return round(lags[min(len(lags) - 1, int(len(lags) * p))], 2) if lags else None
+
+        return {
+            "channel": self.channel,
+            "listening": self._connected,
+            "wait_mode": "reader" if self._use_reader else "thread",
+            "published": self._published,
+            "received": self._received,
+            "reconnects": self._reconnects,
+            "lag_ms": {"p50": pct(0.5), "p99": pct(0.99), "max": round(lags[-1], 2) if lags else None},
+        }
+
+
+def _supports_readers(loop: asyncio.AbstractEventLoop) -> bool:
+    """事件循环能否监听套接字可读（Windows 的 Proactor 循环不支持 add_reader）"""
+    reader, writer = socket.socketpair()
+    try:
+        loop.add_reader(reader.fileno(), lambda: None)
+        loop.remove_reader(reader.fileno())
+        return True
+    except NotImplementedError:
+        return False
+    finally:
+        reader.close()
+        writer.close()
+
+
+invalidation_bus = InvalidationBus(settings.INVALIDATION_CHANNEL)
+
+
+@event.listens_for(Session, "before_commit")
+def _notify_invalidations(session: Session):
+    pending = session.info.get("invalidations")
+    if not pending or session.get_bind().dialect.name != "postgresql":
+        return
+    for payload in invalidation_bus._payloads(pending):
+        session.execute(text("SELECT pg_notify(:channel, :payload)"), {
+            "channel": invalidation_bus.channel,
+            "payload": payload
+        })
+        invalidation_bus._published += 1
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_invalidations(session: Session):
+    pending = session.info.pop("invalidations", None)
+    for kind, keys in (pending or {}).items():
+        invalidation_bus.dispatch(kind, sorted(keys) if keys is not None else None)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_invalidations(session: Session):
+    session.info.pop("invalidations", None)
@@ -0,0 +1,125 @@
+"""
+流式读取大型 JSON 文件中的数组
+
+NVD 等数据源的 JSON 文件可达数百 MB，整体 json.load 会占用数倍于文件的内存。
+这里按块读取文本：先只跟踪字符串与括号层级（用正则跳到下一个结构字符），
+找到顶层对象中指定键的数组；之后逐个用 raw_decode 解析数组元素，
+元素跨越块边界时再读入一块重试。内存占用只与单个元素的大小有关。
+"""
+import json
+import re
+from typing import IO, Any, Iterator, Optional
+
+# 字符串外只关心引号和括号；字符串内只关心引号和转义符
+_STRUCTURE_RE = re.compile(r'["{}\[\]]')
+_STRING_END_RE = re.compile(r'["\\]')
+_SEPARATOR_RE = re.compile(r'[\s,]*')
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+# 单个元素的上限，防止损坏的文件把整个剩余内容读进内存
+MAX_ITEM_SIZE = 64 << 20
+
+_decoder = json.JSONDecoder()
+
+
+def _string_end(buf: str, start: int) -> Optional[int]:
+    """返回从 start 开始的字符串的结束引号位置；数据不完整时返回 None"""
+    i = start
+    while True:
+        m = _STRING_END_RE.search(buf, i)
+        if m is None:
+            return None
+        if m.group() == '"':
+            return m.start()
+        # 转义符后面的字符原样跳过
+        if m.start() + 1 >= len(buf):
+            return None
+        i = m.start() + 2
+
+
+class _Reader:
+    def __init__(self, fp: IO[str], chunk_size: int):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.eof = False
+
+    def more(self, keep_from: int) -> int:
+        """丢弃 keep_from 之前已处理的内容并读入一块；返回被丢弃的长度"""
+        self.buf = self.buf[keep_from:]
+        chunk = self.fp.read(self.chunk_size)
+        if chunk:
+            self.buf += chunk
+        else:
+            self.eof = True
+        return keep_from
+
+
+def _seek_array(reader: _Reader, key: str) -> Optional[int]:
+    """定位顶层对象中 key 对应数组的 '[' 之后的位置；找不到时返回 None"""
+    pos = 0
+    depth = 0
+    last_string: Optional[str] = None  # 顶层对象中最近读到的字符串（键或值）
+    while True:
+        buf = reader.buf
+        m = _STRUCTURE_RE.search(buf, pos)
+        end = _string_end(buf, m.start() + 1) if m is not None and m.group() == '"' else None
+        if m is None or (m.group() == '"' and end is None):
+            if reader.eof:
+                return None
+            # 未读完的字符串从开头重新扫描
+            resume = m.start() if m is not None else len(buf)
+            pos = resume - reader.more(resume)
+            continue
+
+        ch = m.group()
+        if ch == '"':
+            if depth == 1:
+                last_string = buf[m.start() + 1:end]
+            pos = end + 1
+        elif ch in "{[":
+            if ch == "[" and depth == 1 and last_string == key:
+                return m.end()
+            depth += 1
+            pos = m.end()
+        else:
+            depth -= 1
+            pos = m.end()
+
+
+def iter_json_array(fp: IO[str], key: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Any]:
+    """逐个返回顶层对象中 key 对应数组的元素（fp 为文本模式文件）。
+
+    找不到该键时不返回任何元素；文件在数组结束前截断或格式错误时抛出 ValueError。
+    """
+    reader = _Reader(fp, chunk_size)
+    pos = _seek_array(reader, key)
+    if pos is None:
+        return
+
+    while True:
+        pos = _SEPARATOR_RE.match(reader.buf, pos).end()
+        if pos >= len(reader.buf):
+            if reader.eof:
+                raise ValueError("JSON 数据不完整")
+            pos -= reader.more(pos)
+            continue
+        if reader.buf[pos] == "]":
+            return
+        try:
+            item, end = _decoder.raw_decode(reader.buf, pos)
+            after = _SEPARATOR_RE.match(reader.buf, end).end()
+            # 元素后面必须是 ',' 或 ']'；否则可能是被块边界截断的数字（如 "2." 之后的部分还没读到）
+            complete = after < len(reader.buf) and (reader.buf[after] == "]" or "," in reader.buf[end:after])
+        except json.JSONDecodeError as e:
+            error, complete = e, False
+        else:
+            error = None
+        if not complete:
+            # 元素跨越了块边界：读入更多内容后重试
+            if reader.eof or len(reader.buf) - pos > MAX_ITEM_SIZE:
+                raise ValueError(f"JSON 数据不完整或格式错误: {error or reader.buf[pos:pos + 50]}")
+            pos -= reader.more(pos)
+            continue
+        yield item
+        pos = end
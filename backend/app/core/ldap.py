@@ -1,118 +1,460 @@
 import logging
-from typing import Optional
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterator, Optional, Tuple
 
 from ldap3 import Server, Connection, ALL, SUBTREE
-from ldap3.core.exceptions import LDAPException
-from sqlalchemy.orm import Session
+from ldap3.core.exceptions import LDAPBindError, LDAPCommunicationError, LDAPException, LDAPResponseTimeoutError
+from ldap3.utils.conv import escape_filter_chars
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..models.user import User, UserRole
-from ..core.security import get_password_hash
+from ..core.executors import ExecutorSaturated, ldap_executor
+from ..core.security import get_password_hash_async
+from ..core.invalidation import invalidation_bus
+from ..core.config import settings
+from ..core.runtime_config import LdapConfig, config_service
 import secrets
 
 logger = logging.getLogger(__name__)
 
-LDAP_CONFIG_KEYS = [
-    "ldap_enabled",
-    "ldap_server_url",
-    "ldap_bind_dn",
-    "ldap_bind_password",
-    "ldap_base_dn",
-    "ldap_user_filter",
-    "ldap_default_role",
-]
+# 目录用户的本地密码占位（不是有效哈希，不能用于本地登录；LDAP 用户也不会走本地密码验证）
+UNUSABLE_PASSWORD = "!ldap"
 
 
-def _get_ldap_config(db: Session) -> dict:
-    """从数据库读取 LDAP 配置"""
-    from ..models.config import Config
-    configs = db.query(Config).filter(Config.key.in_(LDAP_CONFIG_KEYS)).all()
-    return {c.key: c.value for c in configs}
+class LdapUnavailable(Exception):
+    """目录服务不可用（连接失败或熔断中）"""
 
 
-def ldap_authenticate(username: str, password: str, db: Session) -> Optional[User]:
-    """
-    通过 LDAP/AD 认证用户。
-    成功返回 User 对象（自动创建/更新本地记录），失败返回 None。
-    """
-    config = _get_ldap_config(db)
+# 连接层面的错误（网络中断、超时、服务端断开）：计入熔断，池中的连接直接丢弃
+_COMMUNICATION_ERRORS = (LDAPCommunicationError, LDAPResponseTimeoutError, LDAPBindError, OSError)
 
-    if config.get("ldap_enabled", "false").lower() != "true":
-        return None
 
-    server_url = config.get("ldap_server_url", "").strip()
-    bind_dn = config.get("ldap_bind_dn", "").strip()
-    bind_password = config.get("ldap_bind_password", "").strip()
-    base_dn = config.get("ldap_base_dn", "").strip()
-    user_filter = config.get("ldap_user_filter", "(sAMAccountName={username})").strip()
-    default_role = config.get("ldap_default_role", "user").strip()
+class _ConnectionPool:
+    """线程安全的 LDAP 连接池：借出前丢弃已关闭或空闲过久的连接（服务端通常会断开长时间空闲的连接）"""
 
-    if not all([server_url, base_dn]):
-        logger.warning("LDAP 配置不完整，缺少 server_url 或 base_dn")
-        return None
+    def __init__(self, factory: Callable[[], Connection], max_idle: int, idle_timeout: float):
+        self.factory = factory
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self._idle: Deque[Tuple[float, Connection]] = deque()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
 
-    try:
-        server = Server(server_url, get_info=ALL, connect_timeout=10)
+    def acquire(self) -> Tuple[Connection, bool]:
+        """返回 (连接, 是否复用的旧连接)"""
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                idle_since, conn = self._idle.pop()
+            if conn.closed or now - idle_since > self.idle_timeout:
+                self.discard(conn)
+                continue
+            self.reused += 1
+            return conn, True
+        conn = self.factory()
+        self.created += 1
+        return conn, False
+
+    def release(self, conn: Connection):
+        with self._lock:
+            if len(self._idle) < self.max_idle and not conn.closed:
+                self._idle.append((time.monotonic(), conn))
+                return
+        self.discard(conn)
+
+    def discard(self, conn: Connection):
+        self.discarded += 1
+        try:
+            conn.unbind()
+        except Exception:
+            pass
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for _, conn in idle:
+            self.discard(conn)
+
+    def stats(self) -> dict:
+        return {"idle": len(self._idle), "created": self.created, "reused": self.reused, "discarded": self.discarded}
+
+
+class CircuitBreaker:
+    """连续 threshold 次连接失败后熔断 cooldown 秒，期间直接拒绝；冷却后放行一次试探，成功即恢复"""
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+        self.trips = 0
+        self.rejected = 0
+
+    def before_call(self) -> bool:
+        """熔断中拒绝调用；返回本次调用是否为冷却后的试探"""
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if time.monotonic() - self._opened_at >= self.cooldown and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+        raise LdapUnavailable("目录服务暂不可用")
+
+    def release_probe(self):
+        """试探以成功/失败之外的方式结束（如非连接类异常）时释放试探名额，下一次调用重新试探"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.threshold:
+                if self._opened_at is None or self._probing:
+                    self.trips += 1
+                self._opened_at = time.monotonic()
+                self._probing = False
 
-        # 1. 用绑定账号连接并搜索用户
-        search_filter = user_filter.replace("{username}", username)
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half-open" if self._probing else "open"
 
-        if bind_dn and bind_password:
-            admin_conn = Connection(server, user=bind_dn, password=bind_password, auto_bind=True, receive_timeout=10)
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self._failures, "trips": self.trips, "rejected": self.rejected}
+
+
+class LdapDirectory:
+    """一套 LDAP 配置对应的目录服务客户端（在 ldap_executor 线程中使用）
+
+    - 服务账号连接池：连接建立时绑定一次服务账号，用于搜索用户；
+    - 认证连接池：只用于以用户 DN + 密码重新绑定来验证密码，省去每次登录的 TCP/TLS 握手；
+    - 服务器信息与 schema 只在第一个连接上读取一次；
+    - 用户名 -> DN 的查找结果缓存 dn_cache_ttl 秒，缓存命中时登录只需一次绑定；
+    - 连接失败计入熔断器，熔断期间立即失败，不再每次等待连接超时。
+    """
+
+    def __init__(self, config: LdapConfig):
+        self.server_url = config.server_url
+        self.bind_dn = config.bind_dn
+        self.bind_password = config.bind_password
+        self.base_dn = config.base_dn
+        self.user_filter = config.user_filter
+        self.server = Server(self.server_url, get_info=ALL, connect_timeout=settings.LDAP_CONNECT_TIMEOUT)
+        self._service_pool = _ConnectionPool(self._service_connection, settings.LDAP_POOL_SIZE, settings.LDAP_POOL_IDLE_TIMEOUT)
+        self._auth_pool = _ConnectionPool(self._auth_connection, settings.LDAP_POOL_SIZE, settings.LDAP_POOL_IDLE_TIMEOUT)
+        self.breaker = CircuitBreaker(settings.LDAP_BREAKER_THRESHOLD, settings.LDAP_BREAKER_COOLDOWN)
+        self._dn_cache: Dict[str, Tuple[float, str, Optional[str]]] = {}
+        self._dn_lock = threading.Lock()
+        self.dn_cache_hits = 0
+
+    @staticmethod
+    def config_key(config: LdapConfig) -> tuple:
+        return config.server_url, config.bind_dn, config.bind_password, config.base_dn, config.user_filter
+
+    # ---- 连接 ----
+
+    def _service_connection(self) -> Connection:
+        if self.bind_dn and self.bind_password:
+            conn = Connection(self.server, user=self.bind_dn, password=self.bind_password,
+                              receive_timeout=settings.LDAP_RECEIVE_TIMEOUT)
         else:
             # 匿名绑定
-            admin_conn = Connection(server, auto_bind=True, receive_timeout=10)
+            conn = Connection(self.server, receive_timeout=settings.LDAP_RECEIVE_TIMEOUT)
+        # 服务器信息与 schema 只读取一次，之后的连接共用
+        if not conn.bind(read_server_info=self.server.info is None):
+            conn.unbind()
+            raise LDAPBindError(f"服务账号绑定失败: {conn.result.get('description')}")
+        return conn
+
+    def _auth_connection(self) -> Connection:
+        return Connection(self.server, receive_timeout=settings.LDAP_RECEIVE_TIMEOUT)
+
+    def _with_connection(self, pool: _ConnectionPool, operation: Callable[[Connection], Any]) -> Any:
+        """借出连接执行操作；复用的旧连接出现连接错误时换新连接重试一次，新连接也失败才计入熔断"""
+        probe = self.breaker.before_call()
+        try:
+            while True:
+                try:
+                    conn, reused = pool.acquire()
+                except _COMMUNICATION_ERRORS as e:
+                    self.breaker.record_failure()
+                    raise LdapUnavailable(f"无法连接目录服务: {e}") from e
+                try:
+                    result = operation(conn)
+                except _COMMUNICATION_ERRORS as e:
+                    pool.discard(conn)
+                    if reused:
+                        continue
+                    self.breaker.record_failure()
+                    raise LdapUnavailable(f"目录服务连接失败: {e}") from e
+                except Exception:
+                    pool.discard(conn)
+                    raise
+                pool.release(conn)
+                self.breaker.record_success()
+                return result
+        finally:
+            if probe:
+                # 已记录成功/失败时试探标记已清除；其他异常退出时也要清除，否则熔断器一直停在半开状态
+                self.breaker.release_probe()
 
-        admin_conn.search(
-            search_base=base_dn,
-            search_filter=search_filter,
-            search_scope=SUBTREE,
-            attributes=["mail"]
+    # ---- 查找与认证 ----
+
+    def _search_user(self, username: str) -> Optional[Tuple[str, Optional[str]]]:
+        search_filter = self.user_filter.replace("{username}", escape_filter_chars(username))
+
+        def search(conn: Connection):
+            conn.search(search_base=self.base_dn, search_filter=search_filter, search_scope=SUBTREE, attributes=["mail"])
+            if not conn.entries:
+                return None
+            entry = conn.entries[0]
+            mail = str(entry.mail.value) if "mail" in entry and entry.mail.value else None
+            return entry.entry_dn, mail
+
+        return self._with_connection(self._service_pool, search)
+
+    def _bind_user(self, user_dn: str, password: str) -> bool:
+        return self._with_connection(
+            self._auth_pool, lambda conn: conn.rebind(user=user_dn, password=password, read_server_info=False)
         )
 
-        if not admin_conn.entries:
-            logger.info(f"LDAP 搜索未找到用户: {username}")
-            admin_conn.unbind()
+    def _cached_dn(self, username: str) -> Optional[Tuple[str, Optional[str]]]:
+        key = username.lower()
+        with self._dn_lock:
+            entry = self._dn_cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._dn_cache[key]
+                return None
+        self.dn_cache_hits += 1
+        return entry[1], entry[2]
+
+    def _remember_dn(self, username: str, user_dn: str, mail: Optional[str]):
+        with self._dn_lock:
+            if len(self._dn_cache) >= settings.LDAP_DN_CACHE_SIZE:
+                # 超出上限时先清理过期项，仍然过多则整体清空
+                now = time.monotonic()
+                self._dn_cache = {k: v for k, v in self._dn_cache.items() if v[0] > now}
+                if len(self._dn_cache) >= settings.LDAP_DN_CACHE_SIZE:
+                    self._dn_cache.clear()
+            self._dn_cache[username.lower()] = (time.monotonic() + settings.LDAP_DN_CACHE_TTL, user_dn, mail)
+
+    def _forget_dn(self, username: str):
+        with self._dn_lock:
+            self._dn_cache.pop(username.lower(), None)
+
+    def verify(self, username: str, password: str) -> Optional[dict]:
+        """验证用户名和密码，成功返回 {"dn", "mail"}；用户不存在或密码错误返回 None"""
+        if not password:
+            # 空密码的简单绑定在很多目录服务上等同匿名绑定，必须拒绝
             return None
+        cached = self._cached_dn(username)
+        if cached is not None:
+            if self._bind_user(cached[0], password):
+                return {"dn": cached[0], "mail": cached[1]}
+            # 可能是密码错误，也可能用户已被移动：丢弃缓存后重新搜索
+            self._forget_dn(username)
 
-        user_entry = admin_conn.entries[0]
-        user_dn = user_entry.entry_dn
-        user_mail = str(user_entry.mail.value) if hasattr(user_entry, 'mail') and user_entry.mail.value else None
+        found = self._search_user(username)
+        if found is None:
+            logger.info(f"LDAP 搜索未找到用户: {username}")
+            return None
+        user_dn, mail = found
+        if cached is not None and user_dn.lower() == cached[0].lower():
+            # DN 没变，就是密码错误：不再用同一密码重复绑定（每次失败绑定都计入目录服务的账号锁定次数）
+            self._remember_dn(username, user_dn, mail)
+            return None
+        if not self._bind_user(user_dn, password):
+            return None
+        self._remember_dn(username, user_dn, mail)
+        return {"dn": user_dn, "mail": mail}
 
-        admin_conn.unbind()
+    # ---- 批量同步 ----
 
-        # 2. 用用户的 DN + 密码做 bind 验证
-        user_conn = Connection(server, user=user_dn, password=password, auto_bind=True, receive_timeout=10)
-        user_conn.unbind()
+    @property
+    def username_attribute(self) -> str:
+        """从用户过滤器中取出用户名对应的属性，如 (sAMAccountName={username}) -> sAMAccountName"""
+        match = re.search(r"\(([\w-]+)=\{username\}\)", self.user_filter)
+        return match.group(1) if match else "sAMAccountName"
 
-        # 3. 认证成功，创建或更新本地用户
-        role_map = {"admin": UserRole.ADMIN, "ops": UserRole.OPS, "user": UserRole.USER}
-        role = role_map.get(default_role, UserRole.USER)
+    def iter_users(self, page_size: int, conn: Optional[Connection] = None) -> Iterator[Tuple[str, Optional[str]]]:
+        """分页（RFC 2696 simple paged results）遍历目录中的全部用户，逐个产出 (用户名, 邮箱)
 
-        local_user = db.query(User).filter(User.username == username).first()
-        if local_user:
-            # 更新已有用户的信息
-            if user_mail and not local_user.email:
-                local_user.email = user_mail
-            local_user.auth_source = "ldap"
-        else:
-            # 创建新用户
-            local_user = User(
-                username=username,
-                hashed_password=get_password_hash(secrets.token_hex(32)),
-                email=user_mail,
-                role=role,
-                auth_source="ldap"
+        每次只向目录服务请求一页，内存占用与目录规模无关。遍历时间可能较长，
+        使用单独的服务账号连接，不占用登录的连接池。
+        """
+        own_connection = conn is None
+        if own_connection:
+            conn = self._service_connection()
+        attribute = self.username_attribute
+        search_filter = self.user_filter.replace("{username}", "*")
+        try:
+            entries = conn.extend.standard.paged_search(
+                search_base=self.base_dn, search_filter=search_filter, search_scope=SUBTREE,
+                attributes=[attribute, "mail"], paged_size=page_size, generator=True
             )
-            db.add(local_user)
+            for entry in entries:
+                if entry.get("type") != "searchResEntry":
+                    continue
+                attributes = entry.get("attributes", {})
+                username, mail = _first_value(attributes.get(attribute)), _first_value(attributes.get("mail"))
+                if username:
+                    yield str(username), str(mail) if mail else None
+        finally:
+            if own_connection:
+                conn.unbind()
+
+    def close(self):
+        self._service_pool.close()
+        self._auth_pool.close()
+
+    def stats(self) -> dict:
+        return {
+            "server": self.server_url,
+            "breaker": self.breaker.stats(),
+            "service_pool": self._service_pool.stats(),
+            "auth_pool": self._auth_pool.stats(),
+            "cached_dns": len(self._dn_cache),
+            "dn_cache_hits": self.dn_cache_hits,
+        }
+
+
+def _first_value(value):
+    # 未加载 schema 时属性值都是列表
+    if isinstance(value, (list, tuple)):
+        return value[0] if value else None
+    return value
+
+
+_directory: Optional[LdapDirectory] = None
+_directory_key: Optional[tuple] = None
+_directory_lock = threading.Lock()
 
-        db.commit()
-        db.refresh(local_user)
-        logger.info(f"LDAP 用户认证成功: {username}")
-        return local_user
 
+def get_directory(config: LdapConfig) -> LdapDirectory:
+    """返回当前配置对应的目录服务客户端；配置变化时重建（连接池、DN 缓存、熔断状态随之重置）"""
+    global _directory, _directory_key
+    key = LdapDirectory.config_key(config)
+    with _directory_lock:
+        if _directory is None or _directory_key != key:
+            if _directory is not None:
+                _directory.close()
+            _directory = LdapDirectory(config)
+            _directory_key = key
+        return _directory
+
+
+def close_directory():
+    global _directory, _directory_key
+    with _directory_lock:
+        if _directory is not None:
+            _directory.close()
+        _directory = None
+        _directory_key = None
+
+
+def directory_stats() -> Optional[dict]:
+    directory = _directory
+    return directory.stats() if directory is not None else None
+
+
+def _ldap_verify(config: LdapConfig, username: str, password: str) -> Optional[dict]:
+    """阻塞的 LDAP 网络操作（在 ldap_executor 中运行，不访问数据库）"""
+    return get_directory(config).verify(username, password)
+
+
+async def ldap_authenticate(username: str, password: str, db: AsyncSession) -> Optional[User]:
+    """
+    通过 LDAP/AD 认证用户。
+    成功返回 User 对象（自动创建/更新本地记录），失败返回 None。
+    目录服务的网络操作在 ldap_executor 中执行；执行器已满时抛出 ExecutorSaturated，
+    目录服务连不上或处于熔断中时抛出 LdapUnavailable。
+    """
+    config = (await config_service.get_async(db)).ldap
+
+    if not config.enabled:
+        return None
+
+    if not config.complete:
+        logger.warning("LDAP 配置不完整，缺少 server_url 或 base_dn")
+        return None
+
+    # 归还数据库连接后再等待目录服务
+    await db.commit()
+    try:
+        entry = await ldap_executor.run(_ldap_verify, config, username, password)
+    except (ExecutorSaturated, LdapUnavailable):
+        raise
     except LDAPException as e:
         logger.warning(f"LDAP 认证失败 ({username}): {e}")
         return None
     except Exception as e:
         logger.error(f"LDAP 认证异常 ({username}): {e}")
         return None
+    if entry is None:
+        return None
+
+    # 3. 认证成功，创建或更新本地用户
+    role_map = {"admin": UserRole.ADMIN, "ops": UserRole.OPS, "user": UserRole.USER}
+    role = role_map.get(config.default_role, UserRole.USER)
+    user_mail = entry["mail"]
+
+    local_user = await db.scalar(select(User).where(User.username == username))
+    if local_user:
+        # 更新已有用户的信息
+        if user_mail and not local_user.email:
+            local_user.email = user_mail
+        local_user.auth_source = "ldap"
+        # 已登录会话缓存的用户信息随之刷新
+        invalidation_bus.publish(db, "user", [local_user.id])
+    else:
+        # 创建新用户（本地密码为随机值，不可用于本地登录）；计算哈希前先归还连接
+        await db.commit()
+        local_user = User(
+            username=username,
+            hashed_password=await get_password_hash_async(secrets.token_hex(32)),
+            email=user_mail,
+            role=role,
+            auth_source="ldap"
+        )
+        db.add(local_user)
+
+    await db.commit()
+    await db.refresh(local_user)
+    logger.info(f"LDAP 用户认证成功: {username}")
+    return local_user
+
+
+def ldap_test_connection(config: LdapConfig) -> str:
+    """阻塞：用绑定账号连接目录服务，返回服务器名称（在 ldap_executor 中运行）"""
+    server_url = config.server_url
+    bind_dn = config.bind_dn
+    bind_password = config.bind_password
+
+    server = Server(server_url, get_info=ALL, connect_timeout=10)
+    if bind_dn and bind_password:
+        conn = Connection(server, user=bind_dn, password=bind_password, auto_bind=True, receive_timeout=10)
+    else:
+        conn = Connection(server, auto_bind=True, receive_timeout=10)
+    info = server.info
+    conn.unbind()
+    return info.other.get('serverName', [server_url])[0] if info and info.other else server_url
@@ -0,0 +1,193 @@
+"""
+列表分页
+
+支持两种翻页方式：
+- skip/limit：兼容旧接口，深分页时数据库仍要扫描并丢弃前面的所有行；
+- cursor：不透明的游标（上一页最后一行的排序键），沿索引直接定位下一页，
+  翻页深度不影响速度，适合无限滚动。排序键最后一项必须是主键，保证顺序稳定、不重不漏。
+
+总数可选（count 参数）：exact 精确 COUNT；estimated 使用 PostgreSQL 规划器估算
+（其他数据库按 exact 处理）；none 不计算。未指定时 skip/limit 翻页默认 exact（兼容现有前端），
+游标翻页默认 none。
+"""
+import base64
+import json
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from enum import Enum
+from typing import Any, List, Optional, Sequence
+
+from fastapi import HTTPException, Query
+from sqlalchemy import DateTime, Select, String, func, select, tuple_, type_coerce
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+
+class CountMode(str, Enum):
+    EXACT = "exact"
+    ESTIMATED = "estimated"
+    NONE = "none"
+
+
+@dataclass
+class PageParams:
+    skip: int
+    limit: int
+    cursor: Optional[str] = None
+    count: Optional[CountMode] = None
+
+    @property
+    def count_mode(self) -> CountMode:
+        if self.count is not None:
+            return self.count
+        return CountMode.NONE if self.cursor else CountMode.EXACT
+
+
+@dataclass
+class Page:
+    items: List[Any]
+    total: Optional[int]
+    next_cursor: Optional[str]
+
+
+def page_params(default_limit: int = 20, max_limit: int = 100):
+    """分页参数依赖：skip/limit/cursor/count"""
+    def dependency(
+        skip: int = Query(0, ge=0),
+        limit: int = Query(default_limit, ge=1, le=max_limit),
+        cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+        count: Optional[CountMode] = Query(None, description="总数：exact / estimated / none")
+    ) -> PageParams:
+        return PageParams(skip=skip, limit=limit, cursor=cursor, count=count)
+    return dependency
+
+
+# ---- 游标编码 ----
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and "dt" in value:
+        return datetime.fromisoformat(value["dt"])
+    return value
+
+
+def encode_cursor(key: str, values: Optional[Sequence] = None, offset: Optional[int] = None) -> str:
+    """游标内容：排序名称 + 排序键（或偏移量，用于按相关度排序等无法走索引定位的列表）"""
+    state = {"s": key}
+    if offset is not None:
+        state["o"] = offset
+    else:
+        state["v"] = [_encode_value(v) for v in values]
+    raw = json.dumps(state, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, key: str) -> dict:
+    invalid = HTTPException(status_code=400, detail="无效的分页游标")
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        state = json.loads(raw)
+    except (ValueError, TypeError):
+        raise invalid
+    if not isinstance(state, dict) or state.get("s") != key:
+        raise invalid
+    if "o" in state:
+        if not isinstance(state["o"], int) or state["o"] < 0:
+            raise invalid
+        return state
+    if not isinstance(state.get("v"), list):
+        raise invalid
+    try:
+        state["v"] = [_decode_value(v) for v in state["v"]]
+    except (ValueError, TypeError):
+        raise invalid
+    return state
+
+
+# ---- 总数 ----
+
+def _dialect_name(db: AsyncSession) -> str:
+    return db.bind.dialect.name
+
+
+async def _estimate_count(db: AsyncSession, stmt: Select) -> Optional[int]:
+    """PostgreSQL：读取 EXPLAIN 的估算行数；失败时返回 None"""
+    stmt = stmt.order_by(None)
+    sql = str(stmt.compile(dialect=db.bind.dialect, compile_kwargs={"literal_binds": True}))
+    try:
+        # 放在保存点里，EXPLAIN 失败不影响当前事务
+        async with db.begin_nested():
+            conn = await db.connection()
+            plan = (await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    except Exception as e:
+        logger.debug(f"估算总数失败，改用精确计数: {e}")
+        return None
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+async def count_total(db: AsyncSession, stmt: Select, mode: CountMode) -> Optional[int]:
+    if mode == CountMode.NONE:
+        return None
+    if mode == CountMode.ESTIMATED and _dialect_name(db) == "postgresql":
+        estimate = await _estimate_count(db, stmt)
+        if estimate is not None:
+            return estimate
+    # 与 Query.count() 相同：对去掉排序的语句外包一层 COUNT（子查询中不渲染预加载）
+    return await db.scalar(select(func.count()).select_from(stmt.order_by(None).subquery()))
+
+
+# ---- 分页 ----
+
+async def paginate(
+    db: AsyncSession,
+    stmt: Select,
+    params: PageParams,
+    key: str,
+    order_by: Sequence,
+    descending: bool = True
+) -> Page:
+    """按 order_by（最后一项为主键）排序分页；stmt 为 select(实体)；key 用于区分不同列表的游标"""
+    total = await count_total(db, stmt, params.count_mode)
+
+    if _dialect_name(db) == "sqlite":
+        # SQLite 以文本保存时间，服务端默认值与 ORM 写入的格式不同（是否带微秒），
+        # 游标直接使用库中的原始文本比较
+        order_by = [type_coerce(expr, String) if isinstance(expr.type, DateTime) else expr for expr in order_by]
+
+    sort_keys = [expr.label(f"_sort_{i}") for i, expr in enumerate(order_by)]
+    ordered = stmt.add_columns(*sort_keys).order_by(
+        *(expr.desc() if descending else expr.asc() for expr in order_by)
+    )
+
+    offset = params.skip
+    if params.cursor:
+        state = decode_cursor(params.cursor, key)
+        if "o" in state:
+            offset = state["o"]
+        else:
+            if len(state["v"]) != len(order_by):
+                raise HTTPException(status_code=400, detail="无效的分页游标")
+            position = tuple_(*order_by)
+            boundary = tuple_(*state["v"])
+            ordered = ordered.where(position < boundary if descending else position > boundary)
+            offset = 0
+
+    # 多取一行判断是否还有下一页
+    rows = (await db.execute(ordered.offset(offset).limit(params.limit + 1))).all()
+    has_more = len(rows) > params.limit
+    rows = rows[:params.limit]
+
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(key, values=list(rows[-1][1:]))
+
+    return Page(items=[row[0] for row in rows], total=total, next_cursor=next_cursor)
@@ -0,0 +1,116 @@
+"""
+已认证用户（principal）缓存
+
+每个带 token 的请求都要确认用户仍然存在、未被禁用、token_version 与 token 一致。
+这里按用户 ID 缓存鉴权需要的少量字段（LRU + TTL），命中时不再查询 users 表：
+
+- 管理员修改角色/状态或删除用户时会递增 token_version 并发布 user 失效事件，
+  本进程和其他 worker（经失效总线）提交后立即丢弃对应缓存；
+- TTL 兜底可能漏掉的事件；token 中的 token_version 比缓存新时也会重新加载。
+
+未命中时用单独的短会话查询，查完即归还连接：鉴权依赖不会让请求在整个响应期间（如大文件下载）占用数据库连接。
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select
+
+from .config import settings
+from .database import AsyncSessionLocal
+from .invalidation import invalidation_bus
+from ..models.user import User, UserRole
+
+
+@dataclass(frozen=True)
+class Principal:
+    """当前登录用户的只读快照（字段与 UserResponse 一致，可直接作为 /auth/me 的响应）"""
+    id: int
+    username: str
+    email: Optional[str]
+    role: UserRole
+    is_active: bool
+    token_version: int
+    created_at: datetime
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            role=user.role,
+            is_active=bool(user.is_active),
+            token_version=user.token_version or 0,
+            created_at=user.created_at,
+        )
+
+
+class PrincipalCache:
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, tuple[float, Principal]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 每次失效递增；加载期间发生过失效的结果不写入缓存
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+
+    def _get(self, user_id: int) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    async def load(self, user_id: int, token_version: int = 0) -> Optional[Principal]:
+        """返回用户的 principal；未命中、过期或 token 比缓存新时查库。用户不存在返回 None"""
+        principal = self._get(user_id)
+        if principal is not None and principal.token_version >= token_version:
+            self._hits += 1
+            return principal
+        self._misses += 1
+        generation = self._generation
+        # 始终读主库：禁用用户、token_version 递增要立即生效，不能读到延迟的副本
+        async with AsyncSessionLocal(info={"replica": False}) as db:
+            user = await db.scalar(select(User).where(User.id == user_id))
+        if user is None:
+            return None
+        principal = Principal.from_user(user)
+        with self._lock:
+            if generation == self._generation:
+                self._entries[user_id] = (time.monotonic() + self.ttl, principal)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return principal
+
+    def on_invalidate(self, user_ids):
+        with self._lock:
+            self._generation += 1
+            if user_ids is None:
+                self._entries.clear()
+            else:
+                for user_id in user_ids:
+                    self._entries.pop(user_id, None)
+
+    def stats(self) -> dict:
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+principal_cache = PrincipalCache(settings.PRINCIPAL_CACHE_TTL, settings.PRINCIPAL_CACHE_SIZE)
+invalidation_bus.subscribe("user", principal_cache.on_invalidate)
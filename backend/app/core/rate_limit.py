@@ -0,0 +1,213 @@
+"""
+滑动窗口速率限制
+
+按「滑动窗口计数」估算最近 window 秒内的请求数：每个键只保存当前与上一个固定窗口的计数，
+估算值 = 上一窗口计数 × 上一窗口仍在滑动窗口内的比例 + 当前窗口计数，每次检查 O(1)。
+被拒绝的请求同样计数，持续重试的客户端会一直被限制。
+
+计数存放位置（RATE_LIMIT_BACKEND）：
+
+- database：rate_limit_counters 表（PostgreSQL 上为 UNLOGGED 表，不写 WAL），所有 worker 共用同一份计数；
+  过期计数定期删除，表大小只与活跃键数有关；
+- memory：进程内 LRU + TTL，键数有上限；多 worker 部署时每个 worker 各自计数。
+
+用法：接口依赖 Depends(rate_limit("download", limit, window, per_user=True))，
+或直接调用 await rate_limiter.hit(key, limit, window)。limit <= 0 表示不限制。
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi import Depends, HTTPException, Request, status
+from sqlalchemy import text
+
+from .config import settings
+from .database import async_engine
+from .deps import get_current_active_user
+from .principals import Principal
+
+logger = logging.getLogger(__name__)
+
+# 启动时创建计数表（多个 worker 同时启动也不会冲突）
+RATE_LIMIT_TABLE_DDL = """
+CREATE {unlogged}TABLE IF NOT EXISTS rate_limit_counters (
+    key VARCHAR(200) NOT NULL,
+    window_start BIGINT NOT NULL,
+    hits INTEGER NOT NULL,
+    expires_at BIGINT NOT NULL,
+    PRIMARY KEY (key, window_start)
+)
+"""
+RATE_LIMIT_INDEX_DDL = "CREATE INDEX IF NOT EXISTS ix_rate_limit_counters_expires ON rate_limit_counters (expires_at)"
+
+_HIT_SQL = text("""
+INSERT INTO rate_limit_counters (key, window_start, hits, expires_at) VALUES (:key, :window_start, 1, :expires_at)
+ON CONFLICT (key, window_start) DO UPDATE SET hits = rate_limit_counters.hits + 1
+RETURNING hits
+""")
+_PREVIOUS_SQL = text("SELECT hits FROM rate_limit_counters WHERE key = :key AND window_start = :window_start")
+_CLEANUP_SQL = text("DELETE FROM rate_limit_counters WHERE expires_at < :now")
+
+# 过期计数的清理间隔（秒）
+CLEANUP_INTERVAL = 60.0
+
+
+def ensure_rate_limit_table(conn):
+    """启动迁移：创建计数表（在调用方的连接/事务中执行）"""
+    unlogged = "UNLOGGED " if conn.dialect.name == "postgresql" else ""
+    conn.execute(text(RATE_LIMIT_TABLE_DDL.format(unlogged=unlogged)))
+    conn.execute(text(RATE_LIMIT_INDEX_DDL))
+
+
+@dataclass(frozen=True)
+class RateLimitResult:
+    allowed: bool
+    count: float  # 滑动窗口内的估算请求数（含本次）
+    retry_after: int  # 被拒绝时建议的重试等待秒数
+
+
+def _evaluate(current: int, previous: int, limit: int, window: int, now: float, window_start: int) -> RateLimitResult:
+    elapsed = (now - window_start) / window
+    count = previous * (1 - elapsed) + current
+    if count <= limit:
+        return RateLimitResult(True, count, 0)
+    if current > limit:
+        # 当前窗口本身已超限，要等到下一个窗口
+        wait = window_start + window - now
+    else:
+        # 等上一窗口的权重降到估算值不超过 limit
+        wait = window * (1 - (limit - current) / previous) - (now - window_start)
+    return RateLimitResult(False, count, max(1, math.ceil(wait)))
+
+
+class MemoryBackend:
+    """进程内计数：键 -> [窗口起点, 当前窗口计数, 上一窗口计数, 过期时间]"""
+
+    name = "memory"
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._counters: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def hit(self, key: str, window: int, now: float) -> tuple:
+        window_start = int(now // window) * window
+        with self._lock:
+            entry = self._counters.get(key)
+            if entry is None or entry[0] < window_start - window:
+                entry = [window_start, 0, 0, 0]
+            elif entry[0] < window_start:
+                entry = [window_start, 0, entry[1], 0]
+            entry[1] += 1
+            entry[3] = window_start + 2 * window
+            self._counters[key] = entry
+            self._counters.move_to_end(key)
+            # 最久未访问的键在前：过期的先清理，超出上限再淘汰最旧的
+            while self._counters:
+                oldest = next(iter(self._counters.values()))
+                if oldest[3] >= now and len(self._counters) <= self.max_keys:
+                    break
+                self._counters.popitem(last=False)
+            return window_start, entry[1], entry[2]
+
+    def stats(self) -> dict:
+        return {"keys": len(self._counters), "max_keys": self.max_keys}
+
+
+class DatabaseBackend:
+    """rate_limit_counters 表计数，所有 worker 共用"""
+
+    name = "database"
+
+    def __init__(self):
+        self._last_cleanup = 0.0
+        self._cleaned = 0
+
+    async def hit(self, key: str, window: int, now: float) -> tuple:
+        window_start = int(now // window) * window
+        async with async_engine.begin() as conn:
+            current = (await conn.execute(_HIT_SQL, {
+                "key": key, "window_start": window_start, "expires_at": window_start + 2 * window
+            })).scalar()
+            previous = (await conn.execute(_PREVIOUS_SQL, {"key": key, "window_start": window_start - window})).scalar()
+            if now - self._last_cleanup >= CLEANUP_INTERVAL:
+                self._last_cleanup = now
+                self._cleaned += (await conn.execute(_CLEANUP_SQL, {"now": int(now)})).rowcount or 0
+        return window_start, current, previous or 0
+
+    def stats(self) -> dict:
+        return {"expired_deleted": self._cleaned}
+
+
+class RateLimiter:
+    def __init__(self, backend):
+        self.backend = backend
+        self._checks = 0
+        self._rejected = 0
+        self._errors = 0
+
+    async def hit(self, key: str, limit: int, window: int) -> RateLimitResult:
+        """记录一次请求并判断是否超限；计数存储出错时放行（不因限流组件故障拒绝正常请求）"""
+        if limit <= 0 or window <= 0:
+            return RateLimitResult(True, 0, 0)
+        now = time.time()
+        self._checks += 1
+        try:
+            window_start, current, previous = await self.backend.hit(key[:200], window, now)
+        except Exception as e:
+            self._errors += 1
+            logger.warning(f"速率限制计数失败，本次放行: {e}")
+            return RateLimitResult(True, 0, 0)
+        result = _evaluate(current, previous, limit, window, now, window_start)
+        if not result.allowed:
+            self._rejected += 1
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "checks": self._checks,
+            "rejected": self._rejected,
+            "errors": self._errors,
+            **self.backend.stats(),
+        }
+
+
+def _create_backend():
+    if settings.RATE_LIMIT_BACKEND == "memory":
+        return MemoryBackend(settings.RATE_LIMIT_MEMORY_MAX_KEYS)
+    return DatabaseBackend()
+
+
+rate_limiter = RateLimiter(_create_backend())
+
+
+def client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+def too_many_requests(result: RateLimitResult, detail: str = "请求过于频繁，请稍后再试") -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(result.retry_after)},
+    )
+
+
+def rate_limit(scope: str, limit: int, window: int, per_user: bool = False):
+    """接口限流依赖：per_user 时按当前用户计数（需要登录），否则按客户端 IP 计数"""
+    if per_user:
+        async def check_user(current_user: Principal = Depends(get_current_active_user)):
+            result = await rate_limiter.hit(f"{scope}:user:{current_user.id}", limit, window)
+            if not result.allowed:
+                raise too_many_requests(result)
+        return check_user
+
+    async def check_ip(request: Request):
+        result = await rate_limiter.hit(f"{scope}:ip:{client_ip(request)}", limit, window)
+        if not result.allowed:
+            raise too_many_requests(result)
+    return check_ip
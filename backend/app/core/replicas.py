@@ -0,0 +1,269 @@
+"""
+只读副本路由
+
+配置 DATABASE_REPLICA_URLS（逗号分隔，按同步驱动填写）后，GET/HEAD 请求中的只读查询发往健康的副本（轮询），
+其余查询仍走主库：
+
+- 写操作（flush、INSERT/UPDATE/DELETE、SELECT ... FOR UPDATE、待发送的失效通知）总是走主库；
+  GET 请求中一旦写入，本次请求之后的查询也都走主库。
+- 同一会话固定使用一个副本，一次请求内的多条查询看到同一份快照。
+- 读己之写：请求写入后响应中设置 Cookie，READ_YOUR_WRITES_WINDOW 秒内该客户端的请求全部走主库，
+  不会读到副本上尚未复制的数据。Cookie 只记录截止时间，各 worker 通用。
+- 后台任务每 REPLICA_CHECK_INTERVAL 秒检查一次各副本：连接失败或复制延迟超过 REPLICA_MAX_LAG 的副本
+  移出轮换，恢复后重新加入；首次检查通过前副本不参与轮换，没有可用副本时读请求回到主库。
+
+路由只作用于接口请求使用的 AsyncSession（AsyncSessionLocal）；后台任务、迁移和脚本使用的同步会话始终连接主库。
+"""
+import asyncio
+import itertools
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from http.cookies import SimpleCookie
+from typing import List, Optional
+
+from sqlalchemy import Select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+from starlette.datastructures import MutableHeaders
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+STICKY_COOKIE = "db_primary_until"
+
+# 主库（未处于恢复状态）延迟为 0；副本已回放完收到的 WAL 时也为 0，
+# 否则按最后回放事务的时间计算（主库空闲时回放时间不更新，因此先比较 LSN）
+LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+@dataclass
+class RouteState:
+    """一次请求的路由状态"""
+    read_only: bool
+    wrote: bool = False
+
+
+_route: ContextVar[Optional[RouteState]] = ContextVar("db_route", default=None)
+
+
+def _is_write(session: Session, clause) -> bool:
+    if session._flushing or session.info.get("invalidations"):
+        return True
+    if isinstance(clause, UpdateBase):
+        return True
+    return isinstance(clause, Select) and clause._for_update_arg is not None
+
+
+class RoutingSession(Session):
+    """按请求路由的会话：只读请求中的查询发往副本，写操作发往主库
+
+    会话 info 中 replica 为 False 时始终使用主库（如鉴权查询）。
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        state = _route.get()
+        if state is not None:
+            if _is_write(self, clause):
+                state.wrote = True
+            elif state.read_only and not state.wrote:
+                engine = self.info.get("replica")
+                if engine is None:
+                    engine = replica_set.pick()
+                    self.info["replica"] = engine
+                if engine is not False:
+                    return engine
+        return super().get_bind(mapper, clause=clause, **kw)
+
+
+class Replica:
+    def __init__(self, url: str):
+        from .database import async_database_url
+        from .db_metrics import pool_options
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        self.name = make_url(url).render_as_string(hide_password=True)
+        async_url = async_database_url(url)
+        self.engine = create_async_engine(async_url, pool_pre_ping=True, **pool_options(async_url))
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+        self.reads = 0
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "healthy": self.healthy,
+            "lag_seconds": round(self.lag, 3) if self.lag is not None else None,
+            "last_error": self.last_error,
+            "checked_ago_seconds": round(time.monotonic() - self.checked_at, 1) if self.checked_at else None,
+            "reads": self.reads,
+            "pool_checked_out": self.engine.pool.checkedout(),
+        }
+
+
+class ReplicaSet:
+    """副本列表、轮询选择与复制延迟检查"""
+
+    def __init__(self, urls: str, max_lag: float, interval: float):
+        self.urls = [u.strip() for u in urls.split(",") if u.strip()]
+        self.max_lag = max_lag
+        self.interval = interval
+        self.replicas: List[Replica] = []
+        self._healthy: List[Replica] = []
+        self._counter = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+        self._primary_reads = 0
+        self._sticky_requests = 0
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.urls)
+
+    def pick(self):
+        """轮询选择一个健康副本的同步引擎；没有可用副本时返回 False（会话内不再尝试）"""
+        healthy = self._healthy
+        if not healthy:
+            self._primary_reads += 1
+            return False
+        replica = healthy[next(self._counter) % len(healthy)]
+        replica.reads += 1
+        return replica.engine.sync_engine
+
+    async def _check(self, replica: Replica):
+        try:
+            async with replica.engine.connect() as conn:
+                if conn.dialect.name == "postgresql":
+                    lag = float((await conn.execute(LAG_SQL)).scalar() or 0)
+                else:
+                    await conn.execute(text("SELECT 1"))
+                    lag = 0.0
+            replica.lag = lag
+            replica.last_error = None if lag <= self.max_lag else f"复制延迟 {lag:.1f}s 超过 {self.max_lag}s"
+        except Exception as e:
+            replica.lag = None
+            replica.last_error = str(e) or type(e).__name__
+        replica.checked_at = time.monotonic()
+        healthy = replica.last_error is None
+        if healthy != replica.healthy:
+            if healthy:
+                logger.info(f"只读副本 {replica.name} 恢复，重新加入轮换")
+            else:
+                logger.warning(f"只读副本 {replica.name} 移出轮换: {replica.last_error}")
+        replica.healthy = healthy
+
+    async def check(self):
+        """检查所有副本并更新轮换列表"""
+        timeout = max(1.0, min(self.interval, 5.0))
+
+        async def check_one(replica: Replica):
+            try:
+                await asyncio.wait_for(self._check(replica), timeout)
+            except asyncio.TimeoutError:
+                replica.lag = None
+                replica.last_error = f"检查超时（{timeout}s）"
+                replica.checked_at = time.monotonic()
+                if replica.healthy:
+                    logger.warning(f"只读副本 {replica.name} 移出轮换: {replica.last_error}")
+                replica.healthy = False
+
+        await asyncio.gather(*(check_one(r) for r in self.replicas))
+        self._healthy = [r for r in self.replicas if r.healthy]
+
+    def start(self):
+        if not self.configured or (self._task is not None and not self._task.done()):
+            return
+        if not self.replicas:
+            self.replicas = [Replica(url) for url in self.urls]
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._healthy = []
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                logger.warning(f"只读副本检查失败: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        return {
+            "configured": len(self.urls),
+            "healthy": len(self._healthy),
+            "max_lag_seconds": self.max_lag,
+            "read_your_writes_window": settings.READ_YOUR_WRITES_WINDOW,
+            "primary_fallback_reads": self._primary_reads,
+            "sticky_requests": self._sticky_requests,
+            "replicas": [r.stats() for r in self.replicas],
+        }
+
+
+replica_set = ReplicaSet(settings.DATABASE_REPLICA_URLS, settings.REPLICA_MAX_LAG, settings.REPLICA_CHECK_INTERVAL)
+
+
+def _sticky_until(scope) -> float:
+    for name, value in scope.get("headers", []):
+        if name == b"cookie":
+            morsel = SimpleCookie(value.decode("latin-1")).get(STICKY_COOKIE)
+            if morsel is not None:
+                try:
+                    return float(morsel.value)
+                except ValueError:
+                    return 0.0
+    return 0.0
+
+
+class ReplicaRoutingMiddleware:
+    """为每个请求设置路由状态；请求写入后通过 Cookie 让该客户端短时间内读主库"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not replica_set.configured:
+            await self.app(scope, receive, send)
+            return
+
+        read_only = scope["method"] in ("GET", "HEAD")
+        if read_only and _sticky_until(scope) > time.time():
+            replica_set._sticky_requests += 1
+            read_only = False
+        state = RouteState(read_only=read_only)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and state.wrote:
+                window = settings.READ_YOUR_WRITES_WINDOW
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "set-cookie",
+                    f"{STICKY_COOKIE}={time.time() + window:.3f}; Max-Age={int(window + 0.999)}; "
+                    f"Path=/; HttpOnly; SameSite=Lax"
+                )
+            await send(message)
+
+        token = _route.set(state)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _route.reset(token)
@@ -0,0 +1,212 @@
+"""
+运行时配置（configs 表）
+
+管理员可在界面上修改的配置存放在 configs 表中。这里一次读取全部配置行，
+解析成带类型、带默认值的只读快照 RuntimeConfig，热路径直接读取快照，不再逐项查询：
+
+- 配置经 api/config.py 增删改时发布 config 失效事件，本进程和其他 worker（经失效总线）
+  提交后丢弃快照，下次读取时重新加载；新快照构建完成后整体替换，读取方不会看到一半新一半旧的配置；
+- TTL 兜底可能漏掉的事件（如 SQLite 多 worker 部署没有跨进程通知）；
+- 值无法解析时记录警告并使用默认值，不影响其他配置。
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Callable, Dict, Mapping, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .database import SessionLocal
+from .invalidation import invalidation_bus
+
+logger = logging.getLogger(__name__)
+
+
+def _str(value: str) -> str:
+    return value.strip()
+
+
+def _bool(value: str) -> bool:
+    normalized = value.strip().lower()
+    if normalized in ("true", "1", "yes", "on"):
+        return True
+    if normalized in ("false", "0", "no", "off", ""):
+        return False
+    raise ValueError(f"无效的布尔值: {value}")
+
+
+def _positive_int(value: str) -> int:
+    number = int(value.strip())
+    if number <= 0:
+        raise ValueError(f"必须为正整数: {value}")
+    return number
+
+
+def _role(value: str) -> str:
+    role = value.strip()
+    if role not in ("admin", "ops", "user"):
+        raise ValueError(f"无效的角色: {value}")
+    return role
+
+
+@dataclass(frozen=True)
+class LdapConfig:
+    """LDAP/AD 认证配置"""
+    enabled: bool = False
+    server_url: str = ""
+    bind_dn: str = ""
+    bind_password: str = ""
+    base_dn: str = ""
+    user_filter: str = "(sAMAccountName={username})"
+    default_role: str = "user"
+
+    @property
+    def complete(self) -> bool:
+        return bool(self.server_url and self.base_dn)
+
+
+@dataclass(frozen=True)
+class AiConfig:
+    """AI 自动审核配置"""
+    model_name: str = "gpt-3.5-turbo"
+    base_url: str = ""
+    api_key: str = ""
+    auto_review_enabled: bool = False
+
+
+@dataclass(frozen=True)
+class RuntimeConfig:
+    """某一时刻 configs 表的完整快照"""
+    site_name: str = settings.APP_NAME
+    site_description: str = "公司内网软件下载站"
+    max_upload_size: int = settings.MAX_UPLOAD_SIZE
+    allow_registration: bool = settings.ALLOW_REGISTRATION
+    login_rate_limit_max: int = 5
+    login_rate_limit_window: int = 300
+    ai: AiConfig = AiConfig()
+    ldap: LdapConfig = LdapConfig()
+    # 全部配置行的原始值（包括上面未列出的键）
+    values: Mapping[str, str] = field(default_factory=lambda: MappingProxyType({}))
+
+
+# 配置键 -> (所属分组, 字段名, 解析函数)；分组为 None 表示 RuntimeConfig 的顶层字段
+_FIELDS: Dict[str, tuple] = {
+    "site_name": (None, "site_name", _str),
+    "site_description": (None, "site_description", _str),
+    "max_upload_size": (None, "max_upload_size", _positive_int),
+    "allow_registration": (None, "allow_registration", _bool),
+    "login_rate_limit_max": (None, "login_rate_limit_max", _positive_int),
+    "login_rate_limit_window": (None, "login_rate_limit_window", _positive_int),
+    "ai_model_name": ("ai", "model_name", _str),
+    "ai_base_url": ("ai", "base_url", _str),
+    "ai_api_key": ("ai", "api_key", _str),
+    "ai_auto_review_enabled": ("ai", "auto_review_enabled", _bool),
+    "ldap_enabled": ("ldap", "enabled", _bool),
+    "ldap_server_url": ("ldap", "server_url", _str),
+    "ldap_bind_dn": ("ldap", "bind_dn", _str),
+    "ldap_bind_password": ("ldap", "bind_password", _str),
+    "ldap_base_dn": ("ldap", "base_dn", _str),
+    "ldap_user_filter": ("ldap", "user_filter", _str),
+    "ldap_default_role": ("ldap", "default_role", _role),
+}
+
+_GROUPS: Dict[str, Callable] = {"ai": AiConfig, "ldap": LdapConfig}
+
+
+def parse_config(values: Mapping[str, str]) -> RuntimeConfig:
+    """把配置行解析为快照；无法解析的值使用默认值"""
+    fields: Dict[Optional[str], dict] = {None: {}, "ai": {}, "ldap": {}}
+    for key, (group, name, parse) in _FIELDS.items():
+        raw = values.get(key)
+        if raw is None:
+            continue
+        try:
+            fields[group][name] = parse(raw)
+        except ValueError as e:
+            logger.warning(f"配置 {key} 的值无效，使用默认值: {e}")
+    # 空的 LDAP 用户过滤器等同未配置
+    if not fields["ldap"].get("user_filter", True):
+        del fields["ldap"]["user_filter"]
+    return RuntimeConfig(
+        **fields[None],
+        **{group: factory(**fields[group]) for group, factory in _GROUPS.items()},
+        values=MappingProxyType(dict(values)),
+    )
+
+
+class ConfigService:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._snapshot: Optional[RuntimeConfig] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        # 每次失效递增；加载期间发生过失效的结果不写入缓存
+        self._generation = 0
+        self._loads = 0
+        self._hits = 0
+
+    def get(self, db: Optional[Session] = None) -> RuntimeConfig:
+        """返回当前配置快照；未加载或已失效时用 db（未提供时新建会话）读取一次 configs 表"""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() < self._expires_at:
+            self._hits += 1
+            return snapshot
+        return self._load(db)
+
+    async def get_async(self, db: AsyncSession) -> RuntimeConfig:
+        """get() 的异步版本，供使用 AsyncSession 的接口调用"""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() < self._expires_at:
+            self._hits += 1
+            return snapshot
+        from ..models.config import Config
+
+        generation = self._generation
+        rows = (await db.execute(select(Config.key, Config.value))).all()
+        return self._store(generation, rows)
+
+    def _load(self, db: Optional[Session]) -> RuntimeConfig:
+        from ..models.config import Config
+
+        generation = self._generation
+        own_session = db is None
+        if own_session:
+            db = SessionLocal()
+        try:
+            rows = db.query(Config.key, Config.value).all()
+        finally:
+            if own_session:
+                db.close()
+        return self._store(generation, rows)
+
+    def _store(self, generation: int, rows) -> RuntimeConfig:
+        snapshot = parse_config({key: value for key, value in rows})
+        self._loads += 1
+        with self._lock:
+            if generation == self._generation:
+                self._snapshot = snapshot
+                self._expires_at = time.monotonic() + self.ttl
+        return snapshot
+
+    def on_invalidate(self, keys):
+        with self._lock:
+            self._generation += 1
+            self._snapshot = None
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "loaded": snapshot is not None,
+            "keys": len(snapshot.values) if snapshot is not None else 0,
+            "loads": self._loads,
+            "hits": self._hits,
+        }
+
+
+config_service = ConfigService(settings.CONFIG_CACHE_TTL)
+invalidation_bus.subscribe("config", config_service.on_invalidate)
@@ -1,12 +1,15 @@
 import ipaddress
 import os
 import re
-import socket
 from pathlib import Path
+from typing import List
 from urllib.parse import urlparse
 
 import httpx
 
+from .dns import resolver, ResolveError
+from .http_clients import HostPooledTransport, origin_key
+
 
 # Internal/private IP ranges that should never be accessed via SSRF
 PRIVATE_NETWORKS = [
@@ -32,12 +35,8 @@ ALLOWED_UPLOAD_EXTENSIONS = {
 }
 
 
-def validate_download_url(url: str) -> str:
-    """Validate download_url to prevent SSRF attacks.
-
-    Ensures the URL uses HTTP/HTTPS scheme and does not point to
-    internal/private IP addresses.
-    """
+def _parse_download_host(url: str) -> str:
+    """Check scheme and hostname of a download_url and return the hostname."""
     if not url or not url.strip():
         raise ValueError("download_url 不能为空")
 
@@ -56,16 +55,40 @@ def validate_download_url(url: str) -> str:
     if hostname in ("localhost", "localhost.localdomain"):
         raise ValueError("download_url 不能指向内部地址")
 
+    return hostname
+
+
+def _check_resolved_ips(ips: List[str]):
+    for ip in ips:
+        if _is_private_ip(ip):
+            raise ValueError("download_url 不能指向内部/私有网络地址")
+
+
+def validate_download_url(url: str) -> str:
+    """Validate download_url to prevent SSRF attacks.
+
+    Ensures the URL uses HTTP/HTTPS scheme and does not point to
+    internal/private IP addresses. The lookup goes through the shared
+    resolver cache, so the transport does not resolve the host again.
+    """
+    hostname = _parse_download_host(url)
+
     # Resolve hostname and check against private networks
     try:
-        import socket
-        resolved_ips = socket.getaddrinfo(hostname, None, socket.AF_UNSPEC, socket.SOCK_STREAM)
-        for _, _, _, _, addr in resolved_ips:
-            ip = ipaddress.ip_address(addr[0])
-            for network in PRIVATE_NETWORKS:
-                if ip in network:
-                    raise ValueError("download_url 不能指向内部/私有网络地址")
-    except socket.gaierror:
+        _check_resolved_ips(resolver.resolve_sync(hostname))
+    except ResolveError:
+        raise ValueError(f"无法解析 download_url 的主机名: {hostname}")
+
+    return url
+
+
+async def validate_download_url_async(url: str) -> str:
+    """Same as validate_download_url, without blocking the event loop on DNS."""
+    hostname = _parse_download_host(url)
+
+    try:
+        _check_resolved_ips(await resolver.resolve(hostname))
+    except ResolveError:
         raise ValueError(f"无法解析 download_url 的主机名: {hostname}")
 
     return url
@@ -113,26 +136,71 @@ def _is_private_ip(ip_str: str) -> bool:
     return any(ip in net for net in PRIVATE_NETWORKS)
 
 
-class _SSRFSafeTransport(httpx.AsyncHTTPTransport):
+def _is_ip_literal(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+class _SSRFSafeTransport(HostPooledTransport):
     """Custom httpx transport that validates the resolved IP at connection time,
-    preventing DNS rebinding attacks (TOCTOU)."""
+    preventing DNS rebinding attacks (TOCTOU).
+
+    The hostname is resolved asynchronously (cached), every address is checked,
+    and the connection is then made to exactly one of the validated addresses.
+    Host header and TLS SNI keep the original hostname, and connections are
+    pooled per hostname so a pinned TLS connection is never reused for
+    another host behind the same IP.
+    """
 
     async def handle_async_request(self, request):
-        parsed = urlparse(str(request.url))
-        hostname = parsed.hostname
-        if hostname:
+        hostname = request.url.host
+        key = origin_key(request.url)
+        if not hostname:
+            return await self._send(key, request)
+
+        if _is_ip_literal(hostname):
+            if _is_private_ip(hostname):
+                raise ValueError(f"SSRF blocked: {hostname} is a private IP")
+            return await self._send(key, request)
+
+        try:
+            ips = await resolver.resolve(hostname)
+        except ResolveError:
+            raise ValueError(f"Cannot resolve hostname: {hostname}")
+        for ip in ips:
+            if _is_private_ip(ip):
+                raise ValueError(f"SSRF blocked: {hostname} resolves to private IP {ip}")
+
+        extensions = dict(request.extensions)
+        if request.url.scheme == "https":
+            extensions.setdefault("sni_hostname", hostname)
+
+        last_exc = None
+        for ip in ips:
+            pinned = httpx.Request(
+                request.method,
+                request.url.copy_with(host=ip),
+                headers=request.headers,
+                stream=request.stream,
+                extensions=extensions,
+            )
             try:
-                infos = socket.getaddrinfo(hostname, None, socket.AF_UNSPEC, socket.SOCK_STREAM)
-                for _, _, _, _, addr in infos:
-                    if _is_private_ip(addr[0]):
-                        raise ValueError(f"SSRF blocked: {hostname} resolves to private IP {addr[0]}")
-            except socket.gaierror:
-                raise ValueError(f"Cannot resolve hostname: {hostname}")
-        return await super().handle_async_request(request)
+                return await self._send(key, pinned)
+            except httpx.ConnectError as exc:
+                # 连接失败时请求体尚未发送，可以换下一个已校验的地址重试
+                last_exc = exc
+        raise last_exc
 
 
 def safe_httpx_client(**kwargs) -> httpx.AsyncClient:
-    """Create an httpx client with SSRF-safe transport that validates IPs at connection time."""
+    """Create an httpx client with SSRF-safe transport that validates IPs at connection time.
+
+    Prefer the shared ``http_clients.get("outbound")`` client inside the app;
+    this one-off client is meant for scripts and tests.
+    """
     transport = _SSRFSafeTransport()
     kwargs.setdefault("follow_redirects", True)
     kwargs["transport"] = transport
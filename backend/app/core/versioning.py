@@ -0,0 +1,300 @@
+"""
+版本号解析与排序键
+
+把版本字符串解析成可按字典序比较的排序键，写入 SoftwareVersion.version_key，
+这样"最新版本"、版本排序以及版本范围比较都可以直接在数据库里用索引完成。
+
+支持的格式：语义化版本（1.2.3、1.2.3-beta.1、1.2.3+build）、日期版本（2024.01.15）、
+Windows 四段版本（10.0.19041.1）、Python 风格（1.2b1、1.2rc1、1.2.post1）以及带前缀 v 的写法。
+漏洞的影响范围也在这里解析成以排序键为边界的区间（parse_version_ranges），
+再由 RangeIndex 做按版本的区间查找。
+
+排序键只含小写字母和数字，在任何数据库排序规则下字典序都与版本顺序一致：
+- 数字段：长度字符（'a' + 位数）+ 去掉前导零的数字，位数多的数字自然更大；
+- 发布号末尾的 0 段会被去掉，所以 1.0 与 1.0.0 等价；
+- 发布号之后的标记：1 = 预发布，2 = 正式版，3 = 后续修订（post、1.1.1a 这样的字母后缀、-1 这样的构建号等），
+  标记都小于数字段的起始字符，因此 1.0-rc1 < 1.0 < 1.0a < 1.0-1 < 1.0.post1 < 1.0.1。
+"""
+import re
+from bisect import bisect_left
+from dataclasses import dataclass
+from functools import total_ordering
+from typing import FrozenSet, Iterable, List, Optional, Set, Tuple
+
+VERSION_KEY_LENGTH = 255
+
+_PRE_RELEASE = "1"
+_FINAL = "2"
+_POST_RELEASE = "3"
+
+# 预发布标签的先后顺序；单个字母只有后面跟着数字时（1.2b1）才是预发布标签，
+# 单独的字母后缀（OpenSSL 的 1.1.1a）是后续修订
+_PRE_TAGS = {
+    "dev": "0", "snapshot": "0", "nightly": "0",
+    "a": "1", "alpha": "1",
+    "b": "2", "beta": "2",
+    "m": "3", "milestone": "3", "pre": "3", "preview": "3", "ea": "3",
+    "c": "4", "rc": "4", "cr": "4",
+}
+
+_TOKEN_RE = re.compile(r"\d+|[a-z]+")
+
+
+def _number(digits: str) -> str:
+    digits = digits.lstrip("0") or "0"
+    # 超长数字（如时间戳串）截断到 25 位，保证长度字符仍是小写字母
+    digits = digits[:25]
+    return chr(ord("a") + len(digits)) + digits
+
+
+def _split(version: str) -> Tuple[List[str], List[str]]:
+    """拆成发布号数字段和其余标记；连字符之后的内容不属于发布号（1.0.0-1 与 1.0.0.1 不同）"""
+    text = version.strip().lower()
+    if text.startswith("v") and text[1:2].isdigit():
+        text = text[1:]
+    text = text.split("+", 1)[0]  # 构建元数据不参与排序
+    head, _, tail = text.partition("-")
+
+    tokens = _TOKEN_RE.findall(head)
+    release: List[str] = []
+    i = 0
+    while i < len(tokens) and tokens[i].isdigit():
+        release.append(tokens[i])
+        i += 1
+    return release, tokens[i:] + _TOKEN_RE.findall(tail)
+
+
+def _is_pre_release(rest: List[str]) -> bool:
+    tag = rest[0]
+    if tag not in _PRE_TAGS:
+        return False
+    return len(tag) > 1 or (len(rest) > 1 and rest[1].isdigit())
+
+
+def version_sort_key(version: Optional[str]) -> str:
+    """版本号 -> 排序键（字典序与版本顺序一致）"""
+    if not version:
+        return ""
+    release, rest = _split(version)
+
+    while len(release) > 1 and not release[-1].strip("0"):
+        release.pop()
+    key = "".join(_number(part) for part in release)
+
+    if not rest:
+        key += _FINAL
+    elif _is_pre_release(rest):
+        key += _PRE_RELEASE + _PRE_TAGS[rest[0]]
+        for token in rest[1:]:
+            key += _number(token) if token.isdigit() else token + "0"
+    else:
+        key += _POST_RELEASE
+        for token in rest:
+            key += _number(token) if token.isdigit() else token + "0"
+    return key[:VERSION_KEY_LENGTH]
+
+
+@total_ordering
+class Version:
+    """可比较的版本对象（按排序键比较）"""
+
+    __slots__ = ("raw", "key")
+
+    def __init__(self, raw: str):
+        self.raw = raw
+        self.key = version_sort_key(raw)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Version) and self.key == other.key
+
+    def __lt__(self, other: "Version") -> bool:
+        return self.key < other.key
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    def __repr__(self) -> str:
+        return f"Version({self.raw!r})"
+
+
+# ---- 版本范围 ----
+
+@dataclass(frozen=True)
+class VersionRange:
+    """版本区间（边界为排序键，None 表示无界）"""
+    lower: Optional[str] = None
+    lower_inclusive: bool = True
+    upper: Optional[str] = None
+    upper_inclusive: bool = False
+
+    def contains(self, key: str) -> bool:
+        if self.lower is not None and (key < self.lower or (key == self.lower and not self.lower_inclusive)):
+            return False
+        if self.upper is not None and (key > self.upper or (key == self.upper and not self.upper_inclusive)):
+            return False
+        return True
+
+    @property
+    def is_empty(self) -> bool:
+        if self.lower is None or self.upper is None:
+            return False
+        if self.lower == self.upper:
+            return not (self.lower_inclusive and self.upper_inclusive)
+        return self.lower > self.upper
+
+    def intersect(self, other: "VersionRange") -> "VersionRange":
+        lower, lower_inclusive = self.lower, self.lower_inclusive
+        if other.lower is not None and (
+            lower is None or other.lower > lower or (other.lower == lower and not other.lower_inclusive)
+        ):
+            lower, lower_inclusive = other.lower, other.lower_inclusive
+        upper, upper_inclusive = self.upper, self.upper_inclusive
+        if other.upper is not None and (
+            upper is None or other.upper < upper or (other.upper == upper and not other.upper_inclusive)
+        ):
+            upper, upper_inclusive = other.upper, other.upper_inclusive
+        return VersionRange(lower, lower_inclusive, upper, upper_inclusive)
+
+
+ALL_VERSIONS = VersionRange()
+
+_ANY_WORDS = {"*", "all", "any", "所有版本", "全部版本", "全部", "所有"}
+_OR_SPLIT_RE = re.compile(r"\|\||;|；|、|\s+or\s+|\s+或\s+", re.IGNORECASE)
+_AND_SPLIT_RE = re.compile(r",|，")
+_BRACKET_RE = re.compile(r"([\[(])\s*([^,\[\]()]*?)\s*,\s*([^,\[\]()]*?)\s*([\])])")
+_COMPARATOR_RE = re.compile(r"(>=|<=|==|=|>|<)\s*([^\s<>=,;]+)")
+_SPAN_RE = re.compile(r"^(.+?)\s*(?:\s-\s|~|到|至|—|–)\s*(.+)$")
+_HYPHEN_SPAN_RE = re.compile(r"^(v?\d[\w.]*)-(v?\d[\w.+-]*)$", re.IGNORECASE)
+_WILDCARD_RE = re.compile(r"^v?(\d+(?:\.\d+)*)\.(?:x|\*)$", re.IGNORECASE)
+
+
+def _prefix_key(parts: List[int]) -> str:
+    digits = [str(p) for p in parts]
+    while len(digits) > 1 and digits[-1] == "0":
+        digits.pop()
+    return "".join(_number(d) for d in digits)
+
+
+def _wildcard(prefix: str) -> VersionRange:
+    """1.2.x -> [1.2 的所有预发布, 1.3 的预发布)：边界后缀 '0' 小于所有版本标记"""
+    parts = [int(p) for p in prefix.split(".")]
+    upper = parts[:-1] + [parts[-1] + 1]
+    return VersionRange(_prefix_key(parts) + "0", True, _prefix_key(upper) + "0", False)
+
+
+def _comparators(text: str) -> Optional[VersionRange]:
+    """解析 '>=1.0 <2.0' 这类比较式（各比较式取交集）"""
+    matches = _COMPARATOR_RE.findall(text)
+    if not matches or _COMPARATOR_RE.sub("", text).strip():
+        return None
+    result = ALL_VERSIONS
+    for op, value in matches:
+        key = version_sort_key(value)
+        if op in ("==", "="):
+            bound = VersionRange(key, True, key, True)
+        elif op == ">=":
+            bound = VersionRange(lower=key, lower_inclusive=True)
+        elif op == ">":
+            bound = VersionRange(lower=key, lower_inclusive=False)
+        elif op == "<=":
+            bound = VersionRange(upper=key, upper_inclusive=True)
+        else:
+            bound = VersionRange(upper=key, upper_inclusive=False)
+        result = result.intersect(bound)
+    return result
+
+
+def _single(text: str) -> VersionRange:
+    text = text.strip()
+    if text.lower() in _ANY_WORDS:
+        return ALL_VERSIONS
+    wildcard = _WILDCARD_RE.match(text)
+    if wildcard:
+        return _wildcard(wildcard.group(1))
+    span = _SPAN_RE.match(text) or _HYPHEN_SPAN_RE.match(text)
+    if span:
+        # 1.0.0-1.5.0 / 1.0 ~ 1.5 / 1.0 到 1.5：两端都包含
+        return VersionRange(version_sort_key(span.group(1)), True, version_sort_key(span.group(2)), True)
+    key = version_sort_key(text)
+    return VersionRange(key, True, key, True)
+
+
+def parse_version_ranges(affected_versions: Optional[str], fixed_version: Optional[str] = None) -> List[VersionRange]:
+    """把漏洞记录的影响范围解析成区间列表（区间之间为"或"关系）。
+
+    affected_versions 支持：单个版本、1.0-1.5 / 1.0 ~ 1.5 / 1.0 到 1.5、1.2.x、
+    >=1.0 <2.0 或 >=1.0, <2.0（比较式顺序不限，同一范围内取交集）、[1.0,2.0) 等区间写法、
+    * / all / 所有版本，多个范围用 || ; 、 或 or 分隔。
+    fixed_version 表示该版本及以后已修复：没有影响范围时即 < fixed_version，
+    有影响范围时与之取交集。两者都为空表示所有版本受影响。
+    """
+    ranges: List[VersionRange] = []
+    text = (affected_versions or "").strip()
+
+    for lower, lower_value, upper_value, upper in _BRACKET_RE.findall(text):
+        ranges.append(VersionRange(
+            version_sort_key(lower_value) if lower_value else None, lower == "[",
+            version_sort_key(upper_value) if upper_value else None, upper == "]",
+        ))
+    text = _BRACKET_RE.sub(" ", text)
+
+    for clause in _OR_SPLIT_RE.split(text):
+        # 同一子句中的比较式（逗号或空格分隔，顺序不限）表示同时满足，取交集；
+        # 其余写法（单个版本、1.0-1.5、1.2.x）是逐个列出的范围，各自独立
+        combined: Optional[VersionRange] = None
+        for part in _AND_SPLIT_RE.split(clause):
+            part = part.strip()
+            if not part:
+                continue
+            parsed = _comparators(part)
+            if parsed is None:
+                ranges.append(_single(part))
+                continue
+            combined = parsed if combined is None else combined.intersect(parsed)
+        if combined is not None:
+            ranges.append(combined)
+
+    if fixed_version and fixed_version.strip():
+        fixed = VersionRange(upper=version_sort_key(fixed_version), upper_inclusive=False)
+        ranges = [r.intersect(fixed) for r in ranges] if ranges else [fixed]
+    elif not ranges:
+        ranges = [ALL_VERSIONS]
+    return [r for r in ranges if not r.is_empty]
+
+
+class RangeIndex:
+    """区间索引：把所有区间端点切分成基本段并预先算好每段命中的条目，
+    查询一个版本只需一次二分查找（O(log n)）。"""
+
+    def __init__(self, entries: Iterable[Tuple[VersionRange, int]]):
+        entries = list(entries)
+        points = sorted({p for r, _ in entries for p in (r.lower, r.upper) if p is not None})
+        self._points = points
+        # 段 2i：(points[i-1], points[i]) 开区间；段 2i+1：恰好等于 points[i]；最后一段：> points[-1]
+        segments: List[Set[int]] = [set() for _ in range(2 * len(points) + 1)]
+        for r, item in entries:
+            if r.lower is None:
+                start = 0
+            else:
+                i = bisect_left(points, r.lower)
+                start = 2 * i + 1 if r.lower_inclusive else 2 * i + 2
+            if r.upper is None:
+                end = len(segments) - 1
+            else:
+                i = bisect_left(points, r.upper)
+                end = 2 * i + 1 if r.upper_inclusive else 2 * i
+            for segment in range(start, end + 1):
+                segments[segment].add(item)
+        self._segments: List[FrozenSet[int]] = [frozenset(s) for s in segments]
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def match_key(self, key: str) -> FrozenSet[int]:
+        i = bisect_left(self._points, key)
+        if i < len(self._points) and self._points[i] == key:
+            return self._segments[2 * i + 1]
+        return self._segments[2 * i]
+
+    def match(self, version: str) -> FrozenSet[int]:
+        return self.match_key(version_sort_key(version))
@@ -3,9 +3,10 @@ from .software import Software, SoftwareVersion
 from .category import SoftwareCategory
 from .request import SoftwareRequest, RequestStatus
 from .download import DownloadLog
-from .vulnerability import Vulnerability
+from .vulnerability import Vulnerability, VulnerabilityRange, VersionExposure
 from .audit import AuditLog
 from .config import Config
+from .catalog import CatalogRevision
 
 __all__ = [
     "User", "UserRole",
@@ -13,7 +14,8 @@ __all__ = [
     "SoftwareCategory",
     "SoftwareRequest", "RequestStatus",
     "DownloadLog",
-    "Vulnerability",
+    "Vulnerability", "VulnerabilityRange", "VersionExposure",
     "AuditLog",
     "Config",
+    "CatalogRevision",
 ]
\ No newline at end of file
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, Integer, BigInteger, DateTime
+from sqlalchemy.sql import func
+from ..core.database import Base
+
+
+class CatalogRevision(Base):
+    """目录版本号（单行表）：软件、版本、分类、配置任一写入都会递增，用于生成 ETag"""
+    __tablename__ = "catalog_revision"
+
+    id = Column(Integer, primary_key=True)
+    revision = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
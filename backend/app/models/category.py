@@ -16,5 +16,6 @@ class SoftwareCategory(Base):
     name = Column(String(50), unique=True, nullable=False, comment="类型名称")
     description = Column(String(200), nullable=True, comment="类型描述")
     sort_order = Column(Integer, default=0, comment="排序顺序")
+    software_count = Column(Integer, default=0, nullable=False, comment="软件数量（随软件增删、改分类在同一事务内维护）")
     created_at = Column(DateTime, default=datetime.now, comment="创建时间")
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, comment="更新时间")
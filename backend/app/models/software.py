@@ -1,7 +1,8 @@
 from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, BigInteger
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import mapped_column, relationship, validates
 from sqlalchemy.sql import func
 from ..core.database import Base
+from ..core.versioning import version_sort_key
 
 
 class Software(Base):
@@ -11,19 +12,32 @@ class Software(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), unique=True, index=True, nullable=False)
     description = Column(Text)
-    category = Column(String(50), index=True)
+    # 分类外键；改分类时需要旧值来维护分类的软件计数（见 services/catalog.py），所以开启 active_history
+    category_id = mapped_column(Integer, ForeignKey("software_categories.id"), index=True, active_history=True)
     icon_url = Column(String(255))
     logo = Column(String(255))
     official_url = Column(String(255))
     created_by = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), index=True)
+
+    # 汇总字段（随版本增删、下载在同一事务内维护，见 services/catalog.py）
+    latest_version = Column(String(50))
+    version_count = Column(Integer, default=0, nullable=False)
+    total_downloads = Column(BigInteger, default=0, nullable=False)
+    last_release_at = Column(DateTime(timezone=True))
 
     # 关系
     creator = relationship("User", foreign_keys=[created_by], back_populates="uploaded_software")
     versions = relationship("SoftwareVersion", back_populates="software", cascade="all, delete-orphan")
     requests = relationship("SoftwareRequest", back_populates="software")
     vulnerabilities = relationship("Vulnerability", back_populates="software")
+    category_ref = relationship("SoftwareCategory", lazy="selectin")
+
+    @property
+    def category(self):
+        """分类名称"""
+        return self.category_ref.name if self.category_ref is not None else None
 
 
 class SoftwareVersion(Base):
@@ -31,8 +45,9 @@ class SoftwareVersion(Base):
     __tablename__ = "software_versions"
 
     id = Column(Integer, primary_key=True, index=True)
-    software_id = Column(Integer, ForeignKey("software.id"), nullable=False)
+    software_id = Column(Integer, ForeignKey("software.id"), nullable=False, index=True)
     version = Column(String(50), nullable=False)
+    version_key = Column(String(255), nullable=False, default="")  # 版本排序键，见 core/versioning.py
     file_path = Column(String(255), nullable=False)
     file_name = Column(String(255), nullable=False)
     file_size = Column(BigInteger)  # 字节
@@ -46,3 +61,9 @@ class SoftwareVersion(Base):
     software = relationship("Software", back_populates="versions")
     uploader = relationship("User", back_populates="uploaded_versions")
     download_logs = relationship("DownloadLog", back_populates="software_version")
+
+    @validates("version")
+    def _update_version_key(self, key, value):
+        # 写入版本号时同步生成排序键
+        self.version_key = version_sort_key(value)
+        return value
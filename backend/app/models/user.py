@@ -26,6 +26,7 @@ class User(Base):
     last_login = Column(DateTime(timezone=True))
     token_version = Column(Integer, default=0)  # 递增使旧 token 失效
     auth_source = Column(String(10), default="local")  # local / ldap
+    ldap_synced_at = Column(DateTime(timezone=True))  # 最近一次目录同步时仍在目录中
 
     # 关系
     uploaded_software = relationship("Software", back_populates="creator")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..core.database import Base
@@ -10,20 +10,54 @@ class Vulnerability(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     software_id = Column(Integer, ForeignKey("software.id"), nullable=False)
-    cve_id = Column(String(50))  # CVE 编号
+    cve_id = Column(String(50), index=True)  # CVE 编号
     severity = Column(String(20))  # 严重程度: critical, high, medium, low
     title = Column(String(255))
     description = Column(Text)
 
     # 版本范围
-    affected_versions = Column(String(255))  # 影响版本范围，如 "1.0.0-1.5.0"
+    affected_versions = Column(Text)  # 影响版本范围，如 "1.0.0-1.5.0"
     fixed_version = Column(String(50))  # 修复版本
 
     # 参考链接
     reference_url = Column(String(500))
 
+    # 从 NVD 导入的记录：CVE 内容的哈希，重复导入时用于跳过未变化的记录（手工录入的为空）
+    content_hash = Column(String(64))
+
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     # 关系
     software = relationship("Software", back_populates="vulnerabilities")
+    ranges = relationship("VulnerabilityRange", back_populates="vulnerability", cascade="all, delete-orphan")
+
+
+class VulnerabilityRange(Base):
+    """漏洞影响的版本区间（写入漏洞时由 affected_versions/fixed_version 解析生成）
+
+    边界为版本排序键（见 core.versioning），为空表示无界。
+    """
+    __tablename__ = "vulnerability_ranges"
+
+    id = Column(Integer, primary_key=True)
+    vulnerability_id = Column(Integer, ForeignKey("vulnerabilities.id", ondelete="CASCADE"), nullable=False, index=True)
+    software_id = Column(Integer, nullable=False, index=True)
+    lower_key = Column(String(255))
+    lower_inclusive = Column(Boolean, nullable=False, default=True)
+    upper_key = Column(String(255))
+    upper_inclusive = Column(Boolean, nullable=False, default=False)
+
+    vulnerability = relationship("Vulnerability", back_populates="ranges")
+
+
+class VersionExposure(Base):
+    """软件版本受哪些漏洞影响（由版本排序键与漏洞区间计算，随版本和漏洞的写入增量维护）"""
+    __tablename__ = "version_exposure"
+
+    software_version_id = Column(Integer, ForeignKey("software_versions.id", ondelete="CASCADE"), primary_key=True)
+    vulnerability_id = Column(Integer, ForeignKey("vulnerabilities.id", ondelete="CASCADE"), primary_key=True, index=True)
+    software_id = Column(Integer, nullable=False, index=True)
+
+    software_version = relationship("SoftwareVersion")
+    vulnerability = relationship("Vulnerability")
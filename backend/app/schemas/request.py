@@ -8,9 +8,10 @@ T = TypeVar('T')
 
 
 class PaginatedResponse(BaseModel, Generic[T]):
-    """通用分页响应模型"""
-    total: int
+    """通用分页响应模型（total 在 count=none 时为空；next_cursor 为空表示没有下一页）"""
+    total: Optional[int] = None
     items: List[T]
+    next_cursor: Optional[str] = None
 
 
 class SoftwareRequestBase(BaseModel):
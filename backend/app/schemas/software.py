@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, field_validator
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 from urllib.parse import urlparse
 
@@ -75,6 +75,8 @@ class VersionInfo(BaseModel):
     download_count: int
     release_notes: Optional[str]
     original_download_url: Optional[str] = None  # 添加原始下载地址字段
+    vulnerability_count: int = 0  # 影响该版本的漏洞数
+    max_severity: Optional[str] = None  # 其中最高的严重程度
 
     class Config:
         from_attributes = True
@@ -115,11 +117,16 @@ class SoftwareListResponse(BaseModel):
     latest_version: Optional[str]
     version_count: int
     total_downloads: int
+    last_release_at: Optional[datetime] = None
+    highlights: Optional[Dict[str, str]] = None  # 搜索命中的高亮片段（HTML，已转义）
+    vulnerable_versions: int = 0  # 存在已知漏洞的版本数
+    max_severity: Optional[str] = None  # 其中最高的严重程度
 
     class Config:
         from_attributes = True
 
 
 class SoftwareListWithTotal(BaseModel):
-    total: int
-    items: List[SoftwareListResponse]
\ No newline at end of file
+    total: Optional[int] = None
+    items: List[SoftwareListResponse]
+    next_cursor: Optional[str] = None
\ No newline at end of file
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, HttpUrl
-from typing import Optional
+from pydantic import BaseModel, Field, HttpUrl, model_validator
+from typing import List, Optional
 from datetime import datetime
 
 
@@ -41,4 +41,54 @@ class VulnerabilityWithSoftwareResponse(VulnerabilityBase):
     updated_at: Optional[datetime]
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class InventoryItem(BaseModel):
+    """清单中的一个软件：software_id 与 name 二选一"""
+    software_id: Optional[int] = None
+    name: Optional[str] = None
+    version: str = Field(..., min_length=1, max_length=100)
+
+    @model_validator(mode="after")
+    def check_software(self):
+        if self.software_id is None and not (self.name and self.name.strip()):
+            raise ValueError("software_id 和 name 至少需要提供一个")
+        return self
+
+
+class InventoryCheckRequest(BaseModel):
+    items: List[InventoryItem]
+
+
+class VulnerabilityBrief(BaseModel):
+    """漏洞摘要（批量检查、暴露面报表中使用）"""
+    id: int
+    cve_id: Optional[str] = None
+    severity: Optional[str] = None
+    title: Optional[str] = None
+    fixed_version: Optional[str] = None
+    reference_url: Optional[str] = None
+
+
+class InventoryItemResult(BaseModel):
+    software_id: Optional[int] = None  # 未找到对应软件时为空
+    name: Optional[str] = None
+    version: str
+    vulnerabilities: List[VulnerabilityBrief] = []
+
+
+class InventoryCheckResponse(BaseModel):
+    items: List[InventoryItemResult]  # 与请求中的 items 一一对应
+    affected: int  # 存在漏洞的条目数
+    unknown: int  # 未找到对应软件的条目数
+
+
+class ExposedVersionResponse(BaseModel):
+    """暴露面报表中的一个受影响版本"""
+    software_id: int
+    software_name: str
+    version_id: int
+    version: str
+    download_count: int
+    max_severity: Optional[str] = None
+    vulnerabilities: List[VulnerabilityBrief]
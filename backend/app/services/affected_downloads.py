@@ -0,0 +1,211 @@
+"""
+受漏洞影响的下载记录导出
+
+新漏洞（尤其是严重漏洞）录入后，安全团队需要知道哪些用户在何时、从哪个 IP 下载过受影响的版本。
+结果由 version_exposure 与 download_logs 的一次索引关联查询得出
+（download_logs 上有 (software_version_id, id) 索引），通过服务端游标分批读取，
+边查询边以 NDJSON / CSV 流式返回，内存占用与日志量无关。
+
+导出结果同时写入存储目录作为缓存。缓存文件名带有校验标记，由漏洞的更新时间、
+受影响的版本集合以及这些版本的最新下载记录 ID 计算，有新下载或漏洞、版本变化时标记改变，
+旧缓存自然失效；多个 worker 共用存储目录，无需额外通知。
+严重漏洞录入后由后台任务提前生成缓存。
+"""
+import asyncio
+import csv
+import glob
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..core.database import SessionLocal
+from ..models.download import DownloadLog
+from ..models.software import SoftwareVersion
+from ..models.user import User
+from ..models.vulnerability import Vulnerability, VersionExposure
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = os.path.join(settings.STORAGE_PATH, "exports", "affected_downloads")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+COLUMNS = ["download_id", "user_id", "username", "email", "software_version_id", "version", "download_time", "ip_address"]
+
+# 服务端游标每批读取的行数
+FETCH_SIZE = 5000
+
+
+def cache_token(db: Session, vulnerability: Vulnerability) -> str:
+    """缓存校验标记：漏洞更新时间 + 受影响版本集合 + 这些版本的最新下载记录 ID"""
+    version_ids = db.execute(
+        select(VersionExposure.software_version_id)
+        .where(VersionExposure.vulnerability_id == vulnerability.id)
+        .order_by(VersionExposure.software_version_id)
+    ).scalars().all()
+    # 每个版本各取一次最大 ID（走 (software_version_id, id) 索引），不扫描全部日志
+    latest_per_version = select(func.max(DownloadLog.id))\
+        .where(DownloadLog.software_version_id == VersionExposure.software_version_id)\
+        .scalar_subquery()
+    latest_download = db.execute(
+        select(func.max(latest_per_version)).where(VersionExposure.vulnerability_id == vulnerability.id)
+    ).scalar()
+    changed_at = vulnerability.updated_at or vulnerability.created_at
+    raw = f"{changed_at}|{','.join(map(str, version_ids))}|{latest_download}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+def cache_path(vulnerability_id: int, token: str, fmt: str) -> str:
+    return os.path.join(EXPORT_DIR, f"{vulnerability_id}-{token}.{fmt}")
+
+
+def _affected_rows_query(vulnerability_id: int):
+    return select(
+        DownloadLog.id, DownloadLog.user_id, User.username, User.email,
+        DownloadLog.software_version_id, SoftwareVersion.version,
+        DownloadLog.download_time, DownloadLog.ip_address
+    ).select_from(VersionExposure)\
+        .join(DownloadLog, DownloadLog.software_version_id == VersionExposure.software_version_id)\
+        .join(SoftwareVersion, SoftwareVersion.id == VersionExposure.software_version_id)\
+        .outerjoin(User, User.id == DownloadLog.user_id)\
+        .where(VersionExposure.vulnerability_id == vulnerability_id)\
+        .order_by(DownloadLog.software_version_id, DownloadLog.id)
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _encode(rows, fmt: str, header: bool) -> str:
+    if fmt == "ndjson":
+        return "".join(
+            json.dumps(dict(zip(COLUMNS, map(_json_value, row))), ensure_ascii=False) + "\n" for row in rows
+        )
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if header:
+        writer.writerow(COLUMNS)
+    writer.writerows([_json_value(v) for v in row] for row in rows)
+    return buf.getvalue()
+
+
+def stream_export(vulnerability_id: int, token: str, fmt: str) -> Iterator[bytes]:
+    """流式查询并输出；完整输出后把结果保存为缓存（客户端中途断开则丢弃）"""
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    final_path = cache_path(vulnerability_id, token, fmt)
+    temp_path = f"{final_path}.{uuid.uuid4().hex[:8]}.tmp"
+    db = SessionLocal()
+    completed = False
+    try:
+        with open(temp_path, "wb") as cache:
+            result = db.execute(
+                _affected_rows_query(vulnerability_id).execution_options(stream_results=True, yield_per=FETCH_SIZE)
+            )
+            header = True
+            for rows in result.partitions():
+                chunk = _encode(rows, fmt, header).encode("utf-8")
+                header = False
+                cache.write(chunk)
+                yield chunk
+            if header and fmt == "csv":
+                # 没有记录时也输出表头
+                chunk = _encode([], fmt, True).encode("utf-8")
+                cache.write(chunk)
+                yield chunk
+        os.replace(temp_path, final_path)
+        completed = True
+        _remove_stale(vulnerability_id, fmt, keep=final_path)
+    finally:
+        db.close()
+        if not completed:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+
+def _remove_stale(vulnerability_id: int, fmt: str, keep: Optional[str] = None):
+    for path in glob.glob(os.path.join(EXPORT_DIR, f"{vulnerability_id}-*.{fmt}")):
+        if path != keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def discard_exports(vulnerability_id: int):
+    """删除漏洞的全部导出缓存"""
+    for fmt in MEDIA_TYPES:
+        _remove_stale(vulnerability_id, fmt)
+
+
+def build_export(vulnerability_id: int, fmt: str = "ndjson") -> Optional[str]:
+    """生成（或确认已有）导出缓存，返回缓存文件路径；漏洞不存在时返回 None"""
+    db = SessionLocal()
+    try:
+        vulnerability = db.query(Vulnerability).filter(Vulnerability.id == vulnerability_id).first()
+        if vulnerability is None:
+            return None
+        token = cache_token(db, vulnerability)
+    finally:
+        db.close()
+    path = cache_path(vulnerability_id, token, fmt)
+    if not os.path.exists(path):
+        for _ in stream_export(vulnerability_id, token, fmt):
+            pass
+    return path
+
+
+class AffectedDownloadsJobs:
+    """严重漏洞录入后在后台预先生成导出缓存（同一漏洞同时只运行一个任务）"""
+
+    def __init__(self):
+        self._running: Dict[int, asyncio.Task] = {}
+        self._completed = 0
+        self._failed = 0
+        self._last_duration_ms: Optional[float] = None
+
+    def schedule(self, vulnerability_id: int):
+        if vulnerability_id in self._running:
+            return
+        task = asyncio.get_running_loop().create_task(self._run(vulnerability_id))
+        self._running[vulnerability_id] = task
+
+    async def _run(self, vulnerability_id: int):
+        started = time.perf_counter()
+        try:
+            for fmt in MEDIA_TYPES:
+                await asyncio.to_thread(build_export, vulnerability_id, fmt)
+            self._completed += 1
+        except Exception as e:
+            self._failed += 1
+            logger.exception(f"生成受影响下载记录导出失败 (漏洞 {vulnerability_id}): {e}")
+        finally:
+            self._last_duration_ms = round((time.perf_counter() - started) * 1000, 2)
+            self._running.pop(vulnerability_id, None)
+
+    async def stop(self):
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self._running),
+            "completed": self._completed,
+            "failed": self._failed,
+            "last_duration_ms": self._last_duration_ms,
+        }
+
+
+affected_download_jobs = AffectedDownloadsJobs()
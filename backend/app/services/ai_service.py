@@ -1,30 +1,131 @@
-import httpx
 import json
 import re
-from typing import Dict, Any, Optional
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import urlparse
 from sqlalchemy.orm import Session
-from ..models.config import Config
 from ..core.config import settings
+from ..core.runtime_config import config_service
+from ..core.http_clients import http_clients
+
+def verdict_cache_key(request_data: Dict[str, Any]) -> Tuple[str, str]:
+    """审核结果缓存键：(规范化的下载域名, 软件名)"""
+    host = (urlparse(request_data.get("download_url") or "").hostname or "").lower().rstrip(".")
+    if host.startswith("www."):
+        host = host[4:]
+    name = " ".join((request_data.get("software_name") or "").lower().split())
+    return host, name
+
+
+class VerdictCache:
+    """带 TTL 的审核结果缓存，同一厂商域名 + 软件名的重复申请无需再调用模型"""
+
+    def __init__(self, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return dict(entry[1])
+
+    def set(self, key: Tuple[str, str], verdict: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, dict(verdict))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+verdict_cache = VerdictCache(settings.AI_REVIEW_CACHE_TTL, settings.AI_REVIEW_CACHE_SIZE)
+
+
+class _ReviewMetrics:
+    def __init__(self):
+        self.reviews = 0
+        self.cache_hits = 0
+        self.model_calls = 0
+        self.failures = 0
+        self.latencies = deque(maxlen=512)
+
+    def stats(self) -> dict:
+        samples = sorted(self.latencies)
+
+        def pct(p: float) -> Optional[float]:
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 1)
+
+        return {
+            "reviews": self.reviews,
+            "cache_hits": self.cache_hits,
+            "cache_hit_ratio": round(self.cache_hits / self.reviews, 4) if self.reviews else 0.0,
+            "cached_verdicts": len(verdict_cache),
+            "model_calls": self.model_calls,
+            "failures": self.failures,
+            "model_latency_ms": {"p50": pct(0.5), "p99": pct(0.99), "max": pct(1.0)},
+        }
+
+
+review_metrics = _ReviewMetrics()
 
 
 class AIService:
     def __init__(self, db: Session):
         self.db = db
-        self.model_name = self.get_config("ai_model_name", "gpt-3.5-turbo")
-        self.base_url = self.get_config("ai_base_url", "")
-        self.api_key = self.get_config("ai_api_key", "")
-        self.auto_review_enabled = self.get_config("ai_auto_review_enabled", "false").lower() == "true"
+        # 读取配置快照，不查询 configs 表
+        self._config = config_service.get(db)
+        self.model_name = self._config.ai.model_name
+        self.base_url = self._config.ai.base_url
+        self.api_key = self._config.ai.api_key
+        self.auto_review_enabled = self._config.ai.auto_review_enabled
 
     def get_config(self, key: str, default: str = "") -> str:
         """获取配置值"""
-        config = self.db.query(Config).filter(Config.key == key).first()
-        return config.value if config else default
+        return self._config.values.get(key, default)
 
     async def review_software_request(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
-        """使用AI审核软件申请"""
+        """使用AI审核软件申请（命中缓存时不调用模型）"""
         if not self.auto_review_enabled or not self.base_url or not self.api_key:
             return {"approved": False, "reason": "AI审核未启用或配置不完整"}
 
+        review_metrics.reviews += 1
+        key = verdict_cache_key(request_data)
+        cached = verdict_cache.get(key) if key[0] else None
+        if cached is not None:
+            review_metrics.cache_hits += 1
+            return cached
+
+        review_metrics.model_calls += 1
+        start = time.perf_counter()
+        verdict, cacheable = await self._ask_model(request_data)
+        review_metrics.latencies.append(time.perf_counter() - start)
+        if not cacheable:
+            review_metrics.failures += 1
+        elif key[0] and isinstance(verdict, dict):
+            verdict_cache.set(key, verdict)
+        return verdict
+
+    async def _ask_model(self, request_data: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """调用大模型，返回 (审核结果, 是否为模型给出的有效结论)"""
+
         # 构建提示词
         prompt = f"""
         请审核以下软件申请请求，并判断是否批准：
@@ -60,43 +161,44 @@ class AIService:
         }
 
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers=headers,
-                    json=data
-                )
-                
-                if response.status_code != 200:
-                    return {"approved": False, "reason": f"AI服务错误: {response.status_code}"}
+            client = http_clients.get("ai")
+            response = await client.post(
+                f"{self.base_url}/chat/completions",
+                headers=headers,
+                json=data,
+                timeout=30.0
+            )
+
+            if response.status_code != 200:
+                return {"approved": False, "reason": f"AI服务错误: {response.status_code}"}, False
 
-                result = response.json()
-                content = result["choices"][0]["message"]["content"]
+            result = response.json()
+            content = result["choices"][0]["message"]["content"]
+            
+            # 提取可能的JSON代码块
+            json_match = re.search(r'```(?:json)?\s*({.*?})\s*```', content, re.DOTALL)
+            if json_match:
+                json_str = json_match.group(1)
+            else:
+                # 如果没有找到代码块，尝试直接解析内容
+                json_str = content.strip()
+            
+            # 尝试解析AI返回的JSON
+            try:
+                review_result = json.loads(json_str)
+                return review_result, True
+            except json.JSONDecodeError:
+                # 如果AI返回的不是有效JSON，使用更严格的关键词检测
+                content_lower = content.lower()
+                has_approved = "approved" in content_lower
+                has_true = "true" in content_lower
+                has_false = "false" in content_lower
                 
-                # 提取可能的JSON代码块
-                json_match = re.search(r'```(?:json)?\s*({.*?})\s*```', content, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(1)
+                # 只有同时包含"approved"和"true"且不包含"false"时才通过
+                if has_approved and has_true and not has_false:
+                    return {"approved": True, "reason": f"AI自动审核通过：{content}"}, True
                 else:
-                    # 如果没有找到代码块，尝试直接解析内容
-                    json_str = content.strip()
-                
-                # 尝试解析AI返回的JSON
-                try:
-                    review_result = json.loads(json_str)
-                    return review_result
-                except json.JSONDecodeError:
-                    # 如果AI返回的不是有效JSON，使用更严格的关键词检测
-                    content_lower = content.lower()
-                    has_approved = "approved" in content_lower
-                    has_true = "true" in content_lower
-                    has_false = "false" in content_lower
+                    return {"approved": False, "reason": f"AI审核未通过: {content}"}, True
                     
-                    # 只有同时包含"approved"和"true"且不包含"false"时才通过
-                    if has_approved and has_true and not has_false:
-                        return {"approved": True, "reason": f"AI自动审核通过：{content}"}
-                    else:
-                        return {"approved": False, "reason": f"AI审核未通过: {content}"}
-                        
         except Exception as e:
-            return {"approved": False, "reason": f"AI审核失败: {str(e)}"}
\ No newline at end of file
+            return {"approved": False, "reason": f"AI审核失败: {str(e)}"}, False
\ No newline at end of file
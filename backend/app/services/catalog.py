@@ -0,0 +1,241 @@
+"""
+软件目录汇总数据维护
+
+Software 上冗余保存了最新版本、版本数、总下载量和最近发布时间，
+软件列表直接读取这些字段，不再逐行统计版本表。
+这些字段必须与版本的增删、下载计数在同一事务内更新。
+
+软件通过 category_id 引用分类，分类上的 software_count 由 flush 监听在同一事务内增减，
+分类列表不再逐个统计，分类改名也只更新分类本身这一行。
+
+软件、版本的写操作还需调用 mark_software_changed，事务提交后经缓存失效总线
+通知（包括其他 worker 的）搜索索引等派生数据刷新。
+
+目录版本号（catalog_revision）在软件、版本、分类、配置的写事务提交时递增，
+目录类接口以它生成 ETag。下载计数不递增版本号，所以 304 时列表里的下载量可能略旧（弱 ETag）。
+"""
+from collections import Counter
+from typing import Optional
+
+from sqlalchemy import bindparam, event, func, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..core.invalidation import invalidation_bus
+from ..core.versioning import version_sort_key
+from ..models.catalog import CatalogRevision
+from ..models.category import SoftwareCategory
+from ..models.software import Software, SoftwareVersion
+from . import exposure  # noqa: F401  注册版本漏洞暴露面的 flush 监听
+
+CATALOG_REVISION_ID = 1
+
+
+def mark_catalog_changed(db: Session):
+    """记录本事务修改了目录数据（软件、版本、分类、配置），提交时递增目录版本号"""
+    db.info["catalog_changed"] = True
+
+
+def mark_software_changed(db: Session, software_id: int):
+    """记录本事务修改过的软件，提交成功后再通知派生数据（回滚则丢弃）"""
+    invalidation_bus.publish(db, "software", [software_id])
+    mark_catalog_changed(db)
+
+
+def get_or_create_category(db: Session, name: Optional[str]) -> Optional[int]:
+    """按名称返回分类 ID，分类不存在时创建（软件申请中的分类是自由填写的）；名称为空返回 None"""
+    name = (name or "").strip()
+    if not name:
+        return None
+    category_id = db.query(SoftwareCategory.id).filter(SoftwareCategory.name == name).scalar()
+    if category_id is not None:
+        return category_id
+    try:
+        with db.begin_nested():
+            category = SoftwareCategory(name=name[:50])
+            db.add(category)
+        mark_catalog_changed(db)
+        return category.id
+    except IntegrityError:
+        # 并发请求已创建同名分类
+        return db.query(SoftwareCategory.id).filter(SoftwareCategory.name == name[:50]).scalar()
+
+
+def get_catalog_revision(db: Session) -> int:
+    revision = db.execute(
+        select(CatalogRevision.revision).where(CatalogRevision.id == CATALOG_REVISION_ID)
+    ).scalar()
+    return revision or 0
+
+
+def format_catalog_etag(revision: int) -> str:
+    # 带上应用版本，升级后响应结构变化时旧缓存自动失效
+    return f'W/"{settings.APP_VERSION}-{revision}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """按弱比较判断 If-None-Match 是否命中"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    target = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == target:
+            return True
+    return False
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_catalog_revision(session: Session):
+    # 与业务写入在同一事务内递增，回滚时一起撤销
+    if session.info.pop("catalog_changed", False):
+        session.execute(
+            update(CatalogRevision)
+            .where(CatalogRevision.id == CATALOG_REVISION_ID)
+            .values(revision=CatalogRevision.revision + 1)
+        )
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_catalog_changed(session: Session):
+    session.info.pop("catalog_changed", None)
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_category_counts(session: Session, flush_context, instances):
+    # flush 前记录每个分类的软件数变化（此时删除的软件仍可读取分类），flush 后再写入；
+    # 每次 flush 重新记录，失败的 flush 留下的数据不会带到下一次
+    deltas: Counter = Counter()
+    session.info["category_deltas"] = deltas
+    for obj in session.new:
+        if isinstance(obj, Software) and obj.category_id is not None:
+            deltas[obj.category_id] += 1
+    for obj in session.deleted:
+        if isinstance(obj, Software) and obj.category_id is not None:
+            deltas[obj.category_id] -= 1
+    for obj in session.dirty:
+        if isinstance(obj, Software):
+            history = inspect(obj).attrs.category_id.history
+            for old in history.deleted:
+                if old is not None:
+                    deltas[old] -= 1
+            for new in history.added:
+                if new is not None:
+                    deltas[new] += 1
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_category_counts(session: Session, flush_context):
+    deltas = session.info.pop("category_deltas", None) or {}
+    params = [{"_id": cid, "_delta": delta} for cid, delta in sorted(deltas.items()) if delta]
+    if not params:
+        return
+    table = SoftwareCategory.__table__
+    # 原子增减，并发修改同一分类时不会互相覆盖
+    session.connection().execute(
+        update(table)
+        .where(table.c.id == bindparam("_id"))
+        .values(software_count=table.c.software_count + bindparam("_delta")),
+        params
+    )
+
+
+def refresh_software_summary(db: Session, software_id: int):
+    """根据版本表重新计算某个软件的汇总字段（调用方负责 commit）"""
+    mark_software_changed(db, software_id)
+    db.flush()
+    # 锁住软件行，避免并发增删版本时互相覆盖汇总结果
+    db.query(Software.id).filter(Software.id == software_id).with_for_update().first()
+
+    version_count, total_downloads, last_release_at = db.query(
+        func.count(SoftwareVersion.id),
+        func.coalesce(func.sum(SoftwareVersion.download_count), 0),
+        func.max(SoftwareVersion.upload_time)
+    ).filter(SoftwareVersion.software_id == software_id).one()
+
+    # 最新版本按版本号判断（走 software_id + version_key 索引），版本号相同时取最后上传的
+    latest = db.query(SoftwareVersion.version)\
+        .filter(SoftwareVersion.software_id == software_id)\
+        .order_by(SoftwareVersion.version_key.desc(), SoftwareVersion.upload_time.desc(), SoftwareVersion.id.desc())\
+        .first()
+
+    db.query(Software).filter(Software.id == software_id).update({
+        Software.latest_version: latest[0] if latest else None,
+        Software.version_count: version_count,
+        Software.total_downloads: total_downloads,
+        Software.last_release_at: last_release_at,
+        # 汇总字段变化不算软件信息更新，不改变列表排序
+        Software.updated_at: Software.updated_at
+    }, synchronize_session=False)
+
+
+def record_download(db: Session, version: SoftwareVersion):
+    """下载计数 +1：版本计数与软件总下载量用原子 UPDATE 同步递增（调用方负责 commit）"""
+    db.query(SoftwareVersion).filter(SoftwareVersion.id == version.id).update({
+        SoftwareVersion.download_count: SoftwareVersion.download_count + 1
+    }, synchronize_session=False)
+    db.query(Software).filter(Software.id == version.software_id).update({
+        Software.total_downloads: Software.total_downloads + 1,
+        Software.updated_at: Software.updated_at
+    }, synchronize_session=False)
+
+
+# 启动时确保目录版本号行存在（多个 worker 同时启动也不会冲突）
+ENSURE_CATALOG_REVISION_SQL = f"""
+INSERT INTO catalog_revision (id, revision) VALUES ({CATALOG_REVISION_ID}, 0)
+ON CONFLICT (id) DO NOTHING
+"""
+
+
+def backfill_version_keys(conn, batch_size: int = 1000) -> int:
+    """启动迁移：按当前规则计算已有版本的排序键，只写回有变化的（在调用方的连接/事务中执行）；返回更新的版本数"""
+    updated = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(SoftwareVersion.id, SoftwareVersion.version, SoftwareVersion.version_key)
+            .where(SoftwareVersion.id > last_id)
+            .order_by(SoftwareVersion.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return updated
+        changed = []
+        for row in rows:
+            key = version_sort_key(row.version)
+            if key != row.version_key:
+                changed.append({"_id": row.id, "_key": key})
+        if changed:
+            conn.execute(
+                update(SoftwareVersion.__table__)
+                .where(SoftwareVersion.__table__.c.id == bindparam("_id"))
+                .values(version_key=bindparam("_key")),
+                changed
+            )
+            updated += len(changed)
+        last_id = rows[-1].id
+
+
+# 启动迁移时用于回填汇总字段（PostgreSQL / SQLite 通用）
+BACKFILL_SUMMARY_SQL = """
+UPDATE software SET
+    version_count = (SELECT COUNT(*) FROM software_versions v WHERE v.software_id = software.id),
+    total_downloads = (SELECT COALESCE(SUM(v.download_count), 0) FROM software_versions v WHERE v.software_id = software.id),
+    last_release_at = (SELECT MAX(v.upload_time) FROM software_versions v WHERE v.software_id = software.id),
+    latest_version = (
+        SELECT v.version FROM software_versions v WHERE v.software_id = software.id
+        ORDER BY v.version_key DESC, v.upload_time DESC, v.id DESC LIMIT 1
+    )
+"""
+
+
+# 按软件表重新统计分类计数（启动迁移、批量删除软件后使用）
+RECOUNT_CATEGORIES_SQL = """
+UPDATE software_categories SET
+    software_count = (SELECT COUNT(*) FROM software s WHERE s.category_id = software_categories.id)
+"""
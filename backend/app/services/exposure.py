@@ -0,0 +1,134 @@
+"""
+版本漏洞暴露面
+
+version_exposure 保存"目录中的哪个版本受哪个漏洞影响"，由版本排序键与漏洞区间
+在数据库中一次 INSERT ... SELECT 算出。它不需要业务代码显式维护：
+每次 flush 后检查本次新增、修改、删除的版本和漏洞区间，只重算涉及的版本/漏洞。
+软件列表、详情的漏洞标记和暴露面报表都直接读这张表，请求时不再做版本匹配。
+
+批量 query.delete() 不触发 ORM 事件，使用时需自行调用 rebuild_exposure。
+"""
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import and_, delete, event, func, inspect, insert, or_, select
+from sqlalchemy.orm import Session
+
+from ..models.software import SoftwareVersion
+from ..models.vulnerability import Vulnerability, VulnerabilityRange, VersionExposure
+
+SEVERITY_RANK = {"low": 1, "medium": 2, "high": 3, "critical": 4}
+
+_versions = SoftwareVersion.__table__
+_ranges = VulnerabilityRange.__table__
+_exposure = VersionExposure.__table__
+
+
+def _exposure_select():
+    """所有 (版本, 漏洞) 命中对：版本排序键落在漏洞的任一区间内"""
+    key = _versions.c.version_key
+    covered = and_(
+        _versions.c.software_id == _ranges.c.software_id,
+        or_(_ranges.c.lower_key.is_(None), key > _ranges.c.lower_key,
+            and_(key == _ranges.c.lower_key, _ranges.c.lower_inclusive)),
+        or_(_ranges.c.upper_key.is_(None), key < _ranges.c.upper_key,
+            and_(key == _ranges.c.upper_key, _ranges.c.upper_inclusive)),
+    )
+    return select(_versions.c.id, _ranges.c.vulnerability_id, _versions.c.software_id)\
+        .select_from(_ranges.join(_versions, covered))\
+        .distinct()
+
+
+def refresh_exposure(conn, vulnerability_ids: Iterable[int] = (), version_ids: Iterable[int] = ()):
+    """重算指定漏洞、指定版本的暴露记录"""
+    columns = ["software_version_id", "vulnerability_id", "software_id"]
+    vulnerability_ids, version_ids = list(vulnerability_ids), list(version_ids)
+    if vulnerability_ids:
+        conn.execute(delete(_exposure).where(_exposure.c.vulnerability_id.in_(vulnerability_ids)))
+        conn.execute(insert(_exposure).from_select(
+            columns, _exposure_select().where(_ranges.c.vulnerability_id.in_(vulnerability_ids))
+        ))
+    if version_ids:
+        conn.execute(delete(_exposure).where(_exposure.c.software_version_id.in_(version_ids)))
+        conn.execute(insert(_exposure).from_select(
+            columns, _exposure_select().where(_versions.c.id.in_(version_ids))
+        ))
+
+
+def rebuild_exposure(conn):
+    """全量重建（启动迁移、批量删除数据后使用）"""
+    conn.execute(delete(_exposure))
+    conn.execute(insert(_exposure).from_select(
+        ["software_version_id", "vulnerability_id", "software_id"], _exposure_select()
+    ))
+
+
+def _version_changed(version: SoftwareVersion) -> bool:
+    state = inspect(version)
+    return any(state.attrs[name].history.has_changes() for name in ("version_key", "software_id"))
+
+
+@event.listens_for(Session, "after_flush")
+def _maintain_exposure(session: Session, flush_context):
+    vulnerability_ids: Set[int] = set()
+    version_ids: Set[int] = set()
+    for obj in session.new:
+        if isinstance(obj, SoftwareVersion):
+            version_ids.add(obj.id)
+        elif isinstance(obj, VulnerabilityRange):
+            vulnerability_ids.add(obj.vulnerability_id)
+    for obj in session.dirty:
+        if isinstance(obj, SoftwareVersion) and _version_changed(obj):
+            version_ids.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, SoftwareVersion):
+            version_ids.add(obj.id)
+        elif isinstance(obj, VulnerabilityRange):
+            vulnerability_ids.add(obj.vulnerability_id)
+        elif isinstance(obj, Vulnerability):
+            vulnerability_ids.add(obj.id)
+    if vulnerability_ids or version_ids:
+        refresh_exposure(session.connection(), vulnerability_ids, version_ids)
+
+
+# ---- 查询 ----
+
+def _max_severity(current: Optional[str], severity: Optional[str]) -> Optional[str]:
+    if SEVERITY_RANK.get(severity, 0) > SEVERITY_RANK.get(current, 0):
+        return severity
+    return current
+
+
+def version_badges(db: Session, version_ids: Iterable[int]) -> Dict[int, Tuple[int, Optional[str]]]:
+    """版本 ID -> (漏洞数, 最高严重程度)"""
+    version_ids = list(version_ids)
+    if not version_ids:
+        return {}
+    rows = db.query(VersionExposure.software_version_id, Vulnerability.severity)\
+        .join(Vulnerability, Vulnerability.id == VersionExposure.vulnerability_id)\
+        .filter(VersionExposure.software_version_id.in_(version_ids))\
+        .all()
+    badges: Dict[int, Tuple[int, Optional[str]]] = {}
+    for version_id, severity in rows:
+        count, worst = badges.get(version_id, (0, None))
+        badges[version_id] = (count + 1, _max_severity(worst, severity))
+    return badges
+
+
+def software_badges(db: Session, software_ids: Iterable[int]) -> Dict[int, Tuple[int, Optional[str]]]:
+    """软件 ID -> (受影响的版本数, 最高严重程度)"""
+    software_ids = list(software_ids)
+    if not software_ids:
+        return {}
+    rows = db.query(VersionExposure.software_id, Vulnerability.severity)\
+        .join(Vulnerability, Vulnerability.id == VersionExposure.vulnerability_id)\
+        .filter(VersionExposure.software_id.in_(software_ids))\
+        .distinct()\
+        .all()
+    worst: Dict[int, Optional[str]] = {}
+    for software_id, severity in rows:
+        worst[software_id] = _max_severity(worst.get(software_id), severity)
+    counts = db.query(VersionExposure.software_id, func.count(func.distinct(VersionExposure.software_version_id)))\
+        .filter(VersionExposure.software_id.in_(software_ids))\
+        .group_by(VersionExposure.software_id)\
+        .all()
+    return {sid: (count, worst.get(sid)) for sid, count in counts}
@@ -0,0 +1,298 @@
+"""
+LDAP/AD 用户批量同步
+
+目录用户原本在首次登录时才创建本地记录，管理界面看到的用户不完整。
+这里定期（以及管理员手动触发时）分页遍历目录，按批写入本地用户表：
+
+- 目录中新出现的用户：创建本地记录（auth_source=ldap，角色为 ldap_default_role）；
+- 已同步过的目录用户：更新邮箱，并记录本次同步时间 ldap_synced_at；
+- 同名的本地账号不受影响（本地账号不走 LDAP 认证）；
+- 完整遍历结束后，本次未出现在目录中的 LDAP 用户标记为禁用并递增 token_version，已签发的 token 立即失效。
+
+目录按页读取、数据库按批提交，内存占用与目录规模无关。
+遍历中途失败时不禁用任何用户；目录返回 0 个用户时（通常是 base_dn / 过滤器配置错误）也不禁用。
+多个 worker 同时到点时，PostgreSQL 上用 advisory lock 保证只有一个在运行。
+"""
+import asyncio
+import logging
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func, select, text, update
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..core.database import SessionLocal, engine
+from ..core.invalidation import invalidation_bus
+from ..core.ldap import UNUSABLE_PASSWORD, get_directory
+from ..core.runtime_config import LdapConfig, config_service
+from ..models.user import User, UserRole
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL advisory lock 的键（任意固定值，各 worker 一致即可）
+SYNC_LOCK_KEY = 0x4C444150
+
+ROLE_MAP = {"admin": UserRole.ADMIN, "ops": UserRole.OPS, "user": UserRole.USER}
+
+
+@dataclass
+class LdapSyncResult:
+    """一次同步的统计"""
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    duration_ms: Optional[float] = None
+    seen: int = 0
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    skipped_local: int = 0  # 与本地账号同名，未处理
+    skipped_invalid: int = 0  # 用户名过长等无法写入的条目
+    deactivated: int = 0
+    batches: int = 0
+    error: Optional[str] = None
+    warnings: List[str] = field(default_factory=list)
+
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _apply_batch(db: Session, batch: List[Tuple[str, Optional[str]]], synced_at: datetime,
+                 role: UserRole, result: LdapSyncResult):
+    """写入一批目录用户（调用方负责 commit）"""
+    # 同一批内重复的用户名以最后一条为准
+    entries: Dict[str, Optional[str]] = {}
+    for username, mail in batch:
+        if len(username) > 50 or (mail and len(mail) > 100):
+            result.skipped_invalid += 1
+            continue
+        entries[username] = mail
+    if not entries:
+        return
+
+    existing = {
+        user.username: user
+        for user in db.query(User).filter(User.username.in_(list(entries)))
+    }
+    # 邮箱唯一：已被其他用户占用的邮箱不写入
+    mails = {mail for mail in entries.values() if mail}
+    mail_owners = dict(
+        db.query(User.email, User.username).filter(User.email.in_(list(mails))).all()
+    ) if mails else {}
+
+    def usable_mail(username: str, mail: Optional[str]) -> Optional[str]:
+        if not mail:
+            return None
+        owner = mail_owners.get(mail)
+        if owner is not None and owner != username:
+            return None
+        mail_owners[mail] = username
+        return mail
+
+    seen_ids = []
+    changed_ids = []
+    for username, mail in entries.items():
+        user = existing.get(username)
+        if user is None:
+            db.add(User(
+                username=username,
+                hashed_password=UNUSABLE_PASSWORD,
+                email=usable_mail(username, mail),
+                role=role,
+                auth_source="ldap",
+                ldap_synced_at=synced_at,
+            ))
+            result.created += 1
+            continue
+        if user.auth_source != "ldap":
+            result.skipped_local += 1
+            continue
+        seen_ids.append(user.id)
+        mail = usable_mail(username, mail)
+        if mail and mail != user.email:
+            user.email = mail
+            changed_ids.append(user.id)
+            result.updated += 1
+        else:
+            result.unchanged += 1
+
+    if seen_ids:
+        # 未变化的用户只更新同步时间，一批一条语句
+        db.execute(
+            update(User).where(User.id.in_(seen_ids)).values(ldap_synced_at=synced_at),
+            execution_options={"synchronize_session": False}
+        )
+    if changed_ids:
+        invalidation_bus.publish(db, "user", changed_ids)
+
+
+def _deactivate_missing(db: Session, synced_at: datetime) -> int:
+    """禁用本次同步未出现的 LDAP 用户，并使其 token 失效（调用方负责 commit）"""
+    # 同步开始后才通过登录创建的用户没有同步时间，按创建时间排除
+    missing = db.execute(
+        select(User.id).where(
+            User.auth_source == "ldap",
+            User.is_active.is_(True),
+            (User.ldap_synced_at.is_(None) | (User.ldap_synced_at < synced_at)),
+            User.created_at < synced_at,
+        )
+    ).scalars().all()
+    for chunk in _batched(missing, 1000):
+        db.execute(
+            update(User).where(User.id.in_(chunk)).values(
+                is_active=False, token_version=func.coalesce(User.token_version, 0) + 1
+            ),
+            execution_options={"synchronize_session": False}
+        )
+    if missing:
+        invalidation_bus.publish(db, "user", missing)
+    return len(missing)
+
+
+def sync_ldap_users(db: Session, config: LdapConfig, entries: Optional[Iterable[Tuple[str, Optional[str]]]] = None,
+                    batch_size: Optional[int] = None) -> LdapSyncResult:
+    """同步目录用户到本地用户表（阻塞，在线程中运行）
+
+    entries 为 None 时按 config 分页遍历目录；也可传入 (用户名, 邮箱) 序列，
+    例如 LdapDirectory.iter_users(conn=...) 使用指定连接遍历。
+    """
+    started = time.perf_counter()
+    # 以数据库时间为准，与 created_at 的默认值可比较
+    synced_at = db.execute(select(func.now())).scalar()
+    if isinstance(synced_at, str):
+        # SQLite 返回文本
+        synced_at = datetime.fromisoformat(synced_at)
+    # SQLite 的时间只精确到秒：保证本次同步时间晚于上一次，否则同一秒内的两次同步分不出未出现的用户
+    last_synced_at = db.execute(select(func.max(User.ldap_synced_at))).scalar()
+    if last_synced_at is not None and synced_at <= last_synced_at:
+        synced_at = last_synced_at + timedelta(milliseconds=1)
+    db.commit()
+    result = LdapSyncResult(started_at=synced_at)
+    role = ROLE_MAP.get(config.default_role, UserRole.USER)
+    batch_size = batch_size or settings.LDAP_SYNC_BATCH_SIZE
+    if entries is None:
+        entries = get_directory(config).iter_users(settings.LDAP_SYNC_PAGE_SIZE)
+
+    try:
+        for batch in _batched(entries, batch_size):
+            result.seen += len(batch)
+            _apply_batch(db, batch, synced_at, role, result)
+            db.commit()
+            # 已提交的对象不再需要，避免身份映射随目录规模增长
+            db.expunge_all()
+            result.batches += 1
+
+        if result.seen == 0:
+            result.warnings.append("目录未返回任何用户，跳过禁用（请检查 base_dn 与用户过滤器）")
+        else:
+            result.deactivated = _deactivate_missing(db, synced_at)
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        result.error = str(e)
+        logger.exception(f"LDAP 用户同步失败: {e}")
+    finally:
+        result.duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        result.finished_at = datetime.utcnow()
+    logger.info(
+        f"LDAP 用户同步完成: 目录 {result.seen} 个, 新建 {result.created}, 更新 {result.updated}, "
+        f"禁用 {result.deactivated}, 耗时 {result.duration_ms}ms"
+    )
+    return result
+
+
+class LdapSyncJob:
+    """定期同步目录用户（LDAP_SYNC_INTERVAL 秒一次，0 表示只手动触发）"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._running: Optional[asyncio.Task] = None
+        self._runs = 0
+        self._skipped = 0
+        self._last_result: Optional[LdapSyncResult] = None
+
+    def _sync(self) -> Optional[LdapSyncResult]:
+        lock_conn = None
+        if engine.dialect.name == "postgresql":
+            # 多个 worker 只运行一个；锁在会话级连接上，运行结束后释放
+            lock_conn = engine.connect()
+            if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": SYNC_LOCK_KEY}).scalar():
+                lock_conn.close()
+                return None
+        db = SessionLocal()
+        try:
+            config = config_service.get(db).ldap
+            if not config.enabled or not config.complete:
+                return None
+            return sync_ldap_users(db, config)
+        finally:
+            db.close()
+            if lock_conn is not None:
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": SYNC_LOCK_KEY})
+                lock_conn.close()
+
+    async def _run_once(self):
+        result = await asyncio.to_thread(self._sync)
+        if result is None:
+            self._skipped += 1
+        else:
+            self._runs += 1
+            self._last_result = result
+
+    def trigger(self) -> bool:
+        """立即开始一次同步；已有同步在运行时返回 False"""
+        if self._running is not None and not self._running.done():
+            return False
+        self._running = asyncio.get_running_loop().create_task(self._run_once())
+        return True
+
+    @property
+    def running(self) -> bool:
+        return self._running is not None and not self._running.done()
+
+    def start(self):
+        if self.interval <= 0 or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        for task in (self._task, self._running):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = None
+        self._running = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.trigger():
+                try:
+                    await asyncio.shield(self._running)
+                except Exception as e:
+                    logger.warning(f"LDAP 定时同步失败: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "interval": self.interval,
+            "running": self.running,
+            "runs": self._runs,
+            "skipped": self._skipped,
+            "last_result": asdict(self._last_result) if self._last_result else None,
+        }
+
+
+ldap_sync_job = LdapSyncJob(settings.LDAP_SYNC_INTERVAL)
@@ -0,0 +1,245 @@
+"""
+NVD 漏洞数据导入
+
+流式读取 NVD CVE JSON 2.0 数据文件（可为 .gz），把 configurations 中受影响的 CPE
+按产品名匹配到目录中的软件，每个 (CVE, 软件) 生成或更新一条漏洞记录，分批提交。
+
+- CPE 的 product（或 vendor + product）去掉空格、下划线、连字符、点后与软件名比较；
+- versionStart*/versionEnd* 转成 affected_versions 的比较式（如 ">=1.0 <1.5"），
+  CPE 中的具体版本作为单个版本，多个范围用 " || " 连接；
+- content_hash 为 CVE 内容的 SHA-256，重复导入时内容未变的记录直接跳过；
+  CVE 更新后不再匹配的软件、以及被 NVD 撤销（Rejected）的 CVE，删除之前导入的记录。
+"""
+import gzip
+import hashlib
+import io
+import json
+import logging
+import re
+from dataclasses import asdict, dataclass
+from typing import IO, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..core.json_stream import iter_json_array
+from ..models.software import Software
+from ..models.vulnerability import Vulnerability
+from .vulnerability_index import compile_vulnerability_ranges, mark_vulnerabilities_changed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+
+_NAME_NORMALIZE_RE = re.compile(r"[\s_\-.]+")
+_SEVERITIES = {"critical", "high", "medium", "low"}
+# 依次尝试的 CVSS 指标
+_METRIC_KEYS = ("cvssMetricV40", "cvssMetricV31", "cvssMetricV30", "cvssMetricV2")
+
+
+@dataclass
+class ImportStats:
+    cves: int = 0  # 读取的 CVE 数
+    matched: int = 0  # 匹配到目录软件的 CVE 数
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def normalize_name(name: str) -> str:
+    return _NAME_NORMALIZE_RE.sub("", name.strip().lower())
+
+
+def open_feed(fileobj: IO[bytes]) -> IO[str]:
+    """按文件头自动识别 gzip，返回文本流"""
+    stream = fileobj if isinstance(fileobj, io.BufferedIOBase) else io.BufferedReader(fileobj)
+    if stream.peek(2)[:2] == b"\x1f\x8b":
+        stream = gzip.GzipFile(fileobj=stream, mode="rb")
+    return io.TextIOWrapper(stream, encoding="utf-8")
+
+
+# ---- CVE 解析 ----
+
+def _unescape_cpe(value: str) -> str:
+    return value.replace("\\", "")
+
+
+def _parse_cpe(criteria: str) -> Optional[Tuple[str, str, str]]:
+    """cpe:2.3:part:vendor:product:version:... -> (vendor, product, version)"""
+    parts = re.split(r"(?<!\\):", criteria)
+    if len(parts) < 6 or parts[0] != "cpe":
+        return None
+    return _unescape_cpe(parts[3]), _unescape_cpe(parts[4]), _unescape_cpe(parts[5])
+
+
+def _range_expression(match: dict, version: str) -> str:
+    bounds = []
+    if match.get("versionStartIncluding"):
+        bounds.append(f">={match['versionStartIncluding']}")
+    if match.get("versionStartExcluding"):
+        bounds.append(f">{match['versionStartExcluding']}")
+    if match.get("versionEndIncluding"):
+        bounds.append(f"<={match['versionEndIncluding']}")
+    if match.get("versionEndExcluding"):
+        bounds.append(f"<{match['versionEndExcluding']}")
+    if bounds:
+        return " ".join(bounds)
+    if version in ("*", "-", ""):
+        return "*"
+    return version
+
+
+def _iter_cpe_matches(nodes: Iterable[dict]):
+    for node in nodes:
+        if node.get("negate"):
+            continue
+        for match in node.get("cpeMatch", ()):
+            if match.get("vulnerable", True):
+                yield match
+        yield from _iter_cpe_matches(node.get("children", ()))
+
+
+def _severity(metrics: dict) -> str:
+    for key in _METRIC_KEYS:
+        for metric in metrics.get(key, ()):
+            value = (metric.get("cvssData", {}).get("baseSeverity") or metric.get("baseSeverity") or "").lower()
+            if value in _SEVERITIES:
+                return value
+            if value == "none":
+                return "low"
+    # 未评分的 CVE 按中危处理
+    return "medium"
+
+
+def _description(cve: dict) -> str:
+    descriptions = cve.get("descriptions", ())
+    for item in descriptions:
+        if item.get("lang") == "en":
+            return item.get("value", "")
+    return descriptions[0].get("value", "") if descriptions else ""
+
+
+def _content_hash(cve: dict) -> str:
+    raw = json.dumps(cve, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _CVE:
+    """一条 CVE 中导入需要的字段；affected 为 软件 ID -> 影响范围表达式列表"""
+
+    def __init__(self, cve: dict, software_names: Dict[str, int]):
+        self.cve_id = cve.get("id")
+        self.rejected = cve.get("vulnStatus") == "Rejected"
+        self.content_hash = _content_hash(cve)
+        self.raw = cve
+        self.affected: Dict[int, List[str]] = {}
+        for configuration in cve.get("configurations", ()):
+            for match in _iter_cpe_matches(configuration.get("nodes", ())):
+                parsed = _parse_cpe(match.get("criteria", ""))
+                if parsed is None:
+                    continue
+                vendor, product, version = parsed
+                software_id = software_names.get(normalize_name(product)) \
+                    or software_names.get(normalize_name(vendor + product))
+                if software_id is None:
+                    continue
+                expressions = self.affected.setdefault(software_id, [])
+                expression = _range_expression(match, version)
+                if expression not in expressions:
+                    expressions.append(expression)
+
+    def apply(self, vulnerability: Vulnerability, software_id: int):
+        cve = self.raw
+        expressions = self.affected[software_id]
+        description = _description(cve)
+        vulnerability.software_id = software_id
+        vulnerability.cve_id = self.cve_id
+        vulnerability.severity = _severity(cve.get("metrics", {}))
+        vulnerability.title = f"{self.cve_id}: {description}"[:255]
+        vulnerability.description = description
+        vulnerability.affected_versions = "*" if "*" in expressions else " || ".join(expressions)
+        # 只有一个 "<x" 范围时，x 即修复版本
+        single = expressions[0] if len(expressions) == 1 else ""
+        vulnerability.fixed_version = single.rsplit("<", 1)[1][:50] if re.search(r"(^|\s)<[^=]", single) else None
+        vulnerability.reference_url = next(
+            (ref["url"] for ref in cve.get("references", ()) if ref.get("url")),
+            f"https://nvd.nist.gov/vuln/detail/{self.cve_id}"
+        )[:500]
+        vulnerability.content_hash = self.content_hash
+
+
+# ---- 导入 ----
+
+def load_software_names(db: Session) -> Dict[str, int]:
+    return {normalize_name(name): sid for sid, name in db.query(Software.id, Software.name)}
+
+
+def _import_batch(db: Session, batch: List[_CVE], stats: ImportStats):
+    existing: Dict[str, Dict[int, Vulnerability]] = {}
+    rows = db.query(Vulnerability).filter(
+        Vulnerability.cve_id.in_([cve.cve_id for cve in batch]),
+        Vulnerability.content_hash.isnot(None)  # 只处理导入生成的记录，手工录入的不动
+    ).all()
+    for row in rows:
+        existing.setdefault(row.cve_id, {})[row.software_id] = row
+
+    for cve in batch:
+        current = existing.get(cve.cve_id, {})
+        affected = {} if cve.rejected else cve.affected
+        if affected:
+            stats.matched += 1
+        for software_id, vulnerability in current.items():
+            if software_id not in affected:
+                mark_vulnerabilities_changed(db, [software_id])
+                db.delete(vulnerability)
+                stats.deleted += 1
+        for software_id in affected:
+            vulnerability = current.get(software_id)
+            if vulnerability is not None and vulnerability.content_hash == cve.content_hash:
+                stats.unchanged += 1
+                continue
+            if vulnerability is None:
+                vulnerability = Vulnerability()
+                db.add(vulnerability)
+                stats.created += 1
+            else:
+                stats.updated += 1
+            cve.apply(vulnerability, software_id)
+            compile_vulnerability_ranges(db, vulnerability)
+
+
+def import_nvd_feed(db: Session, feed: IO[str], batch_size: int = DEFAULT_BATCH_SIZE,
+                    software_names: Optional[Dict[str, int]] = None) -> ImportStats:
+    """导入一个 NVD JSON 2.0 数据文件（文本流），每批 batch_size 条 CVE 提交一次"""
+    if software_names is None:
+        software_names = load_software_names(db)
+    stats = ImportStats()
+    batch: List[_CVE] = []
+    seen: Set[str] = set()
+
+    def flush():
+        _import_batch(db, batch, stats)
+        db.commit()
+        batch.clear()
+        seen.clear()
+
+    for item in iter_json_array(feed, "vulnerabilities"):
+        cve = item.get("cve") if isinstance(item, dict) else None
+        if not cve or not cve.get("id"):
+            continue
+        stats.cves += 1
+        if cve["id"] in seen:
+            # 同一批内重复出现的 CVE 以后出现的为准
+            flush()
+        seen.add(cve["id"])
+        batch.append(_CVE(cve, software_names))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    logger.info(f"NVD 数据导入完成: {stats.as_dict()}")
+    return stats
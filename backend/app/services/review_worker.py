@@ -0,0 +1,169 @@
+"""
+AI 自动审核队列
+
+新建申请只把 ID 放入队列，由常驻的审核协程攒批处理：
+一次查询取回整批申请，同一 (下载域名, 软件名) 只调用一次模型，
+模型调用并发受限，审核结果在同一个事务中写回。
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from ..core.config import settings
+from ..core.database import SessionLocal
+from ..models.request import SoftwareRequest, RequestStatus
+from ..models.software import Software
+from .ai_service import AIService, verdict_cache_key
+from .catalog import mark_software_changed, get_or_create_category
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_USER_ID = 1  # 系统账户ID
+
+
+class ReviewWorker:
+    def __init__(self, batch_size: int, batch_window: float, concurrency: int):
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.concurrency = concurrency
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._downloads: Set[asyncio.Task] = set()
+
+    def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._downloads):
+            task.cancel()
+        if self._downloads:
+            await asyncio.gather(*self._downloads, return_exceptions=True)
+
+    def submit(self, request_id: int):
+        """提交一个待审核的申请（未启动时自动启动）"""
+        self.start()
+        self._queue.put_nowait(request_id)
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            # 稍等片刻，让同一时段提交的申请合并成一批
+            await asyncio.sleep(self.batch_window)
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self.review_batch(batch)
+            except Exception as e:
+                logger.exception(f"AI 批量审核失败 {batch}: {e}")
+
+    async def review_batch(self, request_ids: List[int]):
+        db = SessionLocal()
+        try:
+            ai_service = AIService(db)
+            if not ai_service.auto_review_enabled:
+                return
+
+            requests = db.query(SoftwareRequest).filter(
+                SoftwareRequest.id.in_(request_ids),
+                SoftwareRequest.status == RequestStatus.PENDING
+            ).order_by(SoftwareRequest.id.asc()).all()
+            if not requests:
+                return
+
+            # 同一 (域名, 软件名) 只问一次模型
+            groups: Dict[Tuple[str, str], List[SoftwareRequest]] = {}
+            for req in requests:
+                data = _request_data(req)
+                key = verdict_cache_key(data)
+                groups.setdefault(key if key[0] else ("", str(req.id)), []).append(req)
+
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def review(req: SoftwareRequest):
+                async with semaphore:
+                    return await ai_service.review_software_request(_request_data(req))
+
+            verdicts = await asyncio.gather(*[review(group[0]) for group in groups.values()])
+
+            downloads = []
+            for group, verdict in zip(groups.values(), verdicts):
+                for req in group:
+                    download = _apply_verdict(db, req, verdict)
+                    if download:
+                        downloads.append(download)
+            db.commit()
+        finally:
+            db.close()
+
+        for download in downloads:
+            self._spawn_download(*download)
+
+    def _spawn_download(self, url: str, software_id: int, version: str):
+        from ..api.request import download_software_from_url
+
+        task = asyncio.get_running_loop().create_task(
+            download_software_from_url(url, software_id, version, SYSTEM_USER_ID)
+        )
+        self._downloads.add(task)
+        task.add_done_callback(self._downloads.discard)
+
+
+def _request_data(req: SoftwareRequest) -> dict:
+    return {
+        "software_name": req.software_name,
+        "version": req.version,
+        "download_url": req.download_url,
+        "category": req.category,
+        "description": req.description
+    }
+
+
+def _apply_verdict(db, software_request: SoftwareRequest, review_result: dict) -> Optional[Tuple[str, int, str]]:
+    """写回审核结果；批准时返回需要下载的 (url, software_id, version)"""
+    if not review_result.get("approved", False):
+        # AI审核未通过，但仍然保持PENDING状态，以便人工审核
+        software_request.review_comment = f"AI自动审核建议拒绝: {review_result.get('reason', '自动拒绝原因未知')}\n{software_request.review_comment or ''}".strip()
+        software_request.reviewer_id = SYSTEM_USER_ID
+        return None
+
+    # AI审核通过，自动批准申请
+    software_request.status = RequestStatus.APPROVED
+    software_request.review_comment = f"AI自动审核通过: {review_result.get('reason', '自动批准')}"
+    software_request.reviewer_id = SYSTEM_USER_ID
+    software_request.reviewed_at = datetime.utcnow()
+
+    # 检查软件是否已存在
+    software = db.query(Software).filter(Software.name == software_request.software_name).first()
+    if not software:
+        software = Software(
+            name=software_request.software_name,
+            description=software_request.description,
+            category_id=get_or_create_category(db, software_request.category),
+            logo=software_request.logo,
+            official_url=software_request.official_url,
+            created_by=SYSTEM_USER_ID
+        )
+        db.add(software)
+        db.flush()
+        mark_software_changed(db, software.id)
+
+    software_request.software_id = software.id
+    return software_request.download_url, software.id, software_request.version
+
+
+review_worker = ReviewWorker(
+    batch_size=settings.AI_REVIEW_BATCH_SIZE,
+    batch_window=settings.AI_REVIEW_BATCH_WINDOW,
+    concurrency=settings.AI_REVIEW_CONCURRENCY,
+)
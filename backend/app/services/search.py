@@ -0,0 +1,453 @@
+"""
+软件目录搜索
+
+在软件名称、描述、分类和版本更新说明中检索，结果按相关度排序并返回高亮片段。
+
+- PostgreSQL：使用 pg_trgm 三元组索引 + simple 配置的 tsvector 索引，由数据库完成匹配和排序；
+- 其他数据库（或无法创建 pg_trgm 扩展时）：使用进程内的 n-gram 倒排索引。
+  二元组切分对中文同样有效，不依赖分词器；少量错字也能命中（按命中比例判定）。
+"""
+import heapq
+import html
+import logging
+import math
+import re
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..core.invalidation import invalidation_bus
+from ..models.category import SoftwareCategory
+from ..models.software import Software, SoftwareVersion
+
+logger = logging.getLogger(__name__)
+
+# 字段权重：名称 > 分类 > 描述 > 更新说明
+FIELD_WEIGHTS = {"name": 4.0, "category": 2.0, "description": 1.0, "notes": 0.5}
+# 查询 n-gram 至少命中的比例（小于 1 以容忍错字）
+MIN_MATCH_RATIO = 0.6
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize(value: Optional[str]) -> str:
+    return unicodedata.normalize("NFKC", value or "").lower()
+
+
+def ngrams(value: str) -> Set[str]:
+    """按词切分后取字符二元组；单字符的词保留原字符"""
+    grams: Set[str] = set()
+    for word in _WORD_RE.findall(value):
+        if len(word) == 1:
+            grams.add(word)
+        else:
+            grams.update(word[i:i + 2] for i in range(len(word) - 1))
+    return grams
+
+
+@dataclass
+class SearchHit:
+    software_id: int
+    score: float
+    highlights: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class _Doc:
+    name: str
+    category: str
+    description: str
+    notes: str
+    raw_name: str
+    raw_description: str
+    raw_category: Optional[str]
+
+    def __post_init__(self):
+        self.weighted = (
+            (FIELD_WEIGHTS["name"], self.name),
+            (FIELD_WEIGHTS["category"], self.category),
+            (FIELD_WEIGHTS["description"], self.description),
+            (FIELD_WEIGHTS["notes"], self.notes),
+        )
+        self.all_text = "\n".join((self.name, self.category, self.description, self.notes))
+
+
+def _spans(text_norm: str, query: str, grams: Iterable[str]) -> List[Tuple[int, int]]:
+    """找出需要高亮的区间：优先整串匹配，否则合并命中的 n-gram"""
+    spans: List[Tuple[int, int]] = []
+    if query:
+        start = text_norm.find(query)
+        while start != -1:
+            spans.append((start, start + len(query)))
+            start = text_norm.find(query, start + len(query))
+    if not spans:
+        for gram in grams:
+            start = text_norm.find(gram)
+            while start != -1:
+                spans.append((start, start + len(gram)))
+                start = text_norm.find(gram, start + 1)
+    spans.sort()
+    merged: List[Tuple[int, int]] = []
+    for s, e in spans:
+        if merged and s <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+        else:
+            merged.append((s, e))
+    return merged
+
+
+def highlight(raw: Optional[str], query: str, grams: Iterable[str], window: Optional[int] = None) -> Optional[str]:
+    """返回带 <mark> 的 HTML 片段（原文已转义）；没有命中时返回 None。
+
+    window 不为空时只截取首个命中附近的上下文。
+    """
+    if not raw:
+        return None
+    text_norm = normalize(raw)
+    # NFKC 可能改变长度，此时无法按位置映射回原文，直接在规范化文本上高亮
+    source = raw if len(text_norm) == len(raw) else text_norm
+    spans = _spans(text_norm, query, grams)
+    if not spans:
+        return None
+
+    begin, end = 0, len(source)
+    if window is not None:
+        begin = max(0, spans[0][0] - window)
+        end = min(len(source), spans[0][1] + window)
+        spans = [(s, e) for s, e in spans if s >= begin and e <= end]
+
+    parts = ["…" if begin > 0 else ""]
+    cursor = begin
+    for s, e in spans:
+        parts.append(html.escape(source[cursor:s]))
+        parts.append(f"<mark>{html.escape(source[s:e])}</mark>")
+        cursor = e
+    parts.append(html.escape(source[cursor:end]))
+    parts.append("…" if end < len(source) else "")
+    return "".join(parts)
+
+
+def build_highlights(name: str, description: Optional[str], category: Optional[str], query: str) -> Dict[str, str]:
+    q = normalize(query).strip()
+    grams = ngrams(q)
+    result = {}
+    for key, raw, window in (("name", name, None), ("description", description, 40), ("category", category, None)):
+        marked = highlight(raw, q, grams, window)
+        if marked:
+            result[key] = marked
+    return result
+
+
+class NgramSearchIndex:
+    """进程内 n-gram 倒排索引。
+
+    倒排表只存文档 ID（array('i')，内存紧凑）；命中比例和字段得分在候选文档的
+    规范化文本上用子串判断计算。查询时先用最稀有的 n-gram 生成候选集：
+    若一篇文档连这几个 n-gram 都没有命中，就不可能达到最低命中比例。
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, array] = {}
+        self._docs: Dict[int, _Doc] = {}
+        self._dirty: Set[int] = set()
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    # ---- 维护 ----
+
+    def invalidate(self, software_ids: Iterable[int]):
+        """标记需要重新加载的软件（在事务提交后调用）"""
+        with self._lock:
+            self._dirty.update(software_ids)
+
+    def on_invalidate(self, software_ids: Optional[List[int]]):
+        """缓存失效总线回调；None 表示整体重新加载"""
+        if software_ids is None:
+            self.reset()
+        else:
+            self.invalidate(software_ids)
+
+    def reset(self):
+        with self._lock:
+            self._postings.clear()
+            self._docs.clear()
+            self._dirty.clear()
+            self._loaded = False
+
+    def _add(self, software_id: int, doc: _Doc):
+        self._docs[software_id] = doc
+        for gram in ngrams(doc.all_text):
+            posting = self._postings.get(gram)
+            if posting is None:
+                posting = self._postings[gram] = array("i")
+            posting.append(software_id)
+
+    def _remove(self, software_id: int):
+        doc = self._docs.pop(software_id, None)
+        if doc is None:
+            return
+        for gram in ngrams(doc.all_text):
+            posting = self._postings.get(gram)
+            if posting is None:
+                continue
+            try:
+                posting.remove(software_id)
+            except ValueError:
+                pass
+            if not posting:
+                del self._postings[gram]
+
+    @staticmethod
+    def _load_docs(db: Session, software_ids: Optional[Set[int]] = None) -> Dict[int, _Doc]:
+        query = db.query(Software.id, Software.name, Software.description, SoftwareCategory.name)\
+            .outerjoin(SoftwareCategory, SoftwareCategory.id == Software.category_id)
+        notes_query = db.query(SoftwareVersion.software_id, SoftwareVersion.release_notes)\
+            .filter(SoftwareVersion.release_notes.isnot(None))
+        if software_ids is not None:
+            query = query.filter(Software.id.in_(software_ids))
+            notes_query = notes_query.filter(SoftwareVersion.software_id.in_(software_ids))
+
+        notes: Dict[int, List[str]] = {}
+        for software_id, release_notes in notes_query:
+            notes.setdefault(software_id, []).append(release_notes)
+
+        docs = {}
+        for software_id, name, description, category in query:
+            docs[software_id] = _Doc(
+                name=normalize(name),
+                category=normalize(category),
+                description=normalize(description),
+                notes=normalize("\n".join(notes.get(software_id, []))),
+                raw_name=name,
+                raw_description=description,
+                raw_category=category,
+            )
+        return docs
+
+    def _sync(self, db: Session):
+        with self._lock:
+            if not self._loaded:
+                self._postings.clear()
+                self._docs.clear()
+                self._dirty.clear()
+                for software_id, doc in self._load_docs(db).items():
+                    self._add(software_id, doc)
+                self._loaded = True
+                logger.info(f"搜索索引已加载: {len(self._docs)} 个软件, {len(self._postings)} 个 n-gram")
+                return
+            if self._dirty:
+                dirty, self._dirty = self._dirty, set()
+                fresh = self._load_docs(db, dirty)
+                for software_id in dirty:
+                    self._remove(software_id)
+                    if software_id in fresh:
+                        self._add(software_id, fresh[software_id])
+
+    # ---- 查询 ----
+
+    def _candidates(self, grams: List[str], min_match: int) -> List[int]:
+        """统计每篇文档命中的查询 n-gram 数（Counter 在 C 层累加倒排表），返回达到最低命中数的文档"""
+        hit_counts: Counter = Counter()
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting:
+                hit_counts.update(posting)
+        return [software_id for software_id, hits in hit_counts.items() if hits >= min_match]
+
+    def search(
+        self,
+        db: Session,
+        query: str,
+        category: Optional[str] = None,
+        offset: int = 0,
+        limit: int = 20
+    ) -> Tuple[int, List[SearchHit]]:
+        self._sync(db)
+        q = normalize(query).strip()
+        if not q:
+            return 0, []
+        grams = sorted(ngrams(q))
+
+        with self._lock:
+            if any(len(g) > 1 for g in grams):
+                min_match = max(1, math.ceil(len(grams) * MIN_MATCH_RATIO))
+                candidates = self._candidates(grams, min_match)
+            else:
+                # 单字查询（倒排表里只有单字词才有单字 n-gram）或纯符号，退化为整串匹配
+                candidates = [i for i, d in self._docs.items() if q in d.all_text]
+
+            n = len(grams)
+            # (-得分, ID)：元组直接比较，便于用堆只取当前页
+            scored: List[Tuple[float, int]] = []
+            for software_id in candidates:
+                doc = self._docs.get(software_id)
+                if doc is None:
+                    continue
+                if category is not None and doc.raw_category != category:
+                    continue
+                score = 0.0
+                for weight, value in doc.weighted:
+                    if not value:
+                        continue
+                    if q in value:
+                        # 整串命中意味着所有 n-gram 都命中，另加 0.5 倍权重
+                        score += weight * 1.5
+                    elif n:
+                        matched = 0
+                        for g in grams:
+                            if g in value:
+                                matched += 1
+                        score += weight * matched / n
+                if doc.name == q:
+                    score += 4.0
+                elif doc.name.startswith(q):
+                    score += 2.0
+                scored.append((-score, software_id))
+
+            total = len(scored)
+            hits = []
+            for neg_score, software_id in heapq.nsmallest(offset + limit, scored)[offset:]:
+                doc = self._docs[software_id]
+                hits.append(SearchHit(
+                    software_id=software_id,
+                    score=round(-neg_score, 4),
+                    highlights=build_highlights(doc.raw_name, doc.raw_description, doc.raw_category, query)
+                ))
+            return total, hits
+
+    def stats(self) -> dict:
+        return {"documents": len(self._docs), "ngrams": len(self._postings), "dirty": len(self._dirty)}
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# PostgreSQL 检索：三元组相似度 + 全文检索联合打分，候选条件均可走 GIN 索引。
+# 命中总数单独对全部命中计数：页码或游标超出最后一条时仍返回一行（id 为 NULL）带回总数
+PG_SEARCH_SQL = """
+WITH matches AS (
+SELECT s.id, s.name, s.description, c.name AS category,
+       (4 * word_similarity(:q, lower(s.name))
+        + 2 * (CASE WHEN lower(coalesce(c.name, '')) LIKE :like ESCAPE '\\' THEN 1 ELSE 0 END)
+        + word_similarity(:q, lower(coalesce(s.description, '')))
+        + ts_rank(to_tsvector('simple', coalesce(s.name, '') || ' ' || coalesce(s.description, '') || ' ' || coalesce(c.name, '')),
+                  plainto_tsquery('simple', :q))
+        + (CASE WHEN lower(s.name) = :q THEN 4 WHEN lower(s.name) LIKE :prefix ESCAPE '\\' THEN 2 ELSE 0 END)
+        + 0.5 * (CASE WHEN EXISTS (
+                SELECT 1 FROM software_versions v
+                WHERE v.software_id = s.id AND lower(coalesce(v.release_notes, '')) LIKE :like ESCAPE '\\'
+            ) THEN 1 ELSE 0 END)
+       ) AS score
+FROM software s
+LEFT JOIN software_categories c ON c.id = s.category_id
+WHERE (:category IS NULL OR c.name = :category)
+  AND (
+    lower(s.name) LIKE :like ESCAPE '\\'
+    OR :q <% lower(s.name)
+    OR lower(coalesce(s.description, '')) LIKE :like ESCAPE '\\'
+    OR :q <% lower(coalesce(s.description, ''))
+    OR lower(coalesce(c.name, '')) LIKE :like ESCAPE '\\'
+    OR to_tsvector('simple', coalesce(s.name, '') || ' ' || coalesce(s.description, ''))
+       @@ plainto_tsquery('simple', :q)
+    OR EXISTS (
+        SELECT 1 FROM software_versions v
+        WHERE v.software_id = s.id AND lower(coalesce(v.release_notes, '')) LIKE :like ESCAPE '\\'
+    )
+  )
+),
+page AS (
+SELECT * FROM matches ORDER BY score DESC, id OFFSET :offset LIMIT :limit
+)
+SELECT page.*, counted.total
+FROM (SELECT COUNT(*) AS total FROM matches) counted
+LEFT JOIN page ON true
+ORDER BY page.score DESC, page.id
+"""
+
+PG_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_software_name_trgm ON software USING gin (lower(name) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_software_description_trgm ON software "
+    "USING gin (lower(coalesce(description, '')) gin_trgm_ops)",
+    # 分类名在 software_categories 表中（数量很少），匹配时直接关联，不需要索引
+    "CREATE INDEX IF NOT EXISTS ix_software_search_tsv ON software USING gin ("
+    "to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(description, '')))",
+    "CREATE INDEX IF NOT EXISTS ix_software_versions_notes_trgm ON software_versions "
+    "USING gin (lower(coalesce(release_notes, '')) gin_trgm_ops)",
+]
+
+_pg_search_ready = False
+
+
+def ensure_search_indexes(conn) -> bool:
+    """启动时创建 pg_trgm 扩展和检索索引；失败（如无扩展权限）时回退到进程内索引"""
+    global _pg_search_ready
+    if conn.dialect.name != "postgresql" or settings.SEARCH_BACKEND == "memory":
+        return False
+    try:
+        for ddl in PG_SEARCH_DDL:
+            conn.execute(text(ddl))
+        conn.commit()
+        _pg_search_ready = True
+    except Exception as e:
+        conn.rollback()
+        logger.warning(f"无法创建 pg_trgm 检索索引，使用进程内索引: {e}")
+        _pg_search_ready = False
+    return _pg_search_ready
+
+
+def _search_postgres(db: Session, query: str, category: Optional[str], offset: int, limit: int) -> Tuple[int, List[SearchHit]]:
+    q = normalize(query).strip()
+    if not q:
+        return 0, []
+    like = f"%{_escape_like(q)}%"
+    rows = db.execute(text(PG_SEARCH_SQL), {
+        "q": q,
+        "like": like,
+        "prefix": f"{_escape_like(q)}%",
+        "category": category,
+        "offset": offset,
+        "limit": limit,
+    }).all()
+    total = rows[0].total if rows else 0
+    return total, [
+        SearchHit(
+            software_id=row.id,
+            score=round(float(row.score), 4),
+            highlights=build_highlights(row.name, row.description, row.category, query)
+        )
+        for row in rows
+        if row.id is not None
+    ]
+
+
+search_index = NgramSearchIndex()
+invalidation_bus.subscribe("software", search_index.on_invalidate)
+
+
+def search_backend(db: Session) -> str:
+    if settings.SEARCH_BACKEND == "postgres" or (settings.SEARCH_BACKEND == "auto" and _pg_search_ready):
+        if db.get_bind().dialect.name == "postgresql":
+            return "postgres"
+    return "memory"
+
+
+def search_software(
+    db: Session,
+    query: str,
+    category: Optional[str] = None,
+    offset: int = 0,
+    limit: int = 20
+) -> Tuple[int, List[SearchHit]]:
+    """按相关度检索软件，返回 (命中总数, 当前页结果)"""
+    if search_backend(db) == "postgres":
+        return _search_postgres(db, query, category, offset, limit)
+    return search_index.search(db, query, category, offset, limit)
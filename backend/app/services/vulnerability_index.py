@@ -0,0 +1,321 @@
+"""
+漏洞版本匹配
+
+漏洞的影响范围（affected_versions / fixed_version）在写入时解析成区间，
+保存在 vulnerability_ranges 表中（compile_vulnerability_ranges）。
+进程内按软件缓存 RangeIndex 和漏洞摘要，检查一个版本只是一次二分查找，
+批量清单检查（POST /vulnerabilities/check）也全部在内存中完成；
+漏洞增删改提交后经缓存失效总线按软件失效，后台任务再定期全量刷新。
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..core.database import SessionLocal
+from ..core.invalidation import invalidation_bus
+from ..core.versioning import RangeIndex, VersionRange, parse_version_ranges
+from ..models.software import Software
+from ..models.vulnerability import Vulnerability, VulnerabilityRange
+from .catalog import mark_catalog_changed
+
+logger = logging.getLogger(__name__)
+
+
+def mark_vulnerabilities_changed(db: Session, software_ids: Iterable[int]):
+    """记录本事务修改了哪些软件的漏洞，提交后失效对应的区间索引；
+    软件列表带有漏洞标记，所以同时递增目录版本号"""
+    invalidation_bus.publish(db, "vulnerability", [sid for sid in software_ids if sid is not None])
+    mark_catalog_changed(db)
+
+
+def compile_vulnerability_ranges(db: Session, vulnerability: Vulnerability, previous_software_id: Optional[int] = None):
+    """按当前的 affected_versions / fixed_version 重新生成漏洞的版本区间"""
+    vulnerability.ranges = [
+        VulnerabilityRange(
+            software_id=vulnerability.software_id,
+            lower_key=r.lower,
+            lower_inclusive=r.lower_inclusive,
+            upper_key=r.upper,
+            upper_inclusive=r.upper_inclusive,
+        )
+        for r in parse_version_ranges(vulnerability.affected_versions, vulnerability.fixed_version)
+    ]
+    mark_vulnerabilities_changed(db, {vulnerability.software_id, previous_software_id})
+
+
+class VulnerabilitySummary(NamedTuple):
+    id: int
+    cve_id: Optional[str]
+    severity: Optional[str]
+    title: Optional[str]
+    fixed_version: Optional[str]
+    reference_url: Optional[str]
+
+
+class _SoftwareEntry(NamedTuple):
+    index: RangeIndex
+    vulnerabilities: Dict[int, VulnerabilitySummary]
+
+
+_EMPTY = _SoftwareEntry(RangeIndex(()), {})
+
+_RANGE_COLUMNS = (
+    VulnerabilityRange.software_id,
+    VulnerabilityRange.lower_key, VulnerabilityRange.lower_inclusive,
+    VulnerabilityRange.upper_key, VulnerabilityRange.upper_inclusive,
+    Vulnerability.id, Vulnerability.cve_id, Vulnerability.severity, Vulnerability.title,
+    Vulnerability.fixed_version, Vulnerability.reference_url,
+)
+
+
+def _build_entries(rows) -> Dict[int, _SoftwareEntry]:
+    ranges: Dict[int, list] = {}
+    summaries: Dict[int, Dict[int, VulnerabilitySummary]] = {}
+    for row in rows:
+        r = VersionRange(row.lower_key, row.lower_inclusive, row.upper_key, row.upper_inclusive)
+        ranges.setdefault(row.software_id, []).append((r, row.id))
+        summaries.setdefault(row.software_id, {})[row.id] = VulnerabilitySummary(
+            row.id, row.cve_id, row.severity, row.title, row.fixed_version, row.reference_url
+        )
+    return {sid: _SoftwareEntry(RangeIndex(ranges[sid]), summaries[sid]) for sid in ranges}
+
+
+class VulnerabilityMatcher:
+    """按软件缓存的区间索引
+
+    启动后整体预加载（preload），并由 start() 启动的后台任务定期全量刷新，兜底可能漏掉的失效事件；
+    预加载完成后没有漏洞的软件不再查库。单个软件失效后在下次检查时重新加载。
+    """
+
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self._entries: Dict[int, Optional[_SoftwareEntry]] = {}
+        self._complete = False  # 是否已全量加载
+        self._names: Optional[Dict[str, int]] = None  # 小写软件名 -> ID
+        self._lock = threading.Lock()
+        # 每次失效递增；加载期间发生过失效的结果不写入缓存
+        self._generation = 0
+        self._task: Optional[asyncio.Task] = None
+        self._refreshes = 0
+        self._last_refresh: Optional[float] = None
+        self._last_refresh_ms: Optional[float] = None
+        self._loads = 0
+        self._checks = 0
+
+    # ---- 加载 ----
+
+    def preload(self, db: Session):
+        """全量加载所有软件的区间与软件名映射"""
+        started = time.perf_counter()
+        generation = self._generation
+        rows = db.execute(
+            select(*_RANGE_COLUMNS).join(Vulnerability, Vulnerability.id == VulnerabilityRange.vulnerability_id)
+        ).all()
+        entries = _build_entries(rows)
+        names = self._load_names(db)
+        with self._lock:
+            if generation != self._generation:
+                # 加载期间有写入，下次刷新再试；已有缓存保持不变
+                return
+            self._entries = entries
+            self._names = names
+            self._complete = True
+            self._refreshes += 1
+            self._last_refresh = time.time()
+            self._last_refresh_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    def _load_software(self, db: Session, software_id: int) -> _SoftwareEntry:
+        self._loads += 1
+        rows = db.execute(
+            select(*_RANGE_COLUMNS)
+            .join(Vulnerability, Vulnerability.id == VulnerabilityRange.vulnerability_id)
+            .where(VulnerabilityRange.software_id == software_id)
+        ).all()
+        return _build_entries(rows).get(software_id, _EMPTY)
+
+    @staticmethod
+    def _load_names(db: Session) -> Dict[str, int]:
+        return {name.lower(): sid for sid, name in db.execute(select(Software.id, Software.name))}
+
+    def _entry(self, db: Session, software_id: int) -> _SoftwareEntry:
+        entry = self._entries.get(software_id, _EMPTY if self._complete else None)
+        if entry is None:
+            generation = self._generation
+            entry = self._load_software(db, software_id)
+            with self._lock:
+                if generation == self._generation:
+                    self._entries[software_id] = entry
+        return entry
+
+    def index_for(self, db: Session, software_id: int) -> RangeIndex:
+        return self._entry(db, software_id).index
+
+    def resolve_name(self, db: Session, name: str) -> Optional[int]:
+        names = self._names
+        if names is None:
+            generation = self._generation
+            names = self._load_names(db)
+            with self._lock:
+                if generation == self._generation:
+                    self._names = names
+        return names.get(name.strip().lower())
+
+    # ---- 匹配 ----
+
+    def match(self, db: Session, software_id: int, version: str) -> FrozenSet[int]:
+        """返回影响该版本的漏洞 ID"""
+        return self.index_for(db, software_id).match(version)
+
+    def check(self, db: Session, software_id: int, version: str) -> List[VulnerabilitySummary]:
+        """返回影响该版本的漏洞摘要（按 ID 排序）"""
+        self._checks += 1
+        entry = self._entry(db, software_id)
+        ids = entry.index.match(version)
+        return [entry.vulnerabilities[vid] for vid in sorted(ids)]
+
+    # ---- 失效与刷新 ----
+
+    def on_invalidate(self, software_ids):
+        with self._lock:
+            self._generation += 1
+            if software_ids is None:
+                self._entries = {}
+                self._complete = False
+            else:
+                for software_id in software_ids:
+                    # 标记为待加载（全量加载后缺失的键表示没有漏洞）
+                    self._entries[software_id] = None
+
+    def on_software_invalidate(self, software_ids):
+        # 软件新增、改名、删除：软件名映射整体重建
+        with self._lock:
+            self._generation += 1
+            self._names = None
+
+    def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _refresh(self):
+        db = SessionLocal()
+        try:
+            self.preload(db)
+        finally:
+            db.close()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self._refresh)
+            except Exception as e:
+                logger.warning(f"漏洞区间索引刷新失败: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def stats(self) -> dict:
+        entries = [e for e in list(self._entries.values()) if e is not None]
+        return {
+            "preloaded": self._complete,
+            "software": len(entries),
+            "boundaries": sum(len(e.index) for e in entries),
+            "vulnerabilities": sum(len(e.vulnerabilities) for e in entries),
+            "refreshes": self._refreshes,
+            "last_refresh": self._last_refresh,
+            "last_refresh_ms": self._last_refresh_ms,
+            "lazy_loads": self._loads,
+            "checks": self._checks,
+        }
+
+
+vulnerability_matcher = VulnerabilityMatcher(settings.VULN_INDEX_REFRESH_INTERVAL)
+invalidation_bus.subscribe("vulnerability", vulnerability_matcher.on_invalidate)
+invalidation_bus.subscribe("software", vulnerability_matcher.on_software_invalidate)
+
+
+def _range_values(row) -> List[dict]:
+    return [
+        {
+            "vulnerability_id": row.id,
+            "software_id": row.software_id,
+            "lower_key": r.lower,
+            "lower_inclusive": r.lower_inclusive,
+            "upper_key": r.upper,
+            "upper_inclusive": r.upper_inclusive,
+        }
+        for r in parse_version_ranges(row.affected_versions, row.fixed_version)
+    ]
+
+
+def backfill_vulnerability_ranges(conn, batch_size: int = 1000):
+    """启动迁移：为还没有区间记录的漏洞解析版本范围（在调用方的连接/事务中执行）"""
+    compiled = select(VulnerabilityRange.vulnerability_id)
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(Vulnerability.id, Vulnerability.software_id, Vulnerability.affected_versions, Vulnerability.fixed_version)
+            .where(Vulnerability.id > last_id, Vulnerability.id.not_in(compiled))
+            .order_by(Vulnerability.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        values = [value for row in rows for value in _range_values(row)]
+        if values:
+            conn.execute(insert(VulnerabilityRange.__table__), values)
+        last_id = rows[-1].id
+
+
+def recompile_vulnerability_ranges(conn, predicate: Callable[[Optional[str], Optional[str]], bool],
+                                   batch_size: int = 1000) -> int:
+    """启动迁移：解析规则修正后，按当前规则重新解析 predicate(affected_versions, fixed_version) 为真的漏洞，
+    已保存的区间与之不同时重写（在调用方的连接/事务中执行）；返回重写的漏洞数"""
+    rewritten = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(Vulnerability.id, Vulnerability.software_id, Vulnerability.affected_versions, Vulnerability.fixed_version)
+            .where(Vulnerability.id > last_id)
+            .order_by(Vulnerability.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return rewritten
+        last_id = rows[-1].id
+        candidates = {row.id: row for row in rows if predicate(row.affected_versions, row.fixed_version)}
+        if not candidates:
+            continue
+        stored: Dict[int, List[tuple]] = {vid: [] for vid in candidates}
+        for r in conn.execute(
+            select(VulnerabilityRange.vulnerability_id, VulnerabilityRange.lower_key, VulnerabilityRange.lower_inclusive,
+                   VulnerabilityRange.upper_key, VulnerabilityRange.upper_inclusive)
+            .where(VulnerabilityRange.vulnerability_id.in_(list(candidates)))
+        ):
+            stored[r.vulnerability_id].append((r.lower_key, bool(r.lower_inclusive), r.upper_key, bool(r.upper_inclusive)))
+        changed_ids = []
+        values = []
+        for vid, row in candidates.items():
+            current = _range_values(row)
+            bounds = [(v["lower_key"], v["lower_inclusive"], v["upper_key"], v["upper_inclusive"]) for v in current]
+            if sorted(bounds, key=repr) != sorted(stored[vid], key=repr):
+                changed_ids.append(vid)
+                values.extend(current)
+        if changed_ids:
+            conn.execute(delete(VulnerabilityRange.__table__).where(VulnerabilityRange.vulnerability_id.in_(changed_ids)))
+            if values:
+                conn.execute(insert(VulnerabilityRange.__table__), values)
+            rewritten += len(changed_ids)
@@ -1,15 +1,20 @@
 from fastapi import FastAPI, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 from contextlib import asynccontextmanager
 from pathlib import Path
 from datetime import datetime
 import os
+import re
 import shutil
 
 from app.core.config import settings
-from app.core.database import engine, Base, get_db
+from app.core.database import engine, Base, get_async_db
+from app.core.deps import check_catalog_etag
+from app.core.executors import ExecutorSaturated
+from app.core.db_metrics import QueryAccountingMiddleware
+from app.core.replicas import ReplicaRoutingMiddleware
 from app.api import (
     auth_router,
     software_router,
@@ -24,6 +29,19 @@ from app.api.config import router as config_router
 from app.api.upload import router as upload_router
 
 
+# 列表游标分页、版本排序、按版本关联下载记录使用的索引（最后一列为主键）
+KEYSET_INDEX_DDL = [
+    'CREATE INDEX IF NOT EXISTS ix_software_versions_version_key ON software_versions (software_id, version_key, id)',
+    'CREATE INDEX IF NOT EXISTS ix_software_recency ON software ((COALESCE(updated_at, created_at)), id)',
+    'CREATE INDEX IF NOT EXISTS ix_software_requests_created ON software_requests (created_at, id)',
+    'CREATE INDEX IF NOT EXISTS ix_software_requests_applicant_created ON software_requests (applicant_id, created_at, id)',
+    'CREATE INDEX IF NOT EXISTS ix_vulnerabilities_created ON vulnerabilities (created_at, id)',
+    'CREATE INDEX IF NOT EXISTS ix_download_logs_time ON download_logs (download_time, id)',
+    'CREATE INDEX IF NOT EXISTS ix_download_logs_user_time ON download_logs (user_id, download_time, id)',
+    'CREATE INDEX IF NOT EXISTS ix_download_logs_version ON download_logs (software_version_id, id)',
+]
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
@@ -34,6 +52,7 @@ async def lifespan(app: FastAPI):
     from sqlalchemy import text, inspect
     with engine.connect() as conn:
         inspector = inspect(engine)
+        rekeyed = 0
         if 'users' in inspector.get_table_names():
             columns = [c['name'] for c in inspector.get_columns('users')]
             if 'token_version' not in columns:
@@ -42,12 +61,121 @@ async def lifespan(app: FastAPI):
             if 'auth_source' not in columns:
                 conn.execute(text("ALTER TABLE users ADD COLUMN auth_source VARCHAR(10) DEFAULT 'local'"))
                 conn.commit()
+            if 'ldap_synced_at' not in columns:
+                conn.execute(text('ALTER TABLE users ADD COLUMN ldap_synced_at TIMESTAMP WITH TIME ZONE'))
+                conn.commit()
             # 兼容：如果 inspector 缓存导致遗漏，用 try/except 兜底
             try:
                 conn.execute(text("ALTER TABLE users ADD COLUMN auth_source VARCHAR(10) DEFAULT 'local'"))
                 conn.commit()
             except Exception:
                 pass
+        if 'software' in inspector.get_table_names():
+            columns = [c['name'] for c in inspector.get_columns('software')]
+            version_columns = [c['name'] for c in inspector.get_columns('software_versions')]
+            if 'version_count' not in columns:
+                # 软件汇总字段：新增后按版本表回填一次
+                from app.services.catalog import BACKFILL_SUMMARY_SQL
+                conn.execute(text('ALTER TABLE software ADD COLUMN latest_version VARCHAR(50)'))
+                conn.execute(text('ALTER TABLE software ADD COLUMN version_count INTEGER NOT NULL DEFAULT 0'))
+                conn.execute(text('ALTER TABLE software ADD COLUMN total_downloads BIGINT NOT NULL DEFAULT 0'))
+                conn.execute(text('ALTER TABLE software ADD COLUMN last_release_at TIMESTAMP WITH TIME ZONE'))
+                # 回填按 version_key 排序：还没有排序键时由下面的排序键迁移回填
+                if 'version_key' in version_columns:
+                    conn.execute(text(BACKFILL_SUMMARY_SQL))
+                conn.commit()
+            # 版本排序键：新增后按版本号回填；排序规则调整后（如 1.1.1a 改为排在 1.1.1 之后）只重写变化的键，
+            # 有变化时按新顺序重新计算最新版本
+            from app.services.catalog import BACKFILL_SUMMARY_SQL, backfill_version_keys
+            if 'version_key' not in version_columns:
+                conn.execute(text("ALTER TABLE software_versions ADD COLUMN version_key VARCHAR(255) NOT NULL DEFAULT ''"))
+            rekeyed = backfill_version_keys(conn)
+            if rekeyed:
+                conn.execute(text(BACKFILL_SUMMARY_SQL))
+            conn.commit()
+            category_columns = [c['name'] for c in inspector.get_columns('software_categories')]
+            if 'software_count' not in category_columns:
+                conn.execute(text('ALTER TABLE software_categories ADD COLUMN software_count INTEGER NOT NULL DEFAULT 0'))
+                conn.commit()
+            if 'category_id' not in columns:
+                # 分类改为外键：补齐只出现在软件上的分类名，按名称回填外键后删除原文本列
+                from app.services.catalog import RECOUNT_CATEGORIES_SQL
+                conn.execute(text('ALTER TABLE software ADD COLUMN category_id INTEGER REFERENCES software_categories (id)'))
+                conn.execute(text('CREATE INDEX IF NOT EXISTS ix_software_category_id ON software (category_id)'))
+                if 'category' in columns:
+                    conn.execute(text(
+                        "INSERT INTO software_categories (name, sort_order, software_count, created_at, updated_at) "
+                        "SELECT DISTINCT category, 0, 0, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP FROM software "
+                        "WHERE category IS NOT NULL AND category <> '' "
+                        "AND category NOT IN (SELECT name FROM software_categories)"
+                    ))
+                    conn.execute(text(
+                        'UPDATE software SET category_id = '
+                        '(SELECT c.id FROM software_categories c WHERE c.name = software.category)'
+                    ))
+                    # PostgreSQL 会一并删除依赖该列的检索索引，随后按新定义重建
+                    conn.execute(text('DROP INDEX IF EXISTS ix_software_category'))
+                    conn.execute(text('ALTER TABLE software DROP COLUMN category'))
+                conn.execute(text(RECOUNT_CATEGORIES_SQL))
+                conn.commit()
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_software_updated_at ON software (updated_at)'))
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_software_versions_software_id ON software_versions (software_id)'))
+            conn.commit()
+
+            # 列表游标分页使用的排序索引
+            for ddl in KEYSET_INDEX_DDL:
+                conn.execute(text(ddl))
+            conn.commit()
+
+            # 搜索索引（PostgreSQL pg_trgm，不可用时使用进程内索引）
+            from app.services.search import ensure_search_indexes
+            ensure_search_indexes(conn)
+
+        # 漏洞版本区间：为迁移前已有的漏洞解析一次
+        if 'vulnerabilities' in inspector.get_table_names():
+            vuln_columns = {c['name']: c for c in inspector.get_columns('vulnerabilities')}
+            if 'content_hash' not in vuln_columns:
+                # NVD 导入：内容哈希、按 CVE 编号查找，影响范围可能很长
+                conn.execute(text('ALTER TABLE vulnerabilities ADD COLUMN content_hash VARCHAR(64)'))
+                conn.execute(text('CREATE INDEX IF NOT EXISTS ix_vulnerabilities_cve_id ON vulnerabilities (cve_id)'))
+                if conn.dialect.name == 'postgresql':
+                    conn.execute(text('ALTER TABLE vulnerabilities ALTER COLUMN affected_versions TYPE TEXT'))
+                conn.commit()
+            from app.services.vulnerability_index import backfill_vulnerability_ranges, recompile_vulnerability_ranges
+            backfill_vulnerability_ranges(conn)
+            # 按当前规则重新解析可能受规则调整影响的范围：逗号分隔的比较式（如 "<=1.5, >1.0" 以前可能被拆成
+            # 两个"或"的半开区间），以及边界带字母或连字符后缀的版本（排序键有变化）
+            recompiled = recompile_vulnerability_ranges(
+                conn, lambda affected, fixed: bool(
+                    (affected and re.search(r'[<>].*[,，]|[,，].*[<>]', affected))
+                    or re.search(r'\d[-.]?[a-z]|\d-\d', f"{affected or ''} {fixed or ''}", re.IGNORECASE)
+                )
+            )
+            conn.commit()
+
+            # 版本漏洞暴露面：新建表后全量计算一次，之后随写入增量维护；区间或版本排序键重写后也全量重算
+            from app.services.exposure import rebuild_exposure
+            has_exposure = conn.execute(text('SELECT 1 FROM version_exposure LIMIT 1')).first()
+            has_ranges = conn.execute(text('SELECT 1 FROM vulnerability_ranges LIMIT 1')).first()
+            if recompiled:
+                print(f"已按新的版本范围规则重新解析 {recompiled} 条漏洞")
+            if rekeyed:
+                print(f"已更新 {rekeyed} 个版本的排序键")
+            if recompiled or rekeyed:
+                conn.execute(text('UPDATE catalog_revision SET revision = revision + 1'))
+            if has_ranges and (recompiled or rekeyed or not has_exposure):
+                rebuild_exposure(conn)
+                conn.commit()
+
+        # 目录版本号（ETag）
+        from app.services.catalog import ENSURE_CATALOG_REVISION_SQL
+        conn.execute(text(ENSURE_CATALOG_REVISION_SQL))
+        conn.commit()
+
+        # 速率限制计数表（PostgreSQL 上为 UNLOGGED 表）
+        from app.core.rate_limit import ensure_rate_limit_table
+        ensure_rate_limit_table(conn)
+        conn.commit()
 
     # 创建初始管理员账号（如果不存在）
     from app.core.database import SessionLocal
@@ -87,10 +215,48 @@ async def lifespan(app: FastAPI):
     # 确保存储目录存在
     os.makedirs(settings.STORAGE_PATH, exist_ok=True)
 
+    # 创建共享的出站 HTTP 客户端
+    from app.core.http_clients import http_clients
+    await http_clients.startup()
+
+    # 启动跨 worker 缓存失效监听（仅 PostgreSQL）
+    from app.core.invalidation import invalidation_bus
+    invalidation_bus.start()
+
+    # 预加载漏洞版本区间索引并定期刷新
+    from app.services.vulnerability_index import vulnerability_matcher
+    vulnerability_matcher.start()
+
+    # 定期同步 LDAP/AD 目录用户
+    from app.services.ldap_sync import ldap_sync_job
+    ldap_sync_job.start()
+
+    # 启动 AI 自动审核队列
+    from app.services.review_worker import review_worker
+    review_worker.start()
+
+    # 只读副本延迟检查（未配置副本时不启动）
+    from app.core.replicas import replica_set
+    replica_set.start()
+
     yield
 
     # 关闭时的清理工作
-    pass
+    await review_worker.stop()
+    from app.services.affected_downloads import affected_download_jobs
+    await affected_download_jobs.stop()
+    await vulnerability_matcher.stop()
+    await ldap_sync_job.stop()
+    from app.core.executors import password_executor, ldap_executor
+    password_executor.shutdown()
+    ldap_executor.shutdown()
+    from app.core.ldap import close_directory
+    close_directory()
+    await invalidation_bus.stop()
+    await http_clients.aclose()
+    await replica_set.stop()
+    from app.core.database import async_engine
+    await async_engine.dispose()
 
 
 app = FastAPI(
@@ -109,6 +275,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 只读副本路由：GET 请求读副本，写入后短时间内读主库
+app.add_middleware(ReplicaRoutingMiddleware)
+
+# 按请求统计查询条数与耗时（DEBUG 模式下写入响应头），超出查询预算的请求按路由记录
+app.add_middleware(QueryAccountingMiddleware)
+
+# 登录等接口的阻塞操作执行器已满：返回 429，客户端稍后重试
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(request: Request, exc: ExecutorSaturated):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "服务器繁忙，请稍后再试"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
 # 注册路由
 app.include_router(auth_router, prefix="/api")
 app.include_router(software_router, prefix="/api")
@@ -124,15 +306,13 @@ app.include_router(category_router, prefix="/api")
 
 # 公开的站点信息接口（无需认证）
 @app.get("/api/site/info")
-async def site_info(db=Depends(get_db)):
+async def site_info(_etag: str = Depends(check_catalog_etag), db=Depends(get_async_db)):
     """获取站点名称和描述（公开接口）"""
-    from app.models.config import Config
-    from sqlalchemy.orm import Session as _Session
-    name_cfg = db.query(Config).filter(Config.key == "site_name").first()
-    desc_cfg = db.query(Config).filter(Config.key == "site_description").first()
+    from app.core.runtime_config import config_service
+    config = await config_service.get_async(db)
     return {
-        "name": name_cfg.value if name_cfg else settings.APP_NAME,
-        "description": desc_cfg.value if desc_cfg else "公司内网软件下载站"
+        "name": config.site_name,
+        "description": config.site_description
     }
 
 
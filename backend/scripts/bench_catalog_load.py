@@ -0,0 +1,295 @@
+"""
+目录浏览 + 下载混合负载基准测试
+在进程内（httpx ASGITransport）并发请求软件列表、搜索、详情、分类和下载接口，
+分别统计异步会话（AsyncSession + 异步驱动，当前实现）与同步会话（同步驱动的查询直接在事件循环上执行，
+即改造前的行为）下的吞吐量、p50/p99 延迟和事件循环延迟。
+
+默认使用临时 SQLite 数据库；--database-url 可指定 PostgreSQL（按同步驱动填写，异步驱动自动换成 asyncpg，
+数据会写入该库）。--db-latency 给每条 SQL 加上固定等待，模拟数据库在网络另一端时的往返时间：
+同步模式下阻塞等待，异步模式下让出事件循环。
+
+同步模式的连接池按并发数配置：连接池耗尽时同步会话在事件循环上阻塞等待连接，
+持有连接的请求无法继续执行，整个进程会卡住直到 pool_timeout，不便于比较延迟。
+
+用法: python scripts/bench_catalog_load.py [--requests 2000] [--concurrency 50] [--db-latency 2] [--mode both|async|sync]
+"""
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+
+BENCH_USERNAME = "bench_catalog_user"
+BENCH_PASSWORD = "bench-catalog-password"
+
+# 请求组合：(权重, 名称)
+TRAFFIC_MIX = [
+    (35, "list"),
+    (15, "search"),
+    (20, "detail"),
+    (10, "categories"),
+    (20, "download"),
+]
+
+
+def configure(database_url: str):
+    # 必须在导入 app 之前设置
+    tmp = tempfile.mkdtemp(prefix="catalog_load_bench_")
+    os.environ["DATABASE_URL"] = database_url or f"sqlite:///{tmp}/bench.db"
+    os.environ["STORAGE_PATH"] = os.path.join(tmp, "storage")
+    # 基准测试不受下载频率限制
+    os.environ["DOWNLOAD_RATE_LIMIT"] = "0"
+
+
+def seed(software_count: int, versions_per_software: int):
+    from app.core.config import settings
+    from app.core.database import Base, SessionLocal, engine
+    from app.core.security import get_password_hash
+    from app.models.software import Software, SoftwareVersion
+    from app.models.user import User, UserRole
+    from app.services.catalog import get_or_create_category, refresh_software_summary
+
+    Base.metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        from app.core.rate_limit import ensure_rate_limit_table
+        ensure_rate_limit_table(conn)
+        conn.commit()
+    db = SessionLocal()
+    try:
+        if not db.query(User).filter(User.username == BENCH_USERNAME).first():
+            db.add(User(username=BENCH_USERNAME, hashed_password=get_password_hash(BENCH_PASSWORD), role=UserRole.USER))
+            db.commit()
+        if db.query(Software).filter(Software.name.like("bench-%")).count() >= software_count:
+            return
+        payload = os.urandom(64 * 1024)
+        for i in range(software_count):
+            software = Software(
+                name=f"bench-{i:05d}",
+                description=f"Benchmark tool number {i} for catalog load testing",
+                category_id=get_or_create_category(db, f"Category {i % 12}"),
+            )
+            db.add(software)
+            db.flush()
+            software_dir = os.path.join(settings.STORAGE_PATH, str(software.id))
+            os.makedirs(software_dir, exist_ok=True)
+            for v in range(versions_per_software):
+                file_path = os.path.join(software_dir, f"bench-{v}.zip")
+                with open(file_path, "wb") as f:
+                    f.write(payload)
+                db.add(SoftwareVersion(
+                    software_id=software.id,
+                    version=f"1.{v}.0",
+                    file_path=file_path,
+                    file_name=f"bench-{v}.zip",
+                    file_size=len(payload),
+                    file_hash="0" * 64,
+                ))
+            refresh_software_summary(db, software.id)
+            if i % 100 == 99:
+                db.commit()
+        db.commit()
+    finally:
+        db.close()
+
+
+def create_blocking_sessionmaker(pool_size: int):
+    """同步模式使用的会话工厂（连接池大小等于并发数）"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.core.config import settings
+
+    engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True, pool_size=pool_size, max_overflow=0)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def add_db_latency(latency_ms: float, blocking_engine):
+    """每条 SQL 执行前等待 latency_ms：同步引擎阻塞当前线程，异步引擎让出事件循环"""
+    from sqlalchemy import event
+    from sqlalchemy.util import await_only
+    from app.core.database import async_engine
+
+    delay = latency_ms / 1000
+
+    @event.listens_for(blocking_engine, "before_cursor_execute")
+    def blocking_wait(*args):
+        time.sleep(delay)
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def yielding_wait(*args):
+        await_only(asyncio.sleep(delay))
+
+
+class BlockingSession:
+    """以 AsyncSession 的接口包装同步 Session：查询直接在事件循环上执行（改造前的行为）"""
+
+    def __init__(self, session):
+        self._session = session
+        self.info = session.info
+        self.bind = session.get_bind()
+
+    def add(self, instance):
+        self._session.add(instance)
+
+    async def execute(self, statement, params=None, **kw):
+        return self._session.execute(statement, params, **kw)
+
+    async def scalar(self, statement, params=None, **kw):
+        return self._session.scalar(statement, params, **kw)
+
+    async def scalars(self, statement, params=None, **kw):
+        return self._session.scalars(statement, params, **kw)
+
+    async def get(self, entity, ident, **kw):
+        return self._session.get(entity, ident, **kw)
+
+    async def run_sync(self, fn, *args, **kw):
+        return fn(self._session, *args, **kw)
+
+    async def flush(self):
+        self._session.flush()
+
+    async def commit(self):
+        self._session.commit()
+
+    async def rollback(self):
+        self._session.rollback()
+
+    async def refresh(self, instance):
+        self._session.refresh(instance)
+
+    async def delete(self, instance):
+        self._session.delete(instance)
+
+    @asynccontextmanager
+    async def begin_nested(self):
+        with self._session.begin_nested():
+            yield
+
+
+def blocking_db_dependency(session_factory):
+    async def blocking_db():
+        db = session_factory()
+        try:
+            yield BlockingSession(db)
+        finally:
+            db.close()
+    return blocking_db
+
+
+def percentile(samples, p: float) -> float:
+    samples = sorted(samples)
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+async def run(mode: str, total: int, concurrency: int, software_count: int, seed_value: int, blocking_sessions):
+    import httpx
+    import main
+    from app.core.database import get_async_db
+
+    if mode == "sync":
+        main.app.dependency_overrides[get_async_db] = blocking_db_dependency(blocking_sessions)
+    else:
+        main.app.dependency_overrides.pop(get_async_db, None)
+
+    rng = random.Random(seed_value)
+    weights = [w for w, _ in TRAFFIC_MIX]
+    kinds = rng.choices([name for _, name in TRAFFIC_MIX], weights=weights, k=total)
+    latencies = {name: [] for _, name in TRAFFIC_MIX}
+    statuses = {}
+    lags = []
+    done = asyncio.Event()
+
+    async def probe():
+        # 事件循环被阻塞时，sleep 的实际唤醒时间会明显晚于预期
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append((time.perf_counter() - started - 0.01) * 1000)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        r = await client.post("/api/auth/login", data={"username": BENCH_USERNAME, "password": BENCH_PASSWORD})
+        r.raise_for_status()
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        r = await client.get("/api/software", params={"limit": software_count}, headers=headers)
+        software_ids = [item["id"] for item in r.json()["items"]]
+        version_ids = []
+        for sid in software_ids[:50]:
+            r = await client.get(f"/api/software/{sid}", headers=headers)
+            version_ids.extend(v["id"] for v in r.json()["versions"])
+
+        def request_for(kind: str):
+            if kind == "list":
+                return "/api/software", {"limit": 20, "skip": rng.randrange(0, max(1, software_count - 20))}
+            if kind == "search":
+                return "/api/software", {"search": f"tool number {rng.randrange(software_count)}", "limit": 20}
+            if kind == "detail":
+                return f"/api/software/{rng.choice(software_ids)}", None
+            if kind == "categories":
+                return "/api/categories", None
+            return f"/api/downloads/{rng.choice(version_ids)}", None
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(kind: str):
+            path, params = request_for(kind)
+            async with semaphore:
+                started = time.perf_counter()
+                r = await client.get(path, params=params, headers=headers)
+                latencies[kind].append((time.perf_counter() - started) * 1000)
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+        probe_task = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(one(kind) for kind in kinds))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await probe_task
+
+    everything = [ms for samples in latencies.values() for ms in samples]
+    print(f"[{mode}] requests: {total}, concurrency: {concurrency}, elapsed: {elapsed:.2f}s, "
+          f"throughput: {total / elapsed:.1f} req/s, status codes: {dict(sorted(statuses.items()))}")
+    print(f"[{mode}] all requests ms: p50={percentile(everything, 0.5):.1f} p99={percentile(everything, 0.99):.1f}")
+    for kind, samples in latencies.items():
+        print(f"[{mode}]   {kind:<10} n={len(samples):<5} p50={percentile(samples, 0.5):.1f} p99={percentile(samples, 0.99):.1f}")
+    print(f"[{mode}] event loop lag ms: p50={percentile(lags, 0.5):.1f} p99={percentile(lags, 0.99):.1f} max={max(lags or [0]):.1f}")
+    return percentile(everything, 0.99)
+
+
+async def main_async(args, blocking_sessions):
+    from app.core.database import async_engine
+
+    results = {}
+    modes = ["sync", "async"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        results[mode] = await run(mode, args.requests, args.concurrency, args.software, args.seed, blocking_sessions)
+    if len(results) == 2 and results["async"]:
+        print(f"p99 sync/async: {results['sync'] / results['async']:.2f}x")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mixed catalog/download load benchmark (sync vs async sessions)")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--software", type=int, default=500, help="number of seeded software entries")
+    parser.add_argument("--versions", type=int, default=3, help="versions per seeded software entry")
+    parser.add_argument("--db-latency", type=float, default=2.0, help="simulated per-statement database round trip in ms")
+    parser.add_argument("--mode", choices=["both", "async", "sync"], default="both")
+    parser.add_argument("--database-url", default="", help="sync-driver URL; defaults to a temporary SQLite database")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    configure(args.database_url)
+    seed(args.software, args.versions)
+    blocking_sessions = create_blocking_sessionmaker(args.concurrency)
+    if args.db_latency > 0:
+        add_db_latency(args.db_latency, blocking_sessions.kw["bind"])
+    asyncio.run(main_async(args, blocking_sessions))
@@ -0,0 +1,126 @@
+"""
+LDAP 用户同步基准测试
+使用 ldap3 的进程内模拟目录（MOCK_SYNC，支持 simple paged results）和临时 SQLite 数据库：
+
+1. 首次同步 N 个目录用户（全部新建）；
+2. 从目录删除一部分用户、修改一部分邮箱后再次同步，确认删除的用户被禁用且 token_version 递增；
+3. 用惰性生成的条目再同步一次，统计同步本身的内存峰值（不含模拟目录持有的数据）。
+
+用法: python scripts/bench_ldap_sync.py [--users 50000] [--page-size 500] [--remove 500]
+"""
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# 使用临时数据库，不影响实际数据
+_tmp = tempfile.mkdtemp(prefix="ldap_sync_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/bench.db"
+
+import argparse
+import time
+import tracemalloc
+
+BASE_DN = "ou=people,dc=example,dc=com"
+CONFIG = dict(
+    enabled=True,
+    server_url="ldap://mock",
+    base_dn=BASE_DN,
+    user_filter="(&(objectClass=person)(uid={username}))",
+)
+
+
+def build_directory(users: int):
+    from ldap3 import MOCK_SYNC, Connection, Server
+
+    conn = Connection(Server("mock"), client_strategy=MOCK_SYNC)
+    conn.strategy.add_entry(BASE_DN, {"objectClass": ["organizationalUnit"], "ou": "people"})
+    for i in range(users):
+        conn.strategy.add_entry(f"uid=user{i:06d},{BASE_DN}", {
+            "objectClass": ["person"],
+            "uid": f"user{i:06d}",
+            "mail": f"user{i:06d}@example.com",
+        })
+    conn.bind()
+    return conn
+
+
+def run_sync(db, entries=None, conn=None, page_size=500):
+    from app.core.ldap import LdapDirectory
+    from app.core.runtime_config import LdapConfig
+    from app.services.ldap_sync import sync_ldap_users
+
+    config = LdapConfig(**CONFIG)
+    if entries is None:
+        entries = LdapDirectory(config).iter_users(page_size, conn=conn)
+    result = sync_ldap_users(db, config, entries)
+    if result.error:
+        raise SystemExit(f"Sync failed: {result.error}")
+    rate = result.seen / (result.duration_ms / 1000) if result.duration_ms else 0
+    print(f"  seen={result.seen} created={result.created} updated={result.updated} unchanged={result.unchanged} "
+          f"deactivated={result.deactivated} batches={result.batches} "
+          f"duration={result.duration_ms / 1000:.2f}s ({rate:.0f} users/s)")
+    return result
+
+
+def main(users: int, page_size: int, remove: int):
+    from ldap3 import MODIFY_REPLACE
+    from app.core.database import Base, SessionLocal, engine
+    from app.models.user import User
+
+    Base.metadata.create_all(bind=engine)
+
+    started = time.perf_counter()
+    conn = build_directory(users)
+    print(f"Mock directory: {users} users ({time.perf_counter() - started:.1f}s to build)")
+
+    # 统计分页请求次数
+    searches = []
+    original_search = conn.search
+
+    def counting_search(*args, **kwargs):
+        searches.append(kwargs.get("paged_cookie"))
+        return original_search(*args, **kwargs)
+
+    conn.search = counting_search
+
+    db = SessionLocal()
+    try:
+        print("Initial sync:")
+        result = run_sync(db, conn=conn, page_size=page_size)
+        assert result.created == users, result
+        print(f"  paged search requests: {len(searches)}")
+
+        print(f"Removing {remove} users and changing {remove} emails, then re-syncing:")
+        for i in range(remove):
+            conn.strategy.remove_entry(f"uid=user{i:06d},{BASE_DN}")
+            conn.modify(f"uid=user{users - 1 - i:06d},{BASE_DN}", {"mail": [(MODIFY_REPLACE, [f"moved{i}@example.com"])]})
+        searches.clear()
+        result = run_sync(db, conn=conn, page_size=page_size)
+        assert result.deactivated == remove and result.updated == remove, result
+        inactive = db.query(User).filter(User.is_active.is_(False), User.token_version >= 1).count()
+        assert inactive == remove, inactive
+        print(f"  inactive users with bumped token_version: {inactive}")
+
+        print("Re-sync from a lazy generator (memory of the sync itself):")
+
+        def lazy_entries():
+            for i in range(remove, users):
+                yield f"user{i:06d}", f"user{i:06d}@example.com" if i < users - remove else f"moved{users - 1 - i}@example.com"
+
+        tracemalloc.start()
+        run_sync(db, entries=lazy_entries())
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"  peak traced memory during sync: {peak / 1024 / 1024:.1f} MiB")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LDAP user sync benchmark")
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--remove", type=int, default=500)
+    args = parser.parse_args()
+    main(args.users, args.page_size, args.remove)
@@ -0,0 +1,113 @@
+"""
+登录吞吐量基准测试
+在进程内（httpx ASGITransport）并发调用 /api/auth/login，统计吞吐量、登录延迟、429 次数，
+同时测量事件循环延迟（每 10ms 唤醒一次的探测协程实际晚了多久），用于确认 bcrypt 不再阻塞事件循环。
+
+加上 --inline 时 bcrypt 直接在事件循环上执行（即改造前的行为），便于对比。
+
+用法: python scripts/bench_login.py [--requests 200] [--concurrency 50] [--inline]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+import asyncio
+import time
+
+BENCH_USERNAME = "bench_login_user"
+BENCH_PASSWORD = "bench-login-password"
+
+
+def ensure_user():
+    from app.core.database import Base, SessionLocal, engine
+    from app.core.security import get_password_hash
+    from app.models.user import User, UserRole
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if not db.query(User).filter(User.username == BENCH_USERNAME).first():
+            db.add(User(
+                username=BENCH_USERNAME,
+                hashed_password=get_password_hash(BENCH_PASSWORD),
+                role=UserRole.USER
+            ))
+            db.commit()
+    finally:
+        db.close()
+
+
+def percentile(samples, p: float) -> float:
+    samples = sorted(samples)
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+async def run(total: int, concurrency: int):
+    import httpx
+    import main
+
+    latencies = []
+    statuses = {}
+    lags = []
+    done = asyncio.Event()
+
+    async def probe():
+        # 事件循环被阻塞时，sleep 的实际唤醒时间会明显晚于预期
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append((time.perf_counter() - started - 0.01) * 1000)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def login():
+            async with semaphore:
+                started = time.perf_counter()
+                r = await client.post("/api/auth/login", data={"username": BENCH_USERNAME, "password": BENCH_PASSWORD})
+                latencies.append((time.perf_counter() - started) * 1000)
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+        probe_task = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await probe_task
+
+    print(f"Requests: {total}, concurrency: {concurrency}, elapsed: {elapsed:.2f}s")
+    print(f"Throughput: {total / elapsed:.1f} logins/s")
+    print(f"Status codes: {dict(sorted(statuses.items()))}")
+    print(f"Login latency ms: p50={percentile(latencies, 0.5):.1f} p99={percentile(latencies, 0.99):.1f}")
+    print(f"Event loop lag ms: p50={percentile(lags, 0.5):.1f} p99={percentile(lags, 0.99):.1f} max={max(lags or [0]):.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Login throughput benchmark")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--inline", action="store_true", help="run bcrypt on the event loop (previous behaviour)")
+    args = parser.parse_args()
+
+    # 基准测试不受登录频率限制
+    from app.api import auth
+
+    async def no_rate_limit(*a, **kw):
+        return None
+
+    auth._check_rate_limit = no_rate_limit
+
+    if args.inline:
+        from app.core.executors import password_executor
+
+        async def run_inline(fn, *a, **kw):
+            return fn(*a, **kw)
+
+        password_executor.run = run_inline
+
+    ensure_user()
+    asyncio.run(run(args.requests, args.concurrency))
@@ -0,0 +1,110 @@
+"""
+NVD 导入检查
+用 scripts/fixtures/nvd 下的小数据文件导入临时 SQLite 数据库：
+
+- nvd-cve-initial.json：3 条 CVE，7-Zip 与 curl 的 CPE 匹配目录中的软件，unlisted_product 不在目录中；
+- nvd-cve-update.json.gz：同样 3 条 CVE，其中 CVE-2024-0002（curl）修正了影响范围。
+
+通过条件：
+1. 首次导入新建 2 条漏洞记录，不在目录中的产品不导入；
+2. 同一文件再次导入时按 content_hash 全部跳过，不新建也不更新；
+3. 导入更新文件（.gz）时只更新变化的 CVE，其余跳过，影响范围与修复版本随之更新。
+
+用法: python scripts/check_nvd_import.py
+"""
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# 必须在导入 app 之前设置
+_tmp = tempfile.mkdtemp(prefix="nvd_import_check_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/check.db"
+os.environ["STORAGE_PATH"] = os.path.join(_tmp, "storage")
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "nvd")
+INITIAL_FEED = os.path.join(FIXTURES, "nvd-cve-initial.json")
+UPDATE_FEED = os.path.join(FIXTURES, "nvd-cve-update.json.gz")
+
+
+def seed():
+    from app.core.database import Base, SessionLocal, engine
+    from app.models.software import Software
+    from app.services.catalog import ENSURE_CATALOG_REVISION_SQL
+    from sqlalchemy import text
+
+    Base.metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        conn.execute(text(ENSURE_CATALOG_REVISION_SQL))
+        conn.commit()
+    db = SessionLocal()
+    try:
+        for name in ("7-Zip", "cURL", "Notepad++"):
+            db.add(Software(name=name, description=f"{name} (NVD import check)"))
+        db.commit()
+    finally:
+        db.close()
+
+
+def run_import(path: str) -> dict:
+    from app.core.database import SessionLocal
+    from app.services.nvd_import import import_nvd_feed, open_feed
+
+    db = SessionLocal()
+    try:
+        with open(path, "rb") as f:
+            return import_nvd_feed(db, open_feed(f)).as_dict()
+    finally:
+        db.close()
+
+
+def imported() -> dict:
+    """cve_id -> (软件名, 影响范围, 修复版本, content_hash)"""
+    from app.core.database import SessionLocal
+    from app.models.software import Software
+    from app.models.vulnerability import Vulnerability
+
+    db = SessionLocal()
+    try:
+        rows = db.query(Vulnerability.cve_id, Software.name, Vulnerability.affected_versions,
+                        Vulnerability.fixed_version, Vulnerability.content_hash) \
+            .join(Software, Software.id == Vulnerability.software_id).all()
+        return {row[0]: tuple(row[1:]) for row in rows}
+    finally:
+        db.close()
+
+
+def expect(label: str, stats: dict, **expected):
+    actual = {key: stats[key] for key in expected}
+    if actual != expected:
+        raise SystemExit(f"FAIL: {label}: expected {expected}, got {stats}")
+    print(f"{label}: {stats}")
+
+
+def main():
+    seed()
+
+    stats = run_import(INITIAL_FEED)
+    expect("1. initial import", stats, cves=3, matched=2, created=2, updated=0, unchanged=0, deleted=0)
+    first = imported()
+    assert set(first) == {"CVE-2024-0001", "CVE-2024-0002"}, first
+    assert first["CVE-2024-0001"][:3] == ("7-Zip", "<23.01", "23.01"), first["CVE-2024-0001"]
+    assert first["CVE-2024-0002"][:3] == ("cURL", ">=7.69.0 <8.4.0", "8.4.0"), first["CVE-2024-0002"]
+
+    stats = run_import(INITIAL_FEED)
+    expect("2. same feed again", stats, cves=3, matched=2, created=0, updated=0, unchanged=2, deleted=0)
+    assert imported() == first, "unchanged CVEs were rewritten"
+
+    stats = run_import(UPDATE_FEED)
+    expect("3. updated feed (.gz)", stats, cves=3, matched=2, created=0, updated=1, unchanged=1, deleted=0)
+    second = imported()
+    assert second["CVE-2024-0001"] == first["CVE-2024-0001"], second["CVE-2024-0001"]
+    changed = second["CVE-2024-0002"]
+    assert changed[1:3] == (">=7.69.0 <8.4.1", "8.4.1"), changed
+    assert changed[3] != first["CVE-2024-0002"][3], "content_hash was not updated"
+
+    print("OK: NVD import creates, skips unchanged and updates changed CVEs")
+
+
+if __name__ == "__main__":
+    main()
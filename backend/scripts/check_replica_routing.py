@@ -0,0 +1,119 @@
+"""
+只读副本路由检查
+主库为临时 SQLite 数据库，"副本"是种子数据写完后复制出的只读快照（之后不再同步，相当于复制停滞），
+由此可以从返回内容判断查询落在哪个库：
+
+1. GET 列表请求由副本返回（副本读取计数增加）；
+2. 新建软件（写主库）的响应设置读主库 Cookie，带 Cookie 的 GET 立即能看到新数据（读己之写）；
+3. 不带 Cookie 的客户端仍读副本，看不到新数据；
+4. 副本不可用后，延迟检查将其移出轮换，GET 请求回到主库。
+
+SQLite 没有复制延迟，延迟阈值的判断只在 PostgreSQL 副本上生效；这里用副本文件消失模拟副本故障。
+
+用法: python scripts/check_replica_routing.py
+"""
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# 必须在导入 app 之前设置
+_tmp = tempfile.mkdtemp(prefix="replica_routing_check_")
+PRIMARY_PATH = os.path.join(_tmp, "primary.db")
+REPLICA_PATH = os.path.join(_tmp, "replica.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{PRIMARY_PATH}"
+os.environ["DATABASE_REPLICA_URLS"] = f"sqlite:///file:{REPLICA_PATH}?mode=ro&uri=true"
+os.environ["REPLICA_CHECK_INTERVAL"] = "3600"  # 检查由脚本显式触发
+os.environ["STORAGE_PATH"] = os.path.join(_tmp, "storage")
+
+import asyncio
+import shutil
+
+CHECK_USERNAME = "replica_check_ops"
+CHECK_PASSWORD = "replica-check-password"
+
+
+def seed():
+    from app.core.database import Base, SessionLocal, engine
+    from app.core.rate_limit import ensure_rate_limit_table
+    from app.core.security import get_password_hash
+    from app.models.software import Software
+    from app.models.user import User, UserRole
+    from app.services.catalog import ENSURE_CATALOG_REVISION_SQL
+    from sqlalchemy import text
+
+    Base.metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        ensure_rate_limit_table(conn)
+        conn.execute(text(ENSURE_CATALOG_REVISION_SQL))
+        conn.commit()
+    db = SessionLocal()
+    try:
+        db.add(User(username=CHECK_USERNAME, hashed_password=get_password_hash(CHECK_PASSWORD), role=UserRole.OPS))
+        db.add(Software(name="seeded-before-snapshot", description="present on primary and replica"))
+        db.commit()
+    finally:
+        db.close()
+    engine.dispose()
+    shutil.copyfile(PRIMARY_PATH, REPLICA_PATH)
+
+
+def names(response) -> set:
+    response.raise_for_status()
+    return {item["name"] for item in response.json()["items"]}
+
+
+async def main_async():
+    import httpx
+    import main
+    from app.core.database import async_engine
+    from app.core.replicas import STICKY_COOKIE, replica_set
+
+    seed()
+    replica_set.start()
+    await replica_set.check()
+    replica = replica_set.replicas[0]
+    assert replica.healthy, replica.stats()
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://check") as client:
+        r = await client.post("/api/auth/login", data={"username": CHECK_USERNAME, "password": CHECK_PASSWORD})
+        r.raise_for_status()
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        client.cookies.clear()
+
+        reads = replica.reads
+        listed = names(await client.get("/api/software", headers=headers))
+        assert "seeded-before-snapshot" in listed, listed
+        assert replica.reads > reads, "GET was not routed to the replica"
+        print(f"1. GET served by replica: replica reads {reads} -> {replica.reads}")
+
+        r = await client.post("/api/software", json={"name": "written-after-snapshot", "description": "primary only"},
+                              headers=headers)
+        r.raise_for_status()
+        assert STICKY_COOKIE in r.cookies, r.headers
+        listed = names(await client.get("/api/software", headers=headers))
+        assert "written-after-snapshot" in listed, listed
+        print(f"2. write set {STICKY_COOKIE} cookie; next GET from the same client sees the new row (primary)")
+
+        client.cookies.clear()
+        listed = names(await client.get("/api/software", headers=headers))
+        assert "written-after-snapshot" not in listed, listed
+        print("3. GET from a client without the cookie is served by the (stale) replica")
+
+        # 副本故障：文件消失，关闭已建立的连接后重新检查
+        os.remove(REPLICA_PATH)
+        await replica.engine.dispose()
+        await replica_set.check()
+        assert not replica.healthy, replica.stats()
+        listed = names(await client.get("/api/software", headers=headers))
+        assert "written-after-snapshot" in listed, listed
+        print(f"4. unavailable replica dropped from rotation ({replica.last_error}); GET falls back to primary")
+
+    await replica_set.stop()
+    await async_engine.dispose()
+    print("OK: replica routing, read-your-writes and failover behave as expected")
+
+
+if __name__ == "__main__":
+    asyncio.run(main_async())
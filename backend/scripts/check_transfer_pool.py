@@ -0,0 +1,200 @@
+"""
+传输期间连接池占用检查
+在进程内直接调用 ASGI 应用，同时发起比连接池容量（pool_size + max_overflow）更多的慢速下载
+（软件文件下载与 Logo 文件各占一半）：
+客户端每收到一块数据就等待一段时间，模拟慢速网络。所有下载都进入传输阶段后，
+持续采样异步引擎连接池的已借出连接数，并在传输期间请求普通接口。
+
+通过条件：
+1. 所有下载处于传输阶段时，连接池借出的连接数始终为 0；
+2. 传输期间普通接口正常返回（连接池没有被下载占满）；
+3. 所有下载完整收到文件内容。
+
+用法: python scripts/check_transfer_pool.py [--downloads 20] [--size-mb 4] [--chunk-delay 20]
+"""
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# 必须在导入 app 之前设置
+_tmp = tempfile.mkdtemp(prefix="transfer_pool_check_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/check.db"
+os.environ["STORAGE_PATH"] = os.path.join(_tmp, "storage")
+os.environ["DOWNLOAD_RATE_LIMIT"] = "0"
+
+import argparse
+import asyncio
+import time
+
+CHECK_USERNAME = "transfer_pool_user"
+CHECK_PASSWORD = "transfer-pool-password"
+
+
+def seed(size_mb: int):
+    from app.core.config import settings
+    from app.core.database import Base, SessionLocal, engine
+    from app.core.rate_limit import ensure_rate_limit_table
+    from app.core.security import get_password_hash
+    from app.models.software import Software, SoftwareVersion
+    from app.models.user import User, UserRole
+    from app.services.catalog import refresh_software_summary
+
+    Base.metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        ensure_rate_limit_table(conn)
+        conn.commit()
+    db = SessionLocal()
+    try:
+        db.add(User(username=CHECK_USERNAME, hashed_password=get_password_hash(CHECK_PASSWORD), role=UserRole.USER))
+        software = Software(name="transfer-check", description="Large file for the transfer pool check")
+        db.add(software)
+        db.flush()
+        software_dir = os.path.join(settings.STORAGE_PATH, str(software.id))
+        os.makedirs(software_dir, exist_ok=True)
+        file_path = os.path.join(software_dir, "large.bin")
+        payload = os.urandom(size_mb * 1024 * 1024)
+        with open(file_path, "wb") as f:
+            f.write(payload)
+        logo_dir = os.path.join(settings.STORAGE_PATH, "logos")
+        os.makedirs(logo_dir, exist_ok=True)
+        logo_name = f"{software.id}_check.png"
+        with open(os.path.join(logo_dir, logo_name), "wb") as f:
+            f.write(payload)
+        version = SoftwareVersion(
+            software_id=software.id,
+            version="1.0.0",
+            file_path=file_path,
+            file_name="large.bin",
+            file_size=size_mb * 1024 * 1024,
+            file_hash="0" * 64,
+        )
+        db.add(version)
+        refresh_software_summary(db, software.id)
+        db.commit()
+        return [f"/api/downloads/{version.id}", f"/api/software/{software.id}/logo/file/{logo_name}"]
+    finally:
+        db.close()
+
+
+async def slow_download(app, path: str, token: str, chunk_delay: float, state: dict) -> int:
+    """以 ASGI 方式请求下载，每收到一块数据等待 chunk_delay 秒，返回收到的字节数"""
+    disconnected = asyncio.Event()
+    request_sent = False
+    received = 0
+    status = None
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal received, status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            state["streaming"] += 1
+        elif message["type"] == "http.response.body":
+            received += len(message.get("body", b""))
+            if message.get("more_body", False):
+                await asyncio.sleep(chunk_delay)
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"check"), (b"authorization", f"Bearer {token}".encode())],
+        "client": ("127.0.0.1", 40000),
+        "server": ("check", 80),
+    }
+    try:
+        await app(scope, receive, send)
+    finally:
+        disconnected.set()
+        if status is not None:
+            state["streaming"] -= 1
+    if status != 200:
+        raise SystemExit(f"Download returned status {status}")
+    return received
+
+
+async def main_async(args):
+    import httpx
+    import main
+    from app.core.database import async_engine
+    from app.core.principals import principal_cache
+
+    paths = seed(args.size_mb)
+    pool = async_engine.pool
+    capacity = pool.size() + pool._max_overflow
+    downloads = max(args.downloads, capacity + 1)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://check") as client:
+        r = await client.post("/api/auth/login", data={"username": CHECK_USERNAME, "password": CHECK_PASSWORD})
+        r.raise_for_status()
+        token = r.json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        # 清空 principal 缓存：鉴权依赖也要查库
+        principal_cache.on_invalidate(None)
+        state = {"streaming": 0}
+        tasks = [
+            asyncio.create_task(slow_download(main.app, paths[i % len(paths)], token, args.chunk_delay / 1000, state))
+            for i in range(downloads)
+        ]
+
+        deadline = time.monotonic() + 30
+        while state["streaming"] < downloads:
+            if time.monotonic() > deadline or any(t.done() for t in tasks):
+                raise SystemExit(f"Only {state['streaming']}/{downloads} downloads reached the transfer phase")
+            await asyncio.sleep(0.005)
+
+        # 所有下载都在传输阶段：采样连接池，同时请求普通接口
+        samples = []
+        api_latencies = []
+        while state["streaming"] == downloads:
+            samples.append(pool.checkedout())
+            started = time.perf_counter()
+            r = await client.get("/api/software", headers=headers)
+            api_latencies.append((time.perf_counter() - started) * 1000)
+            if r.status_code != 200:
+                raise SystemExit(f"API request during transfers returned {r.status_code}")
+            samples.append(pool.checkedout())
+            await asyncio.sleep(0.02)
+
+        sizes = await asyncio.gather(*tasks)
+
+    await async_engine.dispose()
+
+    expected = args.size_mb * 1024 * 1024
+    print(f"Pool capacity: {capacity} connections, concurrent slow downloads: {downloads}")
+    print(f"Pool samples while all downloads were streaming: {len(samples)}, max checked out: {max(samples or [0])}")
+    print(f"API requests served during transfers: {len(api_latencies)}, max latency: {max(api_latencies or [0]):.1f}ms")
+    print(f"Complete downloads: {sum(size == expected for size in sizes)}/{downloads}")
+
+    if not samples or not api_latencies:
+        raise SystemExit("FAIL: transfers finished before sampling; increase --size-mb or --chunk-delay")
+    if max(samples) != 0:
+        raise SystemExit("FAIL: database connections were checked out while files were streaming")
+    if any(size != expected for size in sizes):
+        raise SystemExit("FAIL: incomplete downloads")
+    print("OK: no database connection held while streaming files")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that file transfers do not hold database connections")
+    parser.add_argument("--downloads", type=int, default=20, help="concurrent downloads (at least pool capacity + 1)")
+    parser.add_argument("--size-mb", type=int, default=4)
+    parser.add_argument("--chunk-delay", type=float, default=20.0, help="client delay per received chunk in ms")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
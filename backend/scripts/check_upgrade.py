@@ -0,0 +1,256 @@
+"""
+升级检查：从基线版本的数据库结构启动应用
+按基线版本（首次提交时的模型）的表结构建一个临时 SQLite 数据库并写入少量数据，
+然后两次启动应用（运行 lifespan 中的全部自动迁移），检查：
+
+1. 迁移链完整执行，不因新增列的先后顺序报错，第二次启动不重复迁移；
+2. 软件汇总字段、版本排序键、分类外键、漏洞版本区间等回填结果正确；
+3. 升级后的数据库可以正常登录并访问列表、详情和漏洞暴露面接口。
+
+用法: python scripts/check_upgrade.py
+"""
+import sys
+import os
+import sqlite3
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# 必须在导入 app 之前设置
+_tmp = tempfile.mkdtemp(prefix="upgrade_check_")
+DB_PATH = os.path.join(_tmp, "baseline.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ["STORAGE_PATH"] = os.path.join(_tmp, "storage")
+os.environ["FIRST_ADMIN_PASSWORD"] = "upgrade-check-password"
+
+# 基线版本的表结构（SQLite）
+BASELINE_SCHEMA = """
+CREATE TABLE users (
+	id INTEGER NOT NULL, 
+	username VARCHAR(50) NOT NULL, 
+	hashed_password VARCHAR(255) NOT NULL, 
+	email VARCHAR(100), 
+	role VARCHAR(5) NOT NULL, 
+	is_active BOOLEAN, 
+	created_at DATETIME DEFAULT CURRENT_TIMESTAMP, 
+	last_login DATETIME, 
+	token_version INTEGER, 
+	auth_source VARCHAR(10), 
+	PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX ix_users_email ON users (email);
+CREATE UNIQUE INDEX ix_users_username ON users (username);
+CREATE INDEX ix_users_id ON users (id);
+CREATE TABLE software_categories (
+	id INTEGER NOT NULL, 
+	name VARCHAR(50) NOT NULL, 
+	description VARCHAR(200), 
+	sort_order INTEGER, 
+	created_at DATETIME, 
+	updated_at DATETIME, 
+	PRIMARY KEY (id), 
+	UNIQUE (name)
+);
+CREATE INDEX ix_software_categories_id ON software_categories (id);
+CREATE TABLE configs (
+	id INTEGER NOT NULL, 
+	"key" VARCHAR(100) NOT NULL, 
+	value VARCHAR NOT NULL, 
+	description VARCHAR(255), 
+	created_at DATETIME DEFAULT CURRENT_TIMESTAMP, 
+	updated_at DATETIME, 
+	PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX ix_configs_key ON configs ("key");
+CREATE INDEX ix_configs_id ON configs (id);
+CREATE TABLE upload_sessions (
+	id VARCHAR(36) NOT NULL, 
+	software_id INTEGER NOT NULL, 
+	file_name VARCHAR(255) NOT NULL, 
+	file_size BIGINT NOT NULL, 
+	file_hash VARCHAR(64), 
+	chunk_size INTEGER NOT NULL, 
+	total_chunks INTEGER NOT NULL, 
+	uploaded_chunks INTEGER, 
+	status VARCHAR(20), 
+	uploader_id INTEGER NOT NULL, 
+	version VARCHAR(50) NOT NULL, 
+	release_notes TEXT, 
+	temp_dir VARCHAR(255) NOT NULL, 
+	created_at DATETIME DEFAULT CURRENT_TIMESTAMP, 
+	updated_at DATETIME, 
+	PRIMARY KEY (id)
+);
+CREATE TABLE software (
+	id INTEGER NOT NULL, 
+	name VARCHAR(100) NOT NULL, 
+	description TEXT, 
+	category VARCHAR(50), 
+	icon_url VARCHAR(255), 
+	logo VARCHAR(255), 
+	official_url VARCHAR(255), 
+	created_by INTEGER, 
+	created_at DATETIME DEFAULT CURRENT_TIMESTAMP, 
+	updated_at DATETIME, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(created_by) REFERENCES users (id)
+);
+CREATE INDEX ix_software_id ON software (id);
+CREATE INDEX ix_software_category ON software (category);
+CREATE UNIQUE INDEX ix_software_name ON software (name);
+CREATE TABLE audit_logs (
+	id INTEGER NOT NULL, 
+	user_id INTEGER NOT NULL, 
+	action VARCHAR(50) NOT NULL, 
+	resource_type VARCHAR(50), 
+	resource_id INTEGER, 
+	details JSON, 
+	ip_address VARCHAR(45), 
+	created_at DATETIME DEFAULT CURRENT_TIMESTAMP, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(user_id) REFERENCES users (id)
+);
+CREATE INDEX ix_audit_logs_created_at ON audit_logs (created_at);
+CREATE INDEX ix_audit_logs_id ON audit_logs (id);
+CREATE INDEX ix_audit_logs_action ON audit_logs (action);
+CREATE TABLE software_versions (
+	id INTEGER NOT NULL, 
+	software_id INTEGER NOT NULL, 
+	version VARCHAR(50) NOT NULL, 
+	file_path VARCHAR(255) NOT NULL, 
+	file_name VARCHAR(255) NOT NULL, 
+	file_size BIGINT, 
+	file_hash VARCHAR(64), 
+	upload_time DATETIME DEFAULT CURRENT_TIMESTAMP, 
+	uploader_id INTEGER, 
+	download_count INTEGER, 
+	release_notes TEXT, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(software_id) REFERENCES software (id), 
+	FOREIGN KEY(uploader_id) REFERENCES users (id)
+);
+CREATE INDEX ix_software_versions_id ON software_versions (id);
+CREATE TABLE software_requests (
+	id INTEGER NOT NULL, 
+	software_name VARCHAR(100) NOT NULL, 
+	version VARCHAR(50) NOT NULL, 
+	download_url VARCHAR(500) NOT NULL, 
+	description TEXT, 
+	category VARCHAR(50), 
+	logo VARCHAR(255), 
+	official_url VARCHAR(255), 
+	applicant_id INTEGER NOT NULL, 
+	status VARCHAR(10) NOT NULL, 
+	reviewer_id INTEGER, 
+	review_comment TEXT, 
+	reviewed_at DATETIME, 
+	software_id INTEGER, 
+	created_at DATETIME DEFAULT CURRENT_TIMESTAMP, 
+	updated_at DATETIME, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(applicant_id) REFERENCES users (id), 
+	FOREIGN KEY(reviewer_id) REFERENCES users (id), 
+	FOREIGN KEY(software_id) REFERENCES software (id)
+);
+CREATE INDEX ix_software_requests_software_name ON software_requests (software_name);
+CREATE INDEX ix_software_requests_id ON software_requests (id);
+CREATE TABLE vulnerabilities (
+	id INTEGER NOT NULL, 
+	software_id INTEGER NOT NULL, 
+	cve_id VARCHAR(50), 
+	severity VARCHAR(20), 
+	title VARCHAR(255), 
+	description TEXT, 
+	affected_versions VARCHAR(255), 
+	fixed_version VARCHAR(50), 
+	reference_url VARCHAR(500), 
+	created_at DATETIME DEFAULT CURRENT_TIMESTAMP, 
+	updated_at DATETIME, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(software_id) REFERENCES software (id)
+);
+CREATE INDEX ix_vulnerabilities_id ON vulnerabilities (id);
+CREATE TABLE download_logs (
+	id INTEGER NOT NULL, 
+	user_id INTEGER NOT NULL, 
+	software_version_id INTEGER NOT NULL, 
+	download_time DATETIME DEFAULT CURRENT_TIMESTAMP, 
+	ip_address VARCHAR(45), 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(user_id) REFERENCES users (id), 
+	FOREIGN KEY(software_version_id) REFERENCES software_versions (id)
+);
+CREATE INDEX ix_download_logs_id ON download_logs (id);
+"""
+
+BASELINE_DATA = [
+    "INSERT INTO users (id, username, hashed_password, role, is_active) VALUES (1, 'alice', 'x', 'USER', 1)",
+    "INSERT INTO software_categories (id, name, sort_order) VALUES (1, 'Tools', 0)",
+    "INSERT INTO software (id, name, description, category) VALUES (1, 'editor', 'Text editor', 'Tools')",
+    # 只出现在软件上的分类名，迁移时补进分类表
+    "INSERT INTO software (id, name, description, category) VALUES (2, 'browser', 'Web browser', 'Internet')",
+    "INSERT INTO software_versions (id, software_id, version, file_path, file_name, file_size, file_hash, download_count) "
+    "VALUES (1, 1, '1.2', '/nonexistent/a', 'a.zip', 100, 'aa', 3)",
+    "INSERT INTO software_versions (id, software_id, version, file_path, file_name, file_size, file_hash, download_count) "
+    "VALUES (2, 1, '1.10', '/nonexistent/b', 'b.zip', 100, 'bb', 4)",
+    "INSERT INTO software_versions (id, software_id, version, file_path, file_name, file_size, file_hash, download_count) "
+    "VALUES (3, 1, '1.9', '/nonexistent/c', 'c.zip', 100, 'cc', 5)",
+    "INSERT INTO vulnerabilities (id, software_id, cve_id, severity, title, affected_versions, fixed_version) "
+    "VALUES (1, 1, 'CVE-2020-0001', 'high', 'Old bug', '1.0-1.9', '1.10')",
+    "INSERT INTO download_logs (user_id, software_version_id) VALUES (1, 1)",
+]
+
+
+def create_baseline():
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        conn.executescript(BASELINE_SCHEMA)
+        for statement in BASELINE_DATA:
+            conn.execute(statement)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def query(sql: str):
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def main():
+    from fastapi.testclient import TestClient
+    import main as app_main
+
+    create_baseline()
+    for attempt in (1, 2):
+        with TestClient(app_main.app) as client:
+            print(f"Startup {attempt}: migrations completed")
+            if attempt == 1:
+                continue
+            r = client.post("/api/auth/login", data={"username": "admin", "password": "upgrade-check-password"})
+            r.raise_for_status()
+            headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+            for path in ("/api/software", "/api/software/1", "/api/vulnerabilities/exposure", "/api/categories"):
+                r = client.get(path, headers=headers)
+                assert r.status_code == 200, (path, r.status_code, r.text[:300])
+            print("API after upgrade: list, detail, exposure and categories return 200")
+
+    summary = query("SELECT latest_version, version_count, total_downloads FROM software WHERE id = 1")
+    assert summary == [("1.10", 3, 12)], summary
+    keys = query("SELECT COUNT(*) FROM software_versions WHERE version_key = ''")
+    assert keys == [(0,)], keys
+    categories = query(
+        "SELECT s.name, c.name, c.software_count FROM software s "
+        "JOIN software_categories c ON c.id = s.category_id ORDER BY s.id"
+    )
+    assert categories == [("editor", "Tools", 1), ("browser", "Internet", 1)], categories
+    ranges = query("SELECT COUNT(*) FROM vulnerability_ranges WHERE vulnerability_id = 1")
+    assert ranges[0][0] >= 1, ranges
+    print(f"Backfill: latest_version/version_count/total_downloads={summary[0]}, categories={categories}")
+    print("OK: baseline database upgraded and served")
+
+
+if __name__ == "__main__":
+    main()
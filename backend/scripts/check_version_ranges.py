@@ -0,0 +1,168 @@
+"""
+版本排序与版本范围解析检查
+1. 按用例表检查 version_sort_key 的顺序（预发布、字母后缀、连字符构建号等）；
+2. 按用例表检查 parse_version_ranges 的匹配结果，覆盖各种写法（比较式顺序不限、逗号/空格分隔、||、区间、通配符等）；
+3. 启动迁移：临时 SQLite 数据库中放入按旧规则计算的数据——"<=1.5, >1.0" 被拆成两个"或"的半开区间（所有版本都受影响），
+   1.1.1a 的排序键在 1.1.1 之前——启动应用后区间与排序键按当前规则重写，版本暴露面、/check 接口和最新版本随之更正。
+
+用法: python scripts/check_version_ranges.py
+"""
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# 必须在导入 app 之前设置
+_tmp = tempfile.mkdtemp(prefix="version_ranges_check_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/check.db"
+os.environ["STORAGE_PATH"] = os.path.join(_tmp, "storage")
+os.environ["FIRST_ADMIN_PASSWORD"] = "version-ranges-check"
+
+# 从小到大排列的版本
+SORTED_VERSIONS = [
+    "1.0.dev1", "1.0a1", "1.0b1", "1.0b2", "1.0rc1", "1.0", "1.0a", "1.0b", "1.0-1", "1.0-2", "1.0.post1",
+    "1.0.0.1", "1.0.1", "1.1.1", "1.1.1a", "1.1.1w", "1.1.2", "1.2.3-alpha", "1.2.3-alpha.1", "1.2.3-beta",
+    "1.2.3-rc.1", "1.2.3", "1.9", "1.10", "17-ea", "17", "2024.01.15", "2024.2.1",
+]
+# 排序键相同的写法
+EQUAL_VERSIONS = [("1.0", "1.0.0"), ("v1.2", "1.2"), ("1.2.3+build5", "1.2.3"), ("1.2RC1", "1.2rc1")]
+
+# (affected_versions, fixed_version, {版本: 是否受影响})
+RANGE_CASES = [
+    ("<=1.5, >1.0", None, {"0.5": False, "1.0": False, "1.2": True, "1.5": True, "1.6": False}),
+    (">1.0 <=1.5", None, {"0.5": False, "1.0": False, "1.2": True, "1.5": True, "1.6": False}),
+    (">1.0, <=1.5", None, {"0.5": False, "1.2": True, "1.6": False}),
+    ("<=1.5 >1.0", None, {"0.5": False, "1.2": True, "1.6": False}),
+    ("<2.0，>=1.0", None, {"0.9": False, "1.0": True, "2.0": False}),
+    (">=1.0 <1.2 || >=2.0 <2.2", None, {"0.9": False, "1.1": True, "1.5": False, "2.1": True, "2.2": False}),
+    ("<1.2 || >=2.0", None, {"1.1": True, "1.5": False, "2.5": True}),
+    ("1.0-1.5", None, {"0.9": False, "1.0": True, "1.3": True, "1.5": True, "1.6": False}),
+    ("1.0 ~ 1.5", None, {"1.3": True, "1.6": False}),
+    ("1.2.x", None, {"1.1.9": False, "1.2": True, "1.2.9": True, "1.3": False}),
+    ("[1.0,2.0)", None, {"0.9": False, "1.0": True, "2.0": False}),
+    ("1.0, 1.2", None, {"1.0": True, "1.1": False, "1.2": True}),
+    ("", "1.10", {"1.9": True, "1.10": False}),
+    ("<2.0", "1.5", {"1.4": True, "1.6": False}),
+    ("*", None, {"0.1": True, "99": True}),
+    (None, None, {"0.1": True}),
+]
+
+
+def check_sort_keys():
+    from app.core.versioning import version_sort_key
+
+    failures = [f"{a} !< {b}" for a, b in zip(SORTED_VERSIONS, SORTED_VERSIONS[1:])
+                if not version_sort_key(a) < version_sort_key(b)]
+    failures += [f"{a} != {b}" for a, b in EQUAL_VERSIONS if version_sort_key(a) != version_sort_key(b)]
+    if failures:
+        raise SystemExit("FAIL:\n  " + "\n  ".join(failures))
+    print(f"1. {len(SORTED_VERSIONS)} versions sort in order, {len(EQUAL_VERSIONS)} equivalent spellings share a key")
+
+
+def check_cases():
+    from app.core.versioning import RangeIndex, parse_version_ranges
+
+    failures = []
+    for affected, fixed, expected in RANGE_CASES:
+        index = RangeIndex((r, 0) for r in parse_version_ranges(affected, fixed))
+        for version, vulnerable in expected.items():
+            if bool(index.match(version)) != vulnerable:
+                failures.append(f"{affected!r} (fixed {fixed!r}) vs {version}: expected {vulnerable}")
+    if failures:
+        raise SystemExit("FAIL:\n  " + "\n  ".join(failures))
+    print(f"2. {sum(len(c[2]) for c in RANGE_CASES)} range cases over {len(RANGE_CASES)} expressions match")
+
+
+def check_recompile():
+    from fastapi.testclient import TestClient
+    import main as app_main
+    from app.core.database import SessionLocal
+    from app.core.versioning import version_sort_key
+    from app.models.software import Software, SoftwareVersion
+    from app.models.vulnerability import VersionExposure, Vulnerability, VulnerabilityRange
+    from app.services.exposure import rebuild_exposure
+
+    with TestClient(app_main.app):
+        pass
+
+    db = SessionLocal()
+    try:
+        software = Software(name="range-check", description="version range check")
+        db.add(software)
+        db.flush()
+        for version in ("0.5", "1.2"):
+            db.add(SoftwareVersion(software_id=software.id, version=version, file_path=f"/nonexistent/{version}",
+                                   file_name=f"{version}.bin", file_size=1, file_hash="0" * 64))
+        vulnerability = Vulnerability(software_id=software.id, cve_id="CVE-2000-0001", severity="high",
+                                      title="range check", affected_versions="<=1.5, >1.0")
+        db.add(vulnerability)
+        # 旧规则下 1.1.1a 的排序键与 1.1.1-alpha 相同（排在 1.1.1 之前），最新版本算成 1.1.1
+        openssl = Software(name="openssl-check", description="letter suffix check")
+        db.add(openssl)
+        db.flush()
+        for version in ("1.1.1", "1.1.1a"):
+            db.add(SoftwareVersion(software_id=openssl.id, version=version, file_path=f"/nonexistent/{version}",
+                                   file_name=f"{version}.bin", file_size=1, file_hash="0" * 64))
+        db.add(Vulnerability(software_id=openssl.id, cve_id="CVE-2000-0002", severity="high",
+                             title="suffix check", affected_versions="<1.1.1a"))
+        db.flush()
+        db.query(SoftwareVersion).filter(SoftwareVersion.version == "1.1.1a").update(
+            {SoftwareVersion.version_key: version_sort_key("1.1.1-alpha")})
+        db.query(Software).filter(Software.id == openssl.id).update({Software.latest_version: "1.1.1"})
+        suffix_vulnerability = db.query(Vulnerability).filter(Vulnerability.cve_id == "CVE-2000-0002").one()
+        db.add(VulnerabilityRange(vulnerability_id=suffix_vulnerability.id, software_id=openssl.id,
+                                  upper_key=version_sort_key("1.1.1-alpha"), upper_inclusive=False))
+        # 旧规则的解析结果：(-inf, 1.5] 或 (1.0, +inf)
+        db.query(VulnerabilityRange).filter(VulnerabilityRange.vulnerability_id == vulnerability.id).delete()
+        db.add_all([
+            VulnerabilityRange(vulnerability_id=vulnerability.id, software_id=software.id,
+                               upper_key=version_sort_key("1.5"), upper_inclusive=True),
+            VulnerabilityRange(vulnerability_id=vulnerability.id, software_id=software.id,
+                               lower_key=version_sort_key("1.0"), lower_inclusive=False),
+        ])
+        db.commit()
+        rebuild_exposure(db.connection())
+        db.commit()
+        software_id, openssl_id = software.id, openssl.id
+        stale = db.query(VersionExposure).filter(VersionExposure.software_id == software_id).count()
+        stale_suffix = db.query(VersionExposure).filter(VersionExposure.software_id == openssl_id).count()
+    finally:
+        db.close()
+    assert stale == 2, f"stale exposure rows: {stale}"
+    assert stale_suffix == 0, f"stale suffix exposure rows: {stale_suffix}"
+
+    with TestClient(app_main.app) as client:
+        r = client.post("/api/auth/login", data={"username": "admin", "password": "version-ranges-check"})
+        r.raise_for_status()
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        old = client.get(f"/api/vulnerabilities/check/{software_id}/0.5", headers=headers)
+        new = client.get(f"/api/vulnerabilities/check/{software_id}/1.2", headers=headers)
+        assert old.status_code == 200 and old.json() == [], old.text
+        assert new.status_code == 200 and len(new.json()) == 1, new.text
+        patched = client.get(f"/api/vulnerabilities/check/{openssl_id}/1.1.1", headers=headers)
+        assert patched.status_code == 200 and len(patched.json()) == 1, patched.text
+
+    db = SessionLocal()
+    try:
+        ranges = db.query(VulnerabilityRange).filter(VulnerabilityRange.software_id == software_id).count()
+        exposed = [v for (v,) in db.query(SoftwareVersion.version).join(
+            VersionExposure, VersionExposure.software_version_id == SoftwareVersion.id).order_by(SoftwareVersion.id)]
+        latest = db.query(Software.latest_version).filter(Software.id == openssl_id).scalar()
+    finally:
+        db.close()
+    assert ranges == 1, f"ranges after startup: {ranges}"
+    assert exposed == ["1.2", "1.1.1"], exposed
+    assert latest == "1.1.1a", latest
+    print(f"3. stale ranges and sort keys rewritten on startup: exposed versions {exposed}, "
+          f"/check 0.5 -> [], latest openssl-check version {latest}")
+
+
+def main():
+    check_sort_keys()
+    check_cases()
+    check_recompile()
+    print("OK: version ranges parse and recompile as expected")
+
+
+if __name__ == "__main__":
+    main()
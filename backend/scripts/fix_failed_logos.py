@@ -12,38 +12,37 @@ from app.core.config import settings
 from app.models.software import Software
 
 
-async def download_logo(url: str, software_id: int, software_name: str) -> str:
+async def download_logo(client: httpx.AsyncClient, url: str, software_id: int, software_name: str) -> str:
     """下载 Logo 图片到本地"""
     try:
-        async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
-            response = await client.get(url)
-            response.raise_for_status()
-
-            # 确定文件扩展名
-            content_type = response.headers.get('content-type', '')
-            if 'png' in content_type or url.endswith('.png'):
-                ext = '.png'
-            elif 'svg' in content_type or url.endswith('.svg'):
-                ext = '.svg'
-            elif 'ico' in content_type or url.endswith('.ico'):
-                ext = '.ico'
-            else:
-                ext = '.jpg'
-
-            # 创建 logo 目录
-            logo_dir = os.path.join(settings.STORAGE_PATH, "logos")
-            os.makedirs(logo_dir, exist_ok=True)
-
-            # 生成文件名
-            filename = f"software_{software_id}{ext}"
-            file_path = os.path.join(logo_dir, filename)
-
-            # 保存文件
-            with open(file_path, 'wb') as f:
-                f.write(response.content)
-
-            # 返回访问路径
-            return f"/api/software/logos/{filename}"
+        response = await client.get(url)
+        response.raise_for_status()
+
+        # 确定文件扩展名
+        content_type = response.headers.get('content-type', '')
+        if 'png' in content_type or url.endswith('.png'):
+            ext = '.png'
+        elif 'svg' in content_type or url.endswith('.svg'):
+            ext = '.svg'
+        elif 'ico' in content_type or url.endswith('.ico'):
+            ext = '.ico'
+        else:
+            ext = '.jpg'
+
+        # 创建 logo 目录
+        logo_dir = os.path.join(settings.STORAGE_PATH, "logos")
+        os.makedirs(logo_dir, exist_ok=True)
+
+        # 生成文件名
+        filename = f"software_{software_id}{ext}"
+        file_path = os.path.join(logo_dir, filename)
+
+        # 保存文件
+        with open(file_path, 'wb') as f:
+            f.write(response.content)
+
+        # 返回访问路径
+        return f"/api/software/logos/{filename}"
     except Exception as e:
         print(f"Failed to download logo for {software_name}: {e}")
         return None
@@ -52,6 +51,9 @@ async def download_logo(url: str, software_id: int, software_name: str) -> str:
 async def main():
     """主函数"""
     db = SessionLocal()
+    # 所有 Logo 共用一个客户端，同一站点的连接可复用。运维脚本由管理员手动运行，
+    # 不使用服务端的出站地址限制，内网镜像上的 Logo 也可以下载
+    client = httpx.AsyncClient(timeout=30.0, follow_redirects=True)
 
     # 失败的软件 Logo URL 修复
     logo_fixes = {
@@ -67,7 +69,7 @@ async def main():
             software = db.query(Software).filter(Software.name == software_name).first()
             if software:
                 print(f"Updating logo for: {software_name}...")
-                new_logo_path = await download_logo(logo_url, software.id, software_name)
+                new_logo_path = await download_logo(client, logo_url, software.id, software_name)
 
                 if new_logo_path:
                     software.logo = new_logo_path
@@ -84,6 +86,7 @@ async def main():
         db.rollback()
     finally:
         db.close()
+        await client.aclose()
 
 
 if __name__ == "__main__":
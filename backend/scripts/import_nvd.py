@@ -0,0 +1,39 @@
+"""
+NVD 漏洞数据导入脚本
+流式导入 NVD CVE JSON 2.0 数据文件（支持 .gz），按 CPE 产品名匹配目录中的软件；
+重复导入时内容未变化的 CVE 直接跳过
+
+用法: python scripts/import_nvd.py <数据文件>... [--batch-size N]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+import time
+
+from app.core.database import SessionLocal
+from app.services.nvd_import import DEFAULT_BATCH_SIZE, import_nvd_feed, load_software_names, open_feed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import NVD CVE JSON 2.0 feeds")
+    parser.add_argument("feeds", nargs="+", help="feed files (.json or .json.gz)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="CVEs per transaction")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        software_names = load_software_names(db)
+        print(f"Catalog software: {len(software_names)}")
+        for path in args.feeds:
+            started = time.perf_counter()
+            with open(path, "rb") as f:
+                stats = import_nvd_feed(db, open_feed(f), batch_size=args.batch_size, software_names=software_names)
+            print(f"{path}: {stats.as_dict()} in {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        print(f"\nError: {e}")
+        db.rollback()
+        sys.exit(1)
+    finally:
+        db.close()
@@ -0,0 +1,119 @@
+"""
+缓存失效总线传播延迟测量
+启动一个监听子进程，由当前进程逐条提交失效事件，统计子进程收到事件的延迟。
+失效总线基于 PostgreSQL LISTEN/NOTIFY：DATABASE_URL 不是 PostgreSQL、数据库连不上或监听进程
+未能建立连接时直接报错退出（退出码 2），不会输出延迟数据
+
+用法: python scripts/measure_invalidation_lag.py [事件数] [间隔毫秒]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import asyncio
+import multiprocessing
+import time
+
+PROBE_KEY = "__invalidation_lag_probe__"
+LISTEN_TIMEOUT = 15
+
+
+def fail(message: str):
+    print(f"ERROR: {message}", file=sys.stderr)
+    sys.exit(2)
+
+
+def listener(conn, expected: int):
+    """子进程：启动监听任务，收齐事件（或超时）后回传统计"""
+    from app.core.invalidation import invalidation_bus
+
+    async def main():
+        received = asyncio.Event()
+        count = 0
+
+        def on_config(keys):
+            nonlocal count
+            if keys and PROBE_KEY in keys:
+                count += 1
+                if count >= expected:
+                    received.set()
+
+        invalidation_bus.subscribe("config", on_config)
+        invalidation_bus.start()
+        deadline = time.monotonic() + LISTEN_TIMEOUT
+        while not invalidation_bus.stats()["listening"]:
+            if time.monotonic() > deadline:
+                conn.send(f"listener did not connect within {LISTEN_TIMEOUT}s (see log output above)")
+                await invalidation_bus.stop()
+                return
+            await asyncio.sleep(0.05)
+        conn.send("ready")
+        try:
+            await asyncio.wait_for(received.wait(), timeout=30 + expected)
+        except asyncio.TimeoutError:
+            pass
+        conn.send(invalidation_bus.stats())
+        await invalidation_bus.stop()
+
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    interval = (int(sys.argv[2]) if len(sys.argv) > 2 else 10) / 1000
+
+    from sqlalchemy import text
+    from sqlalchemy.engine import make_url
+
+    from app.core.config import settings
+    from app.core.database import SessionLocal, engine
+    from app.core.invalidation import invalidation_bus
+
+    url = make_url(settings.DATABASE_URL)
+    if url.get_backend_name() != "postgresql":
+        fail(f"the invalidation bus uses PostgreSQL LISTEN/NOTIFY; DATABASE_URL is {url.get_backend_name()} "
+             f"({url.render_as_string(hide_password=True)}). Nothing was measured.")
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except Exception as e:
+        fail(f"cannot connect to {url.render_as_string(hide_password=True)}: {e}")
+
+    # spawn：子进程重新导入应用，拥有独立的总线实例（origin 不同）
+    ctx = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = ctx.Pipe()
+    proc = ctx.Process(target=listener, args=(child_conn, count))
+    proc.start()
+    # 关闭父进程中的子端，子进程异常退出时 recv 抛出 EOFError 而不是一直等待
+    child_conn.close()
+    try:
+        ready = parent_conn.recv()
+    except EOFError:
+        proc.join()
+        fail(f"listener process exited with code {proc.exitcode} before subscribing")
+    if ready != "ready":
+        proc.join()
+        fail(ready)
+
+    print(f"Publishing {count} events every {interval * 1000:.0f} ms...")
+    db = SessionLocal()
+    try:
+        for _ in range(count):
+            invalidation_bus.publish(db, "config", [PROBE_KEY])
+            db.commit()
+            time.sleep(interval)
+    finally:
+        db.close()
+
+    try:
+        stats = parent_conn.recv()
+    except EOFError:
+        proc.join()
+        fail(f"listener process exited with code {proc.exitcode} before reporting")
+    proc.join()
+    lag = stats["lag_ms"]
+    print(f"Received {stats['received']}/{count} events")
+    print(f"Propagation lag: p50 {lag['p50']} ms, p99 {lag['p99']} ms, max {lag['max']} ms")
+    if stats["received"] != count:
+        print(f"FAIL: {count - stats['received']} events were not received", file=sys.stderr)
+        sys.exit(1)
@@ -6,13 +6,16 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 from app.core.database import SessionLocal, engine, Base
 from app.models.software import Software, SoftwareVersion
 from app.models.download import DownloadLog
 from app.models.request import SoftwareRequest
-from app.models.vulnerability import Vulnerability
+from app.models.vulnerability import Vulnerability, VulnerabilityRange, VersionExposure
 from app.models.audit import AuditLog
+from app.core.invalidation import invalidation_bus
+from app.services.catalog import refresh_software_summary, mark_catalog_changed, get_or_create_category, RECOUNT_CATEGORIES_SQL
 
 
 def clear_data(db: Session):
@@ -22,11 +25,19 @@ def clear_data(db: Session):
     # 按依赖顺序删除 - 必须先删除引用了 software 的表
     db.query(DownloadLog).delete()
     db.query(SoftwareRequest).delete()
+    db.query(VersionExposure).delete()
+    db.query(VulnerabilityRange).delete()
     db.query(Vulnerability).delete()  # 必须在 Software 之前删除
     db.query(SoftwareVersion).delete()
     db.query(Software).delete()
     db.query(AuditLog).delete()
+    # 批量删除不经过 ORM 事件，分类计数需重新统计
+    db.execute(text(RECOUNT_CATEGORIES_SQL))
 
+    # 通知运行中的服务整体重建搜索索引、刷新目录 ETag
+    invalidation_bus.publish(db, "software")
+    invalidation_bus.publish(db, "vulnerability")
+    mark_catalog_changed(db)
     db.commit()
     print("Data cleared successfully")
 
@@ -233,7 +244,7 @@ def create_demo_software(db: Session):
         software = Software(
             name=sw_data["name"],
             description=sw_data["description"],
-            category=sw_data["category"],
+            category_id=get_or_create_category(db, sw_data["category"]),
             logo=sw_data.get("logo"),
             official_url=sw_data.get("official_url"),
             created_by=1  # admin 用户
@@ -283,6 +294,7 @@ def create_demo_software(db: Session):
             if i == 0:
                 software_version.download_count = __import__('random').randint(50, 500)
 
+        refresh_software_summary(db, software.id)
         db.commit()
         print(f"+ Created software: {sw_data['name']}")
 